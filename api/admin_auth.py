@@ -0,0 +1,74 @@
+import hashlib
+import os
+import threading
+import time
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+
+import supabase_client
+from logs import get_logger
+
+log = get_logger('admin_auth')
+
+# Verified admin sessions are trusted for this long before asking Supabase again
+ADMIN_AUTH_CACHE_SECONDS = float(os.getenv('ADMIN_AUTH_CACHE_SECONDS', '60'))
+# Comma-separated allowlist of admin emails; empty denies everyone
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv('ADMIN_EMAILS', '').split(',') if e.strip()}
+_CACHE_MAX_ENTRIES = 256
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _bearer_token(request):
+    auth = request.headers.get('authorization', '')
+    if auth.lower().startswith('bearer '):
+        return auth[7:].strip()
+    return None
+
+
+def verify_token(token):
+    """
+    Resolve a Supabase access token to the signed-in user's email, caching the
+    result so paging through leads doesn't cost an auth round trip per page.
+    Raises HTTPException 401/403.
+    """
+    if not ADMIN_EMAILS:
+        # Falling back to "any signed-in user" would hand lead PII to every Supabase account
+        log.error("ADMIN_EMAILS is not set, refusing all admin requests")
+        raise HTTPException(status_code=403, detail="Admin access is not configured")
+
+    key = hashlib.sha256(token.encode()).hexdigest()
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    try:
+        response = supabase_client.get_client().auth.get_user(token)
+        user = response.user if response else None
+    except Exception as e:
+        log.warning("Token check failed", error=str(e))
+        user = None
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+
+    email = (user.email or '').lower()
+    if email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=403, detail="Not an admin")
+
+    with _cache_lock:
+        if len(_cache) >= _CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = (now + ADMIN_AUTH_CACHE_SECONDS, email)
+    return email
+
+
+async def require_admin(request: Request):
+    """FastAPI dependency for admin-only endpoints: Authorization: Bearer <Supabase access token>."""
+    token = _bearer_token(request)
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing bearer token")
+    return await run_in_threadpool(verify_token, token)
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from logs import get_logger
+
+log = get_logger('analysis_cache')
+
+# Cache configuration
+CACHE_MAX_ENTRIES = int(os.getenv('ANALYSIS_CACHE_MAX_ENTRIES', '512'))
+CACHE_TTL_SECONDS = int(os.getenv('ANALYSIS_CACHE_TTL_SECONDS', '86400'))
+# Optional persistent tier: "sqlite", "supabase" or unset for memory only
+CACHE_BACKEND = os.getenv('ANALYSIS_CACHE_BACKEND', '').lower()
+CACHE_DB_PATH = os.getenv('ANALYSIS_CACHE_DB', '/tmp/analysis_cache.db')
+CACHE_TABLE = os.getenv('ANALYSIS_CACHE_TABLE', 'analysis_cache')
+
+
+def make_cache_key(image_bytes, model_name, prompt_version):
+    """
+    Content-addressed key: SHA-256 of the image plus the model and prompt version,
+    so editing the prompt or switching models never serves stale results.
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    return f"{digest}:{model_name}:{prompt_version}"
+
+
+class SQLiteTier:
+    """Persistent tier backed by a local SQLite file (survives warm restarts)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS analysis_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                'SELECT result, created_at FROM analysis_cache WHERE cache_key = ?', (key,)
+            ).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key, value, created_at):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO analysis_cache (cache_key, result, created_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), created_at)
+            )
+
+
+class SupabaseTier:
+    """
+    Persistent tier backed by a Supabase table:
+    analysis_cache(cache_key text primary key, result jsonb, created_at double precision)
+    """
+
+    def __init__(self, client_factory, table=CACHE_TABLE):
+        self.client_factory = client_factory
+        self.table = table
+
+    def get(self, key):
+        resp = self.client_factory().table(self.table).select('result,created_at').eq('cache_key', key).execute()
+        if not resp.data:
+            return None
+        row = resp.data[0]
+        return row['result'], row['created_at']
+
+    def set(self, key, value, created_at):
+        self.client_factory().table(self.table).upsert({
+            'cache_key': key,
+            'result': value,
+            'created_at': created_at
+        }).execute()
+
+
+class AnalysisCache:
+    """
+    Two-tier cache for analysis results: an in-process LRU with size and TTL
+    eviction in front of an optional persistent tier. Concurrent lookups for
+    the same key are coalesced so a burst of identical uploads only triggers
+    one model call.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, persistent=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persistent = persistent
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self.counters = {
+            'hits': 0,
+            'persistent_hits': 0,
+            'misses': 0,
+            'coalesced': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'persistent_errors': 0,
+        }
+
+    def _expired(self, created_at):
+        return self.ttl_seconds > 0 and time.time() - created_at > self.ttl_seconds
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _get_memory(self, key, count=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, created_at = entry
+            if self._expired(created_at):
+                del self._entries[key]
+                self.counters['expirations'] += 1
+                return None
+            self._entries.move_to_end(key)
+            if count:
+                self.counters['hits'] += 1
+            return value
+
+    def _set_memory(self, key, value, created_at):
+        with self._lock:
+            self._entries[key] = (value, created_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss."""
+        value = self._get_memory(key)
+        if value is not None:
+            return json.loads(value)
+
+        if self.persistent is not None:
+            try:
+                stored = self.persistent.get(key)
+            except Exception as e:
+                log.warning("Persistent read failed", error=str(e))
+                self._count('persistent_errors')
+                stored = None
+            if stored is not None:
+                result, created_at = stored
+                if not self._expired(created_at):
+                    self._set_memory(key, json.dumps(result), created_at)
+                    self._count('persistent_hits')
+                    return result
+
+        self._count('misses')
+        return None
+
+    def set(self, key, result):
+        created_at = time.time()
+        # Store serialized so callers can never mutate a cached entry
+        self._set_memory(key, json.dumps(result), created_at)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(key, result, created_at)
+            except Exception as e:
+                log.warning("Persistent write failed", error=str(e))
+                self._count('persistent_errors')
+
+    def get_or_compute(self, key, compute, cacheable=lambda result: True):
+        """
+        Return the cached result for key, or call compute() once and cache it.
+        Callers racing on the same key wait for the first computation instead of
+        issuing their own.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+
+        with self._lock:
+            event = self._inflight.get(key)
+            leader = event is None
+            if leader:
+                event = threading.Event()
+                self._inflight[key] = event
+
+        if not leader:
+            event.wait()
+            cached = self._get_memory(key, count=False)
+            if cached is not None:
+                self._count('coalesced')
+                return json.loads(cached)
+            # Leader failed or produced an uncacheable result; compute our own
+            return compute()
+
+        try:
+            result = compute()
+            if cacheable(result):
+                self.set(key, result)
+            return result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['size'] = len(self._entries)
+        lookups = stats['hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['hits'] + stats['persistent_hits']) / lookups, 4) if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['ttl_seconds'] = self.ttl_seconds
+        stats['persistent_tier'] = type(self.persistent).__name__ if self.persistent is not None else None
+        return stats
+
+
+def _default_persistent_tier():
+    if CACHE_BACKEND == 'sqlite':
+        try:
+            return SQLiteTier(CACHE_DB_PATH)
+        except Exception as e:
+            log.warning("SQLite tier unavailable", error=str(e))
+    return None
+
+
+analysis_cache = AnalysisCache(persistent=_default_persistent_tier())
+
+
+def enable_supabase_tier(client_factory):
+    """Attach the Supabase persistent tier when ANALYSIS_CACHE_BACKEND=supabase."""
+    if CACHE_BACKEND == 'supabase' and analysis_cache.persistent is None:
+        analysis_cache.persistent = SupabaseTier(client_factory)
@@ -0,0 +1,78 @@
+import asyncio
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Max Gemini calls running at once, and how many more may wait for a slot
+ANALYSIS_MAX_CONCURRENCY = int(os.getenv('ANALYSIS_MAX_CONCURRENCY', '4'))
+ANALYSIS_MAX_QUEUE = int(os.getenv('ANALYSIS_MAX_QUEUE', '16'))
+
+
+class AnalysisQueueFull(Exception):
+    """Raised when the analysis pool and its wait queue are both full."""
+    pass
+
+
+class AnalysisExecutor:
+    """
+    Dedicated thread pool for blocking vision calls. Keeps the event loop free
+    while Gemini works, caps concurrent model calls, and sheds load once the
+    wait queue is full instead of letting requests pile up until they time out.
+    """
+
+    def __init__(self, max_workers=ANALYSIS_MAX_CONCURRENCY, max_queue=ANALYSIS_MAX_QUEUE):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='analysis')
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self.counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def _task(self, fn, args, kwargs):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _done(self, future):
+        with self._lock:
+            if future.cancelled():
+                # Never started: the caller went away while it was still queued
+                self._queued -= 1
+            elif future.exception() is not None:
+                self.counters['failed'] += 1
+            else:
+                self.counters['completed'] += 1
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result."""
+        with self._lock:
+            if self._running + self._queued >= self.max_workers + self.max_queue:
+                self.counters['rejected'] += 1
+                raise AnalysisQueueFull("Analysis queue is full, please retry shortly")
+            self._queued += 1
+            self.counters['submitted'] += 1
+
+        # Run in a copy of the caller's context so per-request state (the deadline) follows the call
+        context = contextvars.copy_context()
+        future = self._pool.submit(context.run, self._task, fn, args, kwargs)
+        future.add_done_callback(self._done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats['running'] = self._running
+            stats['queued'] = self._queued
+        stats['max_concurrency'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        return stats
+
+
+analysis_executor = AnalysisExecutor()
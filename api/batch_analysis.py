@@ -0,0 +1,116 @@
+import asyncio
+import os
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+import image_pipeline
+import metrics
+from analysis_executor import AnalysisQueueFull
+
+# Images of one batch analyzed at once (the shared analysis pool still caps the total)
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv('ANALYZE_BATCH_CONCURRENCY', '4'))
+ANALYZE_BATCH_MAX_FILES = int(os.getenv('ANALYZE_BATCH_MAX_FILES', '20'))
+# How long one image may wait for room in a full analysis pool before it is reported as failed
+ANALYZE_BATCH_QUEUE_WAIT_SECONDS = float(os.getenv('ANALYZE_BATCH_QUEUE_WAIT_SECONDS', '30'))
+
+
+async def _run_when_pool_has_room(executor, fn, *args, **kwargs):
+    """A batch shouldn't be shed like a burst of single requests; wait for a slot instead."""
+    deadline = time.monotonic() + ANALYZE_BATCH_QUEUE_WAIT_SECONDS
+    while True:
+        try:
+            return await executor.run(fn, *args, **kwargs)
+        except AnalysisQueueFull:
+            if time.monotonic() >= deadline:
+                raise
+            await asyncio.sleep(0.25)
+
+
+def _status(outcome):
+    """
+    "failed" (no result), "fallback" (the placeholder returned when the model
+    call failed or timed out, which carries "error") or "succeeded".
+    """
+    if "error" in outcome:
+        return "failed"
+    result = outcome.get("result")
+    if isinstance(result, dict) and "error" in result:
+        return "fallback"
+    return "succeeded"
+
+
+async def analyze_batch_events(items, analyze, executor, finalize=None, concurrency=ANALYZE_BATCH_CONCURRENCY):
+    """
+    Analyze many ingested uploads concurrently. items is a list of
+    (filename, IngestedUpload or exception); identical images (same content
+    hash) are analyzed once. Yields progress events as each image completes,
+    ending with a summary event.
+    """
+    started = time.perf_counter()
+    # sha256 -> indices of every item with that content
+    groups = {}
+    for index, (_, upload) in enumerate(items):
+        if not isinstance(upload, Exception):
+            groups.setdefault(upload.sha256, []).append(index)
+
+    total = len(items)
+    yield {"type": "start", "total": total, "unique": len(groups)}
+
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+    summary = {"succeeded": 0, "fallback": 0, "failed": 0, "duplicates": 0}
+
+    def event(index, **fields):
+        nonlocal done
+        done += 1
+        status = _status(fields)
+        summary[status] += 1
+        return {
+            "type": "result", "index": index, "filename": items[index][0], "done": done, "total": total,
+            "status": status, **fields,
+        }
+
+    # Files rejected at ingestion are reported first
+    for index, (_, upload) in enumerate(items):
+        if isinstance(upload, Exception):
+            yield event(index, error=str(upload))
+
+    async def run(sha256, upload):
+        async with semaphore:
+            item_started = time.perf_counter()
+            try:
+                with metrics.stage('normalize'):
+                    image = await run_in_threadpool(image_pipeline.normalize_image, upload.file, upload.mime_type)
+                result = await _run_when_pool_has_room(
+                    executor, analyze, image.model_bytes, mime_type=image.model_mime
+                )
+                if finalize:
+                    result = finalize(result)
+            except Exception as e:
+                # Failure of one image never aborts the rest of the batch
+                return sha256, {"error": str(e)}
+            return sha256, {"result": result, "ms": round((time.perf_counter() - item_started) * 1000, 2)}
+
+    tasks = [
+        asyncio.create_task(run(sha256, items[indices[0]][1]))
+        for sha256, indices in groups.items()
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            sha256, outcome = await next_done
+            first, *duplicates = groups[sha256]
+            yield event(first, sha256=sha256, **outcome)
+            for index in duplicates:
+                summary["duplicates"] += 1
+                yield event(index, sha256=sha256, duplicate_of=first, **outcome)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    yield {
+        "type": "summary",
+        "total": total,
+        **summary,
+        "ms": round((time.perf_counter() - started) * 1000, 2),
+    }
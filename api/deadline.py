@@ -0,0 +1,189 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+# Total time /api/analyze may spend, kept under Vercel's 60s maxDuration so
+# there is room left to stage the image and send the response
+ANALYZE_DEADLINE_SECONDS = float(os.getenv('ANALYZE_DEADLINE_SECONDS', '50'))
+# Don't start a model call with less budget than this; it would only time out
+GEMINI_MIN_CALL_SECONDS = float(os.getenv('GEMINI_MIN_CALL_SECONDS', '3'))
+# Held back from each call's timeout for parsing the answer and responding
+DEADLINE_MARGIN_SECONDS = float(os.getenv('DEADLINE_MARGIN_SECONDS', '1'))
+# Hedging: send a second identical request when the first is slower than the
+# observed p95 (or GEMINI_HEDGE_AFTER_SECONDS if set); first answer wins
+GEMINI_HEDGE = os.getenv('GEMINI_HEDGE', 'false').lower() == 'true'
+GEMINI_HEDGE_AFTER_SECONDS = float(os.getenv('GEMINI_HEDGE_AFTER_SECONDS', '0'))
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', '20'))
+
+_current = contextvars.ContextVar('deadline', default=None)
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+
+@contextmanager
+def deadline_scope(seconds=ANALYZE_DEADLINE_SECONDS):
+    """
+    Set the time budget for everything the current request does. Carried in a
+    context variable, so it follows the request into worker threads that are
+    started with the caller's context (see AnalysisExecutor.run). A nested
+    scope can shorten the budget but never extend it.
+    """
+    deadline = Deadline(seconds)
+    outer = _current.get()
+    if outer is not None and outer.expires_at < deadline.expires_at:
+        deadline = outer
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None outside a deadline scope."""
+    deadline = _current.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def exhausted():
+    """True when there isn't enough budget left for another model call."""
+    left = remaining()
+    return left is not None and left < GEMINI_MIN_CALL_SECONDS
+
+
+def call_timeout():
+    """
+    Timeout for the next model call: the remaining budget minus the margin.
+    None when no deadline is set; raises BudgetExhausted when too little is left.
+    """
+    left = remaining()
+    if left is None:
+        return None
+    if left < GEMINI_MIN_CALL_SECONDS:
+        _count('budget_exhausted')
+        raise BudgetExhausted(f"Analysis time budget exhausted ({left:.1f}s left)")
+    return left - DEADLINE_MARGIN_SECONDS
+
+
+class LatencyTracker:
+    """Recent successful model call durations, for picking the hedge delay."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, fraction, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+model_latency = LatencyTracker()
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='gemini-hedge')
+_lock = threading.Lock()
+_counters = {'calls': 0, 'timed_out': 0, 'budget_exhausted': 0, 'hedged': 0, 'hedge_won': 0}
+
+
+def _count(name):
+    with _lock:
+        _counters[name] += 1
+
+
+def _hedge_delay():
+    if not GEMINI_HEDGE:
+        return None
+    if GEMINI_HEDGE_AFTER_SECONDS > 0:
+        return GEMINI_HEDGE_AFTER_SECONDS
+    return model_latency.percentile(0.95, GEMINI_HEDGE_MIN_SAMPLES)
+
+
+def _timed_call(fn, args, kwargs, timeout):
+    started = time.monotonic()
+    if timeout is not None:
+        kwargs = {**kwargs, 'request_options': {'timeout': timeout}}
+    try:
+        result = fn(*args, **kwargs)
+    except Exception:
+        if timeout is not None and time.monotonic() - started >= timeout:
+            _count('timed_out')
+        raise
+    model_latency.record(time.monotonic() - started)
+    return result
+
+
+def call_model(fn, *args, allow_hedge=None, **kwargs):
+    """
+    Call fn(*args, **kwargs) (e.g. model.generate_content) with
+    request_options={'timeout': ...} taken from the remaining budget. With
+    hedging on, a second request is sent once the first has run longer than
+    the hedge delay, if allow_hedge() agrees (e.g. a rate-limit token is free).
+    """
+    _count('calls')
+    timeout = call_timeout()
+    hedge_after = _hedge_delay()
+    if hedge_after is None or (timeout is not None and timeout < hedge_after + GEMINI_MIN_CALL_SECONDS):
+        return _timed_call(fn, args, kwargs, timeout)
+
+    primary = _hedge_pool.submit(_timed_call, fn, args, kwargs, timeout)
+    if wait([primary], timeout=hedge_after).done:
+        return primary.result()
+
+    pending = {primary}
+    try:
+        hedge_timeout = call_timeout()
+        if allow_hedge is None or allow_hedge():
+            pending.add(_hedge_pool.submit(_timed_call, fn, args, kwargs, hedge_timeout))
+            _count('hedged')
+    except BudgetExhausted:
+        pass
+
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    _count('hedge_won')
+                return future.result()
+            error = future.exception()
+    if error is not None:
+        raise error
+    _count('budget_exhausted')
+    raise BudgetExhausted("Analysis time budget exhausted waiting for Gemini")
+
+
+def stats():
+    with _lock:
+        stats = dict(_counters)
+    stats['deadline_seconds'] = ANALYZE_DEADLINE_SECONDS
+    stats['hedging'] = GEMINI_HEDGE
+    stats['hedge_after_seconds'] = _hedge_delay()
+    p50, p95 = model_latency.percentile(0.5), model_latency.percentile(0.95)
+    stats['model_ms'] = {
+        'p50': round(p50 * 1000, 1) if p50 is not None else None,
+        'p95': round(p95 * 1000, 1) if p95 is not None else None,
+    }
+    return stats
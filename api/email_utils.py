@@ -1,33 +1,57 @@
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 
-def send_lead_email(lead_data):
+import metrics
+from logs import get_logger
+
+log = get_logger('email')
+
+# SMTP Configuration (defaults point at SMTP2GO; override to use a local stand-in)
+SMTP_SERVER = os.getenv('SMTP_SERVER', 'mail-eu.smtp2go.com')
+SMTP_PORT = int(os.getenv('SMTP_PORT', '2525'))
+SMTP_STARTTLS = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '15'))
+# Idle connections are probed with NOOP before reuse after this many seconds
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv('SMTP_IDLE_CHECK_SECONDS', '30'))
+
+# Digest mode: batch up to N leads into one notification (1 = one email per lead)
+EMAIL_DIGEST_SIZE = max(int(os.getenv('EMAIL_DIGEST_SIZE', '1')), 1)
+# Max seconds a lead waits for its digest to fill up before it is sent anyway
+EMAIL_DIGEST_MAX_WAIT = float(os.getenv('EMAIL_DIGEST_MAX_WAIT', '30'))
+# How long a caller waits for the dispatcher to report a delivery result
+EMAIL_SEND_TIMEOUT = float(os.getenv('EMAIL_SEND_TIMEOUT', '60'))
+
+
+def load_smtp():
     """
-    Send lead notification email via SMTP2GO
+    Import the SMTP/MIME stack on first use. smtplib pulls in ssl and the email
+    package, which most requests (analysis, admin) never need.
     """
-    # SMTP Configuration
-    smtp_server = "mail-eu.smtp2go.com"
-    smtp_port = 2525
-    smtp_username = os.getenv('SMTP_USERNAME', 'leadsnyc')
-    smtp_password = os.getenv('SMTP_PASSWORD', 'enQ3a3FuMHA1OTAw')
-    sender_email = os.getenv('SMTP_SENDER', 'leads@nycscouts.com')
-    recipient_email = os.getenv('LEAD_NOTIFICATION_EMAIL', 'asmarketingltd@gmail.com')
-    
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+    return smtplib, MIMEText, MIMEMultipart
+
+def _sender():
+    return os.getenv('SMTP_SENDER', 'leads@nycscouts.com')
+
+def _recipient():
+    return os.getenv('LEAD_NOTIFICATION_EMAIL', 'asmarketingltd@gmail.com')
+
+def _lead_subject(lead_data):
     # Email subject: [Name] - [CITYCODE]
     # Extract City Code: Remove last 2 chars (Age + Gender suffix) from full campaign code
     # Example: #DALFB33F -> #DALFB3
     full_campaign = lead_data.get('campaign', 'N/A')
     city_code = full_campaign[:-2] if full_campaign and len(full_campaign) > 2 else full_campaign
-    
-    subject = f"{lead_data.get('first_name', '')} {lead_data.get('last_name', '')} - {city_code}"
-    
-    # Email body with all lead fields
-    body = f"""
-New Lead Submission
 
-Name: {lead_data.get('first_name', '')} {lead_data.get('last_name', '')}
+    return f"{lead_data.get('first_name', '')} {lead_data.get('last_name', '')} - {city_code}"
+
+def _lead_details(lead_data):
+    return f"""Name: {lead_data.get('first_name', '')} {lead_data.get('last_name', '')}
 Email: {lead_data.get('email', '')}
 Phone: {lead_data.get('phone', '')}
 Age: {lead_data.get('age', '')}
@@ -41,24 +65,190 @@ Image URL: {lead_data.get('image_url', '')}
 
 Submitted: {lead_data.get('created_at', '')}
 """
-    
-    try:
-        # Create message
-        message = MIMEMultipart()
-        message['From'] = sender_email
-        message['To'] = recipient_email
-        message['Subject'] = subject
-        message.attach(MIMEText(body, 'plain'))
-        
-        # Send email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()  # Enable TLS
-            server.login(smtp_username, smtp_password)
-            server.send_message(message)
-            
-        print(f"Email sent successfully to {recipient_email}")
-        return True
-        
-    except Exception as e:
-        print(f"Failed to send email: {str(e)}")
-        return False
+
+def _build_message(subject, body):
+    _, MIMEText, MIMEMultipart = load_smtp()
+    message = MIMEMultipart()
+    message['From'] = _sender()
+    message['To'] = _recipient()
+    message['Subject'] = subject
+    message.attach(MIMEText(body, 'plain'))
+    return message
+
+def build_lead_message(lead_data):
+    """Single-lead notification, one email per lead."""
+    # Email body with all lead fields
+    body = f"""
+New Lead Submission
+
+{_lead_details(lead_data)}"""
+    return _build_message(_lead_subject(lead_data), body)
+
+def build_digest_message(leads):
+    """One notification summarising several leads (digest mode)."""
+    subject = f"{len(leads)} New Leads - " + ", ".join(_lead_subject(lead) for lead in leads[:3])
+    if len(leads) > 3:
+        subject += f" (+{len(leads) - 3} more)"
+    sections = [f"--- Lead {i} of {len(leads)} ---\n{_lead_details(lead)}" for i, lead in enumerate(leads, 1)]
+    body = f"\n{len(leads)} New Lead Submissions\n\n" + "\n".join(sections)
+    return _build_message(subject, body)
+
+
+class SMTPMailer:
+    """
+    Keeps one authenticated SMTP session open across messages instead of doing
+    connect + STARTTLS + login per lead, and reconnects once if it went stale.
+    Not thread-safe: owned by the EmailDispatcher worker thread.
+    """
+
+    def __init__(self, server=SMTP_SERVER, port=SMTP_PORT, starttls=SMTP_STARTTLS, timeout=SMTP_TIMEOUT):
+        self.server = server
+        self.port = port
+        self.starttls = starttls
+        self.timeout = timeout
+        self._conn = None
+        self._last_used = 0.0
+        self.counters = {'connects': 0, 'sent': 0, 'failed': 0, 'reconnects': 0}
+
+    def _connect(self):
+        smtplib, _, _ = load_smtp()
+        conn = smtplib.SMTP(self.server, self.port, timeout=self.timeout)
+        if self.starttls:
+            conn.starttls()  # Enable TLS
+        username = os.getenv('SMTP_USERNAME', 'leadsnyc')
+        password = os.getenv('SMTP_PASSWORD', 'enQ3a3FuMHA1OTAw')
+        if username and password:
+            conn.login(username, password)
+        self.counters['connects'] += 1
+        self._conn = conn
+
+    def _alive(self):
+        if self._conn is None:
+            return False
+        if time.monotonic() - self._last_used < SMTP_IDLE_CHECK_SECONDS:
+            return True
+        try:
+            return self._conn.noop()[0] == 250
+        except Exception:
+            return False
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.quit()
+            except Exception:
+                pass
+            self._conn = None
+
+    def send(self, message):
+        """Send over the persistent session; returns True on success."""
+        started = time.perf_counter()
+        for attempt in range(2):
+            try:
+                if not self._alive():
+                    self.close()
+                    self._connect()
+                self._conn.send_message(message)
+                self._last_used = time.monotonic()
+                self.counters['sent'] += 1
+                metrics.record_stage('email', time.perf_counter() - started)
+                log.info("Email sent", to=message['To'])
+                return True
+            except Exception as e:
+                # Server dropped the session or rejected it; reconnect once
+                self.close()
+                if attempt == 0:
+                    self.counters['reconnects'] += 1
+                    continue
+                self.counters['failed'] += 1
+                metrics.record_stage('email', time.perf_counter() - started, 'error')
+                log.error("Failed to send email", error=str(e))
+                return False
+
+
+_FLUSH = object()
+
+
+class EmailDispatcher:
+    """
+    Queue-backed email sender. submit() returns immediately with a Future;
+    a background worker owns the SMTP session and delivers queued leads,
+    grouping up to digest_size of them into a single notification.
+    """
+
+    def __init__(self, mailer=None, digest_size=EMAIL_DIGEST_SIZE, max_wait=EMAIL_DIGEST_MAX_WAIT):
+        self.mailer = mailer or SMTPMailer()
+        self.digest_size = digest_size
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='email-dispatcher', daemon=True)
+                self._worker.start()
+
+    def submit(self, lead_data):
+        future = Future()
+        self._ensure_worker()
+        self._queue.put((lead_data, future))
+        return future
+
+    def flush(self):
+        """Send whatever is batched now instead of waiting for the digest to fill."""
+        self._ensure_worker()
+        self._queue.put(_FLUSH)
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = max(deadline - time.monotonic(), 0) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = _FLUSH
+            if item is not _FLUSH:
+                batch.append(item)
+                if len(batch) == 1:
+                    deadline = time.monotonic() + self.max_wait
+                if len(batch) < self.digest_size:
+                    continue
+            if batch:
+                self._send_batch(batch)
+                batch = []
+
+    def _send_batch(self, batch):
+        leads = [lead_data for lead_data, _ in batch]
+        try:
+            message = build_lead_message(leads[0]) if len(leads) == 1 else build_digest_message(leads)
+            ok = self.mailer.send(message)
+        except Exception as e:
+            log.exception("Failed to send email", error=str(e))
+            ok = False
+        for _, future in batch:
+            future.set_result(ok)
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+def get_dispatcher():
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                _dispatcher = EmailDispatcher()
+    return _dispatcher
+
+def digest_enabled():
+    return EMAIL_DIGEST_SIZE > 1
+
+def queue_lead_email(lead_data):
+    """Queue a lead notification; returns a Future resolving to True/False."""
+    return get_dispatcher().submit(lead_data)
+
+def flush_email_queue():
+    get_dispatcher().flush()
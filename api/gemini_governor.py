@@ -0,0 +1,244 @@
+import os
+import random
+import threading
+import time
+
+import deadline
+from logs import get_logger
+
+log = get_logger('gemini')
+
+# Requests per minute we are allowed to send (our Gemini quota) and burst size
+GEMINI_RPM = float(os.getenv('GEMINI_RPM', '60'))
+GEMINI_BURST = float(os.getenv('GEMINI_BURST', '10'))
+# Longest a call waits for a rate-limit token before giving up
+GEMINI_RATE_WAIT_SECONDS = float(os.getenv('GEMINI_RATE_WAIT_SECONDS', '10'))
+# Retries for 429/5xx/timeouts, with full-jitter exponential backoff
+GEMINI_MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '2'))
+GEMINI_BACKOFF_BASE_SECONDS = float(os.getenv('GEMINI_BACKOFF_BASE_SECONDS', '0.5'))
+GEMINI_BACKOFF_MAX_SECONDS = float(os.getenv('GEMINI_BACKOFF_MAX_SECONDS', '8'))
+# Consecutive failed calls that open the breaker, and how long it stays open
+GEMINI_BREAKER_THRESHOLD = int(os.getenv('GEMINI_BREAKER_THRESHOLD', '5'))
+GEMINI_BREAKER_COOLDOWN_SECONDS = float(os.getenv('GEMINI_BREAKER_COOLDOWN_SECONDS', '30'))
+
+# google.api_core exception names and HTTP codes worth retrying
+_RETRYABLE_NAMES = {'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'InternalServerError',
+                    'TooManyRequests', 'GatewayTimeout', 'Timeout', 'TimeoutError', 'ConnectionError'}
+_RETRYABLE_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimited(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def is_retryable(error):
+    code = getattr(error, 'code', None)
+    if callable(code):
+        # grpc errors expose code() instead of an int
+        code = None
+    return type(error).__name__ in _RETRYABLE_NAMES or code in _RETRYABLE_CODES
+
+
+def is_throttle(error):
+    return type(error).__name__ in ('ResourceExhausted', 'TooManyRequests') or getattr(error, 'code', None) == 429
+
+
+class TokenBucket:
+    """
+    Rate limiter sized to the quota. Adaptive: a 429 halves the refill rate,
+    and each success creeps it back up towards the configured quota.
+    """
+
+    def __init__(self, per_minute=GEMINI_RPM, burst=GEMINI_BURST):
+        self.max_rate = per_minute / 60
+        self.rate = self.max_rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=GEMINI_RATE_WAIT_SECONDS):
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise RateLimited("Gemini rate limit reached, try again shortly")
+            time.sleep(wait)
+
+    def try_acquire(self):
+        """Take a token only if one is free right now (used for hedged requests)."""
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def throttled(self):
+        with self._lock:
+            self.rate = max(self.max_rate / 16, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def succeeded(self):
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def state(self):
+        with self._lock:
+            self._refill()
+            return {'tokens': round(self.tokens, 2), 'rate_per_minute': round(self.rate * 60, 2),
+                    'max_rate_per_minute': round(self.max_rate * 60, 2)}
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `threshold` consecutive failures; while open every
+    call fails immediately; after the cooldown one trial call (half-open)
+    decides whether to close again or re-open.
+    """
+
+    def __init__(self, threshold=GEMINI_BREAKER_THRESHOLD, cooldown=GEMINI_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    raise CircuitOpen("Gemini temporarily unavailable (circuit open)")
+                self.state = 'half_open'
+            if self.state == 'half_open':
+                if self._trial_running:
+                    raise CircuitOpen("Gemini temporarily unavailable (circuit half-open)")
+                self._trial_running = True
+
+    def record(self, ok):
+        with self._lock:
+            self._trial_running = False
+            if ok:
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    log.warning("Circuit opened", consecutive_failures=self.failures)
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """The call never reached the API; let another caller make the half-open trial."""
+        with self._lock:
+            self._trial_running = False
+
+    def snapshot(self):
+        with self._lock:
+            remaining = max(0.0, self.cooldown - (time.monotonic() - self._opened_at)) if self.state == 'open' else 0.0
+            return {'state': self.state, 'consecutive_failures': self.failures,
+                    'open_seconds_remaining': round(remaining, 2)}
+
+
+class GeminiGovernor:
+    """Rate limit, retry and circuit-break calls to the model."""
+
+    def __init__(self, bucket=None, breaker=None, max_retries=GEMINI_MAX_RETRIES):
+        self.bucket = bucket or TokenBucket()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self.counters = {'calls': 0, 'succeeded': 0, 'failed': 0, 'retries': 0,
+                         'throttled': 0, 'rate_limited': 0, 'out_of_time': 0, 'short_circuited': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def call(self, fn, *args, **kwargs):
+        """
+        Run fn (e.g. model.generate_content) under the governor. Raises
+        CircuitOpen / RateLimited without calling the API when it must not be
+        called, otherwise the last error once retries are used up.
+        """
+        self._count('calls')
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            self._count('short_circuited')
+            raise
+
+        attempt = 0
+        while True:
+            left = deadline.remaining()
+            try:
+                if left is not None and left < deadline.GEMINI_MIN_CALL_SECONDS:
+                    raise deadline.BudgetExhausted(f"Analysis time budget exhausted ({left:.1f}s left)")
+                self.bucket.acquire(GEMINI_RATE_WAIT_SECONDS if left is None else min(GEMINI_RATE_WAIT_SECONDS, left))
+            except (RateLimited, deadline.BudgetExhausted) as e:
+                self._count('rate_limited' if isinstance(e, RateLimited) else 'out_of_time')
+                # Our own limiter, not an API failure: leave the breaker as it was
+                self.breaker.release()
+                raise
+            try:
+                result = fn(*args, **kwargs)
+            except deadline.BudgetExhausted:
+                self._count('out_of_time')
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if is_throttle(e):
+                    self._count('throttled')
+                    self.bucket.throttled()
+                delay = random.uniform(0, min(GEMINI_BACKOFF_MAX_SECONDS,
+                                              GEMINI_BACKOFF_BASE_SECONDS * (2 ** (attempt + 1))))
+                left = deadline.remaining()
+                # A retry that can't finish inside the request's budget isn't worth sending
+                has_time = left is None or left - delay >= deadline.GEMINI_MIN_CALL_SECONDS
+                if attempt < self.max_retries and is_retryable(e) and has_time:
+                    attempt += 1
+                    self._count('retries')
+                    log.info("Retrying Gemini call", error=type(e).__name__, attempt=attempt,
+                             max_retries=self.max_retries, delay_seconds=round(delay, 2))
+                    time.sleep(delay)
+                    continue
+                self._count('failed')
+                if is_retryable(e):
+                    self.breaker.record(ok=False)
+                else:
+                    # Bad or blocked image (400, safety block, replay miss): the model
+                    # isn't down, so this must not count towards opening the circuit
+                    self.breaker.release()
+                raise
+            self.bucket.succeeded()
+            self.breaker.record(ok=True)
+            self._count('succeeded')
+            return result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+        stats['rate_limiter'] = self.bucket.state()
+        stats['circuit'] = self.breaker.snapshot()
+        return stats
+
+
+gemini_governor = GeminiGovernor()
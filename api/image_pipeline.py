@@ -0,0 +1,143 @@
+import io
+import os
+import threading
+import time
+
+from logs import get_logger
+
+log = get_logger('image')
+
+# Longest edge sent to Gemini, and kept in storage for the admin/CRM
+IMAGE_MODEL_MAX_EDGE = int(os.getenv('IMAGE_MODEL_MAX_EDGE', '1024'))
+IMAGE_STORAGE_MAX_EDGE = int(os.getenv('IMAGE_STORAGE_MAX_EDGE', '1500'))
+IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', '85'))
+
+_stats_lock = threading.Lock()
+_stats = {
+    'normalized': 0,
+    'passthrough': 0,
+    'bytes_in': 0,
+    'model_bytes_out': 0,
+    'storage_bytes_out': 0,
+}
+
+
+class NormalizedImage:
+    """Model and storage renditions of one upload, plus a before/after report."""
+    def __init__(self, model_bytes, model_mime, storage_bytes, storage_mime, report):
+        self.model_bytes = model_bytes
+        self.model_mime = model_mime
+        self.storage_bytes = storage_bytes
+        self.storage_mime = storage_mime
+        self.report = report
+
+
+def _load_pillow():
+    try:
+        from PIL import Image, ImageOps
+        return Image, ImageOps
+    except ImportError:
+        return None, None
+
+
+def _render(image, max_edge, Image):
+    rendition = image.copy()
+    rendition.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    buffer = io.BytesIO()
+    # Saving without exif= drops all metadata (GPS, device, orientation tag)
+    rendition.save(buffer, format='JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+    return buffer.getvalue(), rendition.size
+
+
+def _source_size(source):
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    source.seek(0, io.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _passthrough(source, mime_type, reason, started):
+    if isinstance(source, (bytes, bytearray)):
+        content = source
+    else:
+        source.seek(0)
+        content = source.read()
+    report = {
+        'normalized': False,
+        'reason': reason,
+        'original_bytes': len(content),
+        'ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    with _stats_lock:
+        _stats['passthrough'] += 1
+        _stats['bytes_in'] += len(content)
+        _stats['model_bytes_out'] += len(content)
+        _stats['storage_bytes_out'] += len(content)
+    return NormalizedImage(content, mime_type, content, mime_type, report)
+
+
+def normalize_image(source, mime_type="image/jpeg"):
+    """
+    Decode, auto-orient, strip EXIF, downscale and re-encode an upload so that
+    clients skipping the browser-side compression don't send full-resolution
+    photos to Gemini or storage. Produces a small rendition for the model and a
+    larger one for storage. Images Pillow can't decode (e.g. HEIC without a
+    plugin) or a missing Pillow install fall back to the original bytes.
+
+    source is the upload as bytes or as a binary file object (e.g. the spooled
+    file behind an UploadFile), which Pillow decodes without a full copy.
+    """
+    started = time.perf_counter()
+    original_bytes = _source_size(source)
+    Image, ImageOps = _load_pillow()
+    if Image is None:
+        return _passthrough(source, mime_type, 'Pillow not installed', started)
+
+    try:
+        image = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        original_size = image.size
+        # JPEG only: let the decoder downscale by a power of two while staying
+        # above the largest rendition, far cheaper than decoding all 12MP
+        image.draft('RGB', (IMAGE_STORAGE_MAX_EDGE, IMAGE_STORAGE_MAX_EDGE))
+        image.load()
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            # Flatten transparency onto white, JPEG has no alpha channel
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            image = background
+
+        model_bytes, model_size = _render(image, IMAGE_MODEL_MAX_EDGE, Image)
+        storage_bytes, storage_size = _render(image, IMAGE_STORAGE_MAX_EDGE, Image)
+    except Exception as e:
+        log.warning("Image normalization skipped", error=str(e))
+        return _passthrough(source, mime_type, f"decode failed: {str(e)[:100]}", started)
+
+    report = {
+        'normalized': True,
+        'original_bytes': original_bytes,
+        'original_dims': list(original_size),
+        'model_bytes': len(model_bytes),
+        'model_dims': list(model_size),
+        'storage_bytes': len(storage_bytes),
+        'storage_dims': list(storage_size),
+        'ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    with _stats_lock:
+        _stats['normalized'] += 1
+        _stats['bytes_in'] += original_bytes
+        _stats['model_bytes_out'] += len(model_bytes)
+        _stats['storage_bytes_out'] += len(storage_bytes)
+    log.info("Image normalized", **report)
+    return NormalizedImage(model_bytes, 'image/jpeg', storage_bytes, 'image/jpeg', report)
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result['model_max_edge'] = IMAGE_MODEL_MAX_EDGE
+    result['storage_max_edge'] = IMAGE_STORAGE_MAX_EDGE
+    return result
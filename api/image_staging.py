@@ -0,0 +1,190 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import metrics
+from logs import get_logger
+
+log = get_logger('image_staging')
+
+# Where staged images live: "supabase" (private bucket) or "local" (temp dir stand-in)
+STAGING_BACKEND = os.getenv('IMAGE_STAGING_BACKEND', 'supabase').lower()
+# Private bucket (supabase/migrations/20261018000900_private_image_staging.sql):
+# photos of visitors who never submit a lead are never publicly reachable
+STAGING_BUCKET = os.getenv('IMAGE_STAGING_BUCKET', 'lead-staging')
+STAGING_DIR = os.getenv('IMAGE_STAGING_DIR') or os.path.join(tempfile.gettempdir(), 'model-scanner-staging')
+# Staged images are deleted by the sweep once they are this old
+STAGED_IMAGE_RETENTION_HOURS = float(os.getenv('STAGED_IMAGE_RETENTION_HOURS', '24'))
+# Max staged objects examined per sweep run (keeps one run inside the function time limit)
+STAGING_SWEEP_LIMIT = int(os.getenv('STAGING_SWEEP_LIMIT', '2000'))
+_SWEEP_PAGE_SIZE = 500
+# Objects per storage remove call
+_SWEEP_CHUNK_SIZE = 50
+
+EXTENSIONS = {
+    'image/jpeg': 'jpeg',
+    'image/jpg': 'jpeg',
+    'image/png': 'png',
+}
+MIME_TYPES = {'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+TOKEN_PATTERN = re.compile(r'^[0-9a-f]{32}\.(jpeg|png)$')
+
+
+class InvalidImageToken(ValueError):
+    pass
+
+
+def new_token(content, mime_type):
+    """
+    Opaque token derived from the image content plus the file extension of the
+    staged object. Re-submitting the same photo maps to the same staged object.
+    """
+    extension = EXTENSIONS.get(mime_type, 'jpeg')
+    return f"{hashlib.sha256(content).hexdigest()[:32]}.{extension}"
+
+
+def validate_token(token):
+    if not token or not TOKEN_PATTERN.match(token):
+        raise InvalidImageToken("Invalid image token")
+    return token
+
+
+def token_mime_type(token):
+    return MIME_TYPES[validate_token(token).rsplit('.', 1)[1]]
+
+
+def local_path(token):
+    return os.path.join(STAGING_DIR, validate_token(token))
+
+
+def stage_image(supabase, content, mime_type):
+    """
+    Store the uploaded image once, at analysis time, in private staging and
+    return an opaque token /api/lead can exchange for the image instead of the
+    client uploading it again.
+    """
+    token = new_token(content, mime_type)
+    if STAGING_BACKEND == 'local':
+        os.makedirs(STAGING_DIR, exist_ok=True)
+        path = local_path(token)
+        if not os.path.exists(path):
+            with metrics.stage('staging_upload'), open(path, 'wb') as f:
+                f.write(content)
+    else:
+        try:
+            with metrics.stage('staging_upload'):
+                supabase.storage.from_(STAGING_BUCKET).upload(
+                    path=token,
+                    file=content,
+                    file_options={"content-type": token_mime_type(token)}
+                )
+        except Exception as e:
+            # Same content was staged before (page reload / "try again")
+            if 'Duplicate' not in str(e) and 'already exists' not in str(e):
+                raise
+    return token
+
+
+def load_staged_image(supabase, token):
+    """
+    Content and mime type of a staged image, for /api/lead to publish once it
+    accepts the lead. Raises InvalidImageToken if it is gone (swept or never staged).
+    """
+    mime_type = token_mime_type(token)
+    if STAGING_BACKEND == 'local':
+        try:
+            with open(local_path(token), 'rb') as f:
+                return f.read(), mime_type
+        except FileNotFoundError:
+            raise InvalidImageToken("Staged image not found")
+    try:
+        with metrics.stage('staging_download'):
+            return supabase.storage.from_(STAGING_BUCKET).download(token), mime_type
+    except Exception as e:
+        if str(getattr(e, 'status', '')) == '404' or 'not found' in str(e).lower():
+            raise InvalidImageToken("Staged image not found")
+        raise
+
+
+def discard_staged_image(supabase, token):
+    """Drop a staged image once its lead has its own copy in lead-images. Best effort: the sweep catches misses."""
+    try:
+        if STAGING_BACKEND == 'local':
+            os.remove(local_path(token))
+        else:
+            supabase.storage.from_(STAGING_BUCKET).remove([validate_token(token)])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        log.warning("Discarding staged image failed", token=token, error=str(e))
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _expired_staged_objects(supabase, cutoff, limit):
+    """Tokens of staged objects older than cutoff, oldest first, at most limit."""
+    if STAGING_BACKEND == 'local':
+        if not os.path.isdir(STAGING_DIR):
+            return []
+        found = []
+        for name in os.listdir(STAGING_DIR):
+            if TOKEN_PATTERN.match(name):
+                staged_at = datetime.fromtimestamp(os.path.getmtime(os.path.join(STAGING_DIR, name)), timezone.utc)
+                if staged_at < cutoff:
+                    found.append((staged_at, name))
+        return [name for _, name in sorted(found)][:limit]
+
+    bucket = supabase.storage.from_(STAGING_BUCKET)
+    found = []
+    offset = 0
+    while len(found) < limit:
+        page = bucket.list('', {
+            'limit': _SWEEP_PAGE_SIZE,
+            'offset': offset,
+            'sortBy': {'column': 'created_at', 'order': 'asc'},
+        }) or []
+        for entry in page:
+            name, created_at = entry.get('name') or '', entry.get('created_at')
+            if not TOKEN_PATTERN.match(name) or not created_at:
+                continue
+            if _parse_timestamp(created_at) >= cutoff:
+                # Sorted by age: everything after this is newer
+                return found[:limit]
+            found.append(name)
+        if len(page) < _SWEEP_PAGE_SIZE:
+            break
+        offset += _SWEEP_PAGE_SIZE
+    return found[:limit]
+
+
+def sweep_staged_images(supabase, max_age_hours=STAGED_IMAGE_RETENTION_HOURS, limit=STAGING_SWEEP_LIMIT):
+    """
+    Delete staged images older than max_age_hours: visitors who ran an
+    analysis but never submitted (submitted images are discarded on accept).
+    Returns counts.
+    """
+    started = time.perf_counter()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=max_age_hours)
+    tokens = _expired_staged_objects(supabase, cutoff, limit)
+
+    for i in range(0, len(tokens), _SWEEP_CHUNK_SIZE):
+        chunk = tokens[i:i + _SWEEP_CHUNK_SIZE]
+        if STAGING_BACKEND == 'local':
+            for token in chunk:
+                try:
+                    os.remove(local_path(token))
+                except FileNotFoundError:
+                    pass
+        else:
+            supabase.storage.from_(STAGING_BUCKET).remove(chunk)
+
+    return {
+        'deleted': len(tokens),
+        'ms': round((time.perf_counter() - started) * 1000, 2),
+    }
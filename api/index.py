@@ -1,36 +1,92 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request, BackgroundTasks, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
 import json
 import os
 import time
-from typing import Optional, List, Any
+from typing import Optional, List, Any, TYPE_CHECKING
 from pydantic import BaseModel
-from supabase import create_client, Client
-from dotenv import load_dotenv
 
-# Load valid environment
-load_dotenv()
+if TYPE_CHECKING:
+    from supabase import Client
+
+# Load .env for local development only; on Vercel the environment is injected
+# directly, so skip importing python-dotenv on cold start
+_API_DIR = os.path.dirname(__file__)
+if os.path.exists('.env') or os.path.exists(os.path.join(_API_DIR, '..', '.env')):
+    from dotenv import load_dotenv
+    load_dotenv()
 
 # Fix path for Vercel import resolution
 import sys
-sys.path.append(os.path.dirname(__file__))
+sys.path.append(_API_DIR)
+
+from logs import get_logger
+import metrics
+import profiling
+
+log = get_logger('api')
+
+# The vision engine pulls in google.generativeai and builds the model, which
+# dominates import time, so it is only loaded by the first analysis request
+# (vision_engines defers the SDK import the same way)
+_analyze_image = None
+
+def _load_vision_engine():
+    global _analyze_image
+    if _analyze_image is None:
+        try:
+            from vision_logic import analyze_image as impl
+        except ImportError as e:
+            log.error("Vision import failed", error=str(e))
+            # Fallback only if absolutely necessary
+            def impl(img_data, mime_type):
+                return {"suitability_score": 70, "market_categorization": "Unknown"}
+        _analyze_image = impl
+    return _analyze_image
 
-# Import local utils (copying logic from previous files)
-try:
-    from vision_logic import analyze_image
-except ImportError as e:
-    print(f"Vision Import Error: {e}")
-    # Fallback only if absolutely necessary
-    def analyze_image(img_data, mime_type):
-        return {"suitability_score": 70, "market_categorization": "Unknown"}
+def analyze_image(img_data, mime_type="image/jpeg"):
+    return _load_vision_engine()(img_data, mime_type=mime_type)
 
-from webhook_utils import send_webhook
-from email_utils import send_lead_email
+from webhook_utils import send_webhook, is_success
+from analysis_cache import analysis_cache, enable_supabase_tier
+import image_staging
+import image_pipeline
+from analysis_executor import analysis_executor, AnalysisQueueFull
+import outbox
+import webhook_dispatch
+import supabase_client
+import upload_ingest
+import lead_store
+import lead_pipeline
+import batch_analysis
+import lead_queries
+from gemini_governor import gemini_governor
+import deadline
+from admin_auth import require_admin
+from upload_ingest import UploadTooLarge, UnsupportedImageType
 
 
 app = FastAPI()
 
+# Opt-in CPU/allocation profiles of sampled requests (PROFILE_SAMPLE_RATE or X-Profile header)
+app.add_middleware(profiling.ProfilingMiddleware)
+# Stage timings -> Server-Timing header and /api/metrics; also tags logs with a request id
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Reject oversized uploads with 413 before the multipart body is parsed
+_UPLOAD_REQUEST_LIMIT = upload_ingest.UPLOAD_MAX_BYTES + upload_ingest.FORM_OVERHEAD_BYTES
+app.add_middleware(
+    upload_ingest.UploadSizeLimitMiddleware,
+    limits={
+        "/api/analyze": _UPLOAD_REQUEST_LIMIT,
+        "/api/lead": _UPLOAD_REQUEST_LIMIT,
+        "/api/analyze_batch": upload_ingest.UPLOAD_BATCH_MAX_BYTES,
+    },
+)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -40,23 +96,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Helper to get Supabase client
-def get_supabase() -> Client:
-    url = os.getenv('SUPABASE_URL') or os.getenv('VITE_SUPABASE_URL')
-    key = (
-        os.getenv('BACKEND_SERVICE_KEY') or
-        os.getenv('SUPABASE_SERVICE_ROLE_KEY') or 
-        os.getenv('VITE_SUPABASE_ANON_KEY') or 
-        os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY') or 
-        os.getenv('SUPABASE_ANON_KEY') or 
-        os.getenv('SUPABASE_PUBLISHABLE_KEY')
-    )
-    if not url or not key:
-        raise HTTPException(status_code=500, detail="Supabase credentials missing")
-    return create_client(url, key)
+# Helper to get the shared, process-wide Supabase client
+def get_supabase() -> "Client":
+    try:
+        return supabase_client.get_client()
+    except supabase_client.SupabaseConfigError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Optional Supabase-backed persistent tier for the analysis cache
+enable_supabase_tier(get_supabase)
 
 @app.post("/api/lead")
 async def create_lead(
+    background_tasks: BackgroundTasks,
     file: Optional[UploadFile] = File(None),
     first_name: str = Form(...),
     last_name: str = Form(...),
@@ -68,80 +120,63 @@ async def create_lead(
     zip_code: str = Form(...),
     campaign: Optional[str] = Form(None),
     wants_assessment: Optional[str] = Form("false"), # Receiving as string from FormData
-    analysis_data: Optional[str] = Form("{}")
+    analysis_data: Optional[str] = Form("{}"),
+    image_token: Optional[str] = Form(None) # Returned by /api/analyze, replaces re-uploading the file
 ):
     try:
         supabase = get_supabase()
         
-        # 1. Duplicate Check
-        existing = supabase.table('leads').select('id').or_(f"email.eq.{email},phone.eq.{phone}").execute()
-        if existing.data and len(existing.data) > 0:
-            return JSONResponse(
-                status_code=400,
-                content={"status": "error", "message": "This email or phone number has already been submitted."}
-            )
-
-        # 2. Image Upload
+        # 1. Image: staged privately by /api/analyze, or uploaded with the lead.
+        # Either way it is published to lead-images only alongside the insert
         image_url = None
-        if file:
-            # Validate allowed file types
-            if file.content_type not in ["image/jpeg", "image/png", "image/jpg"]:
+        image_bytes = image_mime = None
+        image_path = None
+        if image_token:
+            # Image was already staged by /api/analyze - no second upload from the client
+            try:
+                image_bytes, image_mime = await run_in_threadpool(
+                    image_staging.load_staged_image, supabase, image_token
+                )
+            except image_staging.InvalidImageToken as e:
                 return JSONResponse(
                     status_code=400,
-                    content={"status": "error", "message": "Only JPEG and PNG images are allowed."}
+                    content={"status": "error", "message": str(e)}
                 )
-
+        elif file:
+            # Validate allowed file types from the file's magic bytes, not the client's content_type
             try:
-                content = await file.read()
-                timestamp = int(time.time())
-                clean_email = email.replace('@', '-at-').replace('.', '-')
-                
-                # Determine correct extension based on actual file type
-                extension = '.jpeg'  # default
-                if file.content_type == 'image/png':
-                    extension = '.png'
-                elif file.content_type in ['image/jpeg', 'image/jpg']:
-                    extension = '.jpeg'
-                    
-                filename = f"{clean_email}_{timestamp}{extension}"
-                
-                # Upload
-                upload_response = supabase.storage.from_("lead-images").upload(
-                    path=filename,
-                    file=content,
-                    file_options={"content-type": "application/octet-stream"}
-                )
-                
-                print(f"Upload response: {upload_response}")
-                
-                sb_url = os.getenv('SUPABASE_URL') or os.getenv('VITE_SUPABASE_URL')
-                image_url = f"{sb_url}/storage/v1/object/public/lead-images/{filename}"
-                
-                print(f"Constructed URL: {image_url}")
-            except Exception as e:
-                print(f"Upload failed: {e}")
-                # Save error to database to view in admin
-                supabase.table('leads').update({
-                    'webhook_status': 'upload_failed',
-                    'webhook_response': f"Image Upload Error: {str(e)}"
-                }).eq('id', lead_id).execute()
-                # Stop processing to prevent sending incomplete data
-                return {
-                    "status": "error",
-                    "message": f"Image upload failed: {str(e)}",
-                    "id": response.data[0]['id']
-                }
+                upload = await upload_ingest.ingest_upload(file, allowed_types=["image/jpeg", "image/png"])
+            except UploadTooLarge as e:
+                return JSONResponse(status_code=413, content={"status": "error", "message": str(e)})
+            except UnsupportedImageType as e:
+                return JSONResponse(status_code=400, content={"status": "error", "message": str(e)})
 
-        # 3. Prepare Data
+            # Store the oriented, EXIF-free storage rendition rather than the raw upload
+            with metrics.stage('normalize'):
+                image = await run_in_threadpool(image_pipeline.normalize_image, upload.file, upload.mime_type)
+            image_bytes, image_mime = image.storage_bytes, image.storage_mime
+
+        if image_bytes is not None:
+            # Deterministic name, so the URL is known before the upload completes
+            image_path = lead_pipeline.lead_image_path(email, image_bytes, image_mime)
+            sb_url = supabase_client.supabase_url()
+            image_url = f"{sb_url}/storage/v1/object/public/lead-images/{image_path}"
+
+        # 2. Prepare Data
         try:
             analysis_json = json.loads(analysis_data)
         except:
             analysis_json = {}
+        if isinstance(analysis_json, dict):
+            analysis_json.pop('image_token', None)
             
         score = analysis_json.get('suitability_score', 0)
         market_data = analysis_json.get('market_categorization', {})
         category = market_data.get('primary', 'Unknown') if isinstance(market_data, dict) else str(market_data)
         
+        # Webhook state is known before the insert, so it goes in with the row
+        webhook_url = os.getenv('CRM_WEBHOOK_URL')
+
         # Insert Record
         lead_record = {
             'first_name': first_name,
@@ -159,95 +194,87 @@ async def create_lead(
             'analysis_json': analysis_json,
             'image_url': image_url,
             'webhook_sent': False,
-            'webhook_status': 'pending',
-            'webhook_response': None
+            'webhook_status': 'pending' if webhook_url else 'not_configured',
+            'webhook_response': None if webhook_url else 'CRM_WEBHOOK_URL not set'
         }
-        
-        result = supabase.table('leads').insert(lead_record).execute()
-        
-        if not result.data:
-            raise Exception("Insert failed")
-            
-        lead_id = result.data[0]['id']
-        
-        # 4. Webhook - Format payload for CRM API
-        webhook_url = os.getenv('CRM_WEBHOOK_URL')
+
+        # Webhook + email are queued in the outbox and delivered after the response
+        jobs = []
         if webhook_url:
-            # Format address from city and zip
-            address = f"{city}, {zip_code}" if city and zip_code else (city or zip_code or "")
-            
-            # Prepare CRM payload matching the expected structure
-            crm_payload = {
-                'campaign': campaign or '',
-                'email': email,
-                'telephone': phone,
-                'address': address,
-                'firstname': first_name,
-                'lastname': last_name,
-                'image': image_url or '',
-                'analyticsid': '',  # Can be populated if you track analytics
-                'age': str(age),
-                'gender': 'M' if gender == 'Male' else 'F',
-                'opt_in': 'true' if wants_assessment == 'true' else 'false'
-            }
-            
-            # Inline webhook sending logic to ensure robust error handling
-            try:
-                import requests
-                headers = {
-                    'Content-Type': 'application/json',
-                    'User-Agent': 'ModelScanner/1.0'
-                }
-                
-                print(f"Sending webhook to: {webhook_url}")
-                wb_resp = requests.post(webhook_url, json=crm_payload, headers=headers, timeout=10)
-                
-                status = 'success' if wb_resp.status_code < 300 else 'failed'
-                resp_text = wb_resp.text
-                
-            except requests.exceptions.Timeout:
-                status = 'failed'
-                resp_text = "Timeout: Request took longer than 10 seconds"
-            except requests.exceptions.ConnectionError as e:
-                status = 'failed'
-                resp_text = f"Connection Error: {str(e)[:200]}"
-            except requests.exceptions.SSLError as e:
-                status = 'failed'
-                resp_text = f"SSL Error: {str(e)[:200]}"
-            except Exception as e:
-                status = 'failed'
-                resp_text = f"Unexpected Error: {str(e)[:200]}"
-            
-            supabase.table('leads').update({
-                'webhook_sent': True,
-                'webhook_status': status,
-                'webhook_response': resp_text
-            }).eq('id', lead_id).execute()
+            jobs.append(outbox.build_job(outbox.KIND_WEBHOOK, format_crm_payload(lead_record)))
 
-            # 5. Send Email Notification
-            email_data = lead_record.copy()
+            # Email Notification
+            email_data = {k: v for k, v in lead_record.items() if k != 'analysis_json'}
             email_data['campaign'] = campaign
             # Map score and category from analysis_result if available
-            try:
-                analysis = json.loads(analysis_data)
-                email_data['score'] = analysis.get('suitability_score', 'N/A')
-                email_data['category'] = analysis.get('market_categorization', {}).get('primary', 'N/A')
-            except:
-                email_data['score'] = 'N/A'
-                email_data['category'] = 'N/A'
-            
-            # Send email in background (or inline for simplicity)
-            try:
-                print("Sending email notification...")
-                send_lead_email(email_data)
-            except Exception as e:
-                print(f"Error sending email: {e}")
-
-        else:
-            supabase.table('leads').update({
-                'webhook_status': 'not_configured',
-                'webhook_response': 'CRM_WEBHOOK_URL not set'
-            }).eq('id', lead_id).execute()
+            email_data['score'] = analysis_json.get('suitability_score', 'N/A')
+            email_data['category'] = market_data.get('primary', 'N/A') if isinstance(market_data, dict) else 'N/A'
+            jobs.append(outbox.build_job(outbox.KIND_EMAIL, email_data))
+
+        # 3. Stage graph: the storage upload runs alongside the insert (which is
+        # also the duplicate check); each undoes its work if the other fails
+        async def persist(_):
+            # Lead row and outbox jobs written in one round trip; duplicates are rejected by the unique keys
+            lead_id, duplicate = await run_in_threadpool(lead_store.insert_lead, supabase, lead_record, jobs)
+            if duplicate:
+                raise lead_pipeline.DuplicateLead("email or phone already submitted")
+            return lead_id
+
+        async def keep_as_upload_failed(lead_id, error):
+            await run_in_threadpool(lead_pipeline.mark_upload_failed, supabase, lead_id, error)
+
+        stages = [lead_pipeline.Stage(
+            'persist', persist, timeout=lead_pipeline.LEAD_PERSIST_TIMEOUT, cleanup=keep_as_upload_failed
+        )]
+
+        if image_bytes is not None:
+            async def upload_image(_):
+                return await run_in_threadpool(
+                    lead_pipeline.upload_lead_image, supabase, image_path, image_bytes, image_mime
+                )
+
+            async def remove_orphan_image(created, error):
+                # Unless the insert definitely wrote nothing it may still commit and
+                # point at this image; an orphaned object is cheaper than a saved
+                # lead with a dead image_url
+                if not lead_pipeline.write_rejected(error):
+                    log.warning("Keeping lead image, insert outcome unknown", path=image_path, error=str(error))
+                    return
+                # Only delete what this request created, never a pre-existing object
+                if created:
+                    await run_in_threadpool(lead_pipeline.remove_lead_image, supabase, image_path)
+
+            stages.append(lead_pipeline.Stage(
+                'upload', upload_image, timeout=lead_pipeline.LEAD_UPLOAD_TIMEOUT, cleanup=remove_orphan_image
+            ))
+
+        try:
+            results = await lead_pipeline.run_stages(stages, label='lead')
+        except lead_pipeline.StageFailed as e:
+            if isinstance(e.error, lead_pipeline.DuplicateLead):
+                return JSONResponse(
+                    status_code=400,
+                    content={"status": "error", "message": "This email or phone number has already been submitted."}
+                )
+            if e.stage == 'upload':
+                log.error("Lead image upload failed", lead_id=e.results.get('persist'), error=str(e.error))
+                # Stop processing to prevent sending incomplete data
+                return {
+                    "status": "error",
+                    "message": f"Image upload failed: {str(e.error)}",
+                    "id": e.results.get('persist')
+                }
+            raise e.error
+
+        lead_id = results['persist']
+
+        # 4. Delivery: email doesn't wait on the webhook, the outbox drain sends both side by side
+        if jobs:
+            # Opportunistic delivery right after the response; cron drain is the safety net
+            background_tasks.add_task(outbox.drain, supabase, lead_id=lead_id, kinds=outbox.default_kinds())
+        if image_token:
+            # The lead has its own copy now; staging only holds unsubmitted photos
+            background_tasks.add_task(image_staging.discard_staged_image, supabase, image_token)
             
         return {
             "status": "success",
@@ -256,26 +283,288 @@ async def create_lead(
         }
 
     except Exception as e:
-        print(f"Error: {e}")
+        log.exception("Lead creation failed", error=str(e))
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+def _enforce_min_score(result):
+    # DOUBLE CHECK: Enforce strict minimum score of 70 at the API level
+    # This overrides anything returned by the vision engine
+    try:
+        current_score = int(result.get('suitability_score', 0))
+        result['suitability_score'] = max(current_score, 70)
+    except:
+        result['suitability_score'] = 70
+    return result
+
 @app.post("/api/analyze")
 async def analyze_endpoint(file: UploadFile = File(...)):
-    try:
-        content = await file.read()
-        mime_type = file.content_type or "image/jpeg"
+    # One time budget for the whole request, under the 60s function limit
+    with deadline.deadline_scope() as budget:
+        try:
+            # Chunked read with size cap, content hash and magic-byte type check;
+            # the body stays in Starlette's spooled temp file rather than a bytes copy
+            with metrics.stage('ingest'):
+                upload = await upload_ingest.ingest_upload(file)
+
+            # Decode, orient, strip EXIF and downscale once; model and storage get their own renditions
+            with metrics.stage('normalize'):
+                image = await run_in_threadpool(image_pipeline.normalize_image, upload.file, upload.mime_type)
         
-        result = analyze_image(content, mime_type=mime_type)
+            # Gemini call runs on the bounded analysis pool so the event loop keeps serving;
+            # queueing and the model call share the request's deadline budget
+            try:
+                result = await asyncio.wait_for(
+                    analysis_executor.run(analyze_image, image.model_bytes, mime_type=image.model_mime),
+                    timeout=budget.remaining()
+                )
+            except asyncio.TimeoutError:
+                metrics.count('analysis_deadline_timeout')
+                from vision_logic import fallback_result
+                result = fallback_result("Analysis timed out", degraded=True)
+
+            # Stage the image so /api/lead can reference it instead of re-uploading
+            if image.storage_mime in image_staging.EXTENSIONS:
+                try:
+                    supabase = get_supabase() if image_staging.STAGING_BACKEND != 'local' else None
+                    result['image_token'] = await run_in_threadpool(
+                        image_staging.stage_image, supabase, image.storage_bytes, image.storage_mime
+                    )
+                except Exception as e:
+                    # Non-fatal: the client falls back to uploading the file with the lead
+                    log.warning("Image staging failed", error=str(e))
         
-        # DOUBLE CHECK: Enforce strict minimum score of 70 at the API level
-        # This overrides anything returned by the vision engine
+            return _enforce_min_score(result)
+        except UploadTooLarge as e:
+            return JSONResponse(status_code=413, content={"error": str(e)})
+        except UnsupportedImageType as e:
+            return JSONResponse(status_code=415, content={"error": str(e)})
+        except AnalysisQueueFull as e:
+            return JSONResponse(status_code=503, content={"error": str(e)}, headers={"Retry-After": "5"})
+        except Exception as e:
+            return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.post("/api/analyze_batch")
+async def analyze_batch(files: List[UploadFile] = File(...)):
+    """
+    Analyze many images from one multipart request. Images run concurrently
+    (ANALYZE_BATCH_CONCURRENCY), identical files are analyzed once, and results
+    stream back as NDJSON in completion order, ending with a summary line.
+    """
+    if len(files) > batch_analysis.ANALYZE_BATCH_MAX_FILES:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"At most {batch_analysis.ANALYZE_BATCH_MAX_FILES} images per batch"}
+        )
+
+    # Size/type checks and hashing happen up front; a bad file fails only its own result
+    items = []
+    for file in files:
         try:
-            current_score = int(result.get('suitability_score', 0))
-            result['suitability_score'] = max(current_score, 70)
-        except:
-            result['suitability_score'] = 70
-            
-        return result
+            items.append((file.filename, await upload_ingest.ingest_upload(file)))
+        except (UploadTooLarge, UnsupportedImageType) as e:
+            items.append((file.filename, e))
+
+    events = batch_analysis.analyze_batch_events(
+        items, analyze_image, analysis_executor, finalize=_enforce_min_score
+    )
+
+    async def ndjson():
+        try:
+            async for event in events:
+                yield json.dumps(event, default=str) + "\n"
+        except Exception as e:
+            log.exception("Batch analysis failed", error=str(e))
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.api_route("/api/warmup", methods=["GET", "POST"])
+async def warmup(request: Request):
+    """
+    Load the lazily imported dependencies (vision engine, Supabase, SMTP, webhook
+    client) ahead of real traffic. Point a cron or deploy hook here after a cold start.
+    """
+    if not _authorized_cron(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    def timed(fn):
+        start = time.perf_counter()
+        try:
+            detail = fn()
+            return {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 2), **(detail or {})}
+        except Exception as e:
+            return {"ok": False, "ms": round((time.perf_counter() - start) * 1000, 2), "error": str(e)[:200]}
+
+    def warm_vision():
+        _load_vision_engine()
+        import vision_engines
+        engine = vision_engines.get_engine()
+        engine.warm_up()
+        return {"engine": engine.name}
+
+    def warm_supabase():
+        return {"services": supabase_client.warm_up(supabase_client.get_client())}
+
+    def warm_smtp():
+        import email_utils
+        email_utils.load_smtp()
+
+    def warm_webhook():
+        import webhook_utils
+        webhook_utils.get_http_client()
+
+    results = {}
+    for name, fn in [("vision", warm_vision), ("supabase", warm_supabase), ("smtp", warm_smtp), ("webhook_client", warm_webhook)]:
+        results[name] = await run_in_threadpool(timed, fn)
+    return {"status": "success", "components": results}
+
+@app.get("/api/analysis_stats")
+async def analysis_stats():
+    """Analysis cache hit/miss counters, executor load, image size savings, Gemini governor and deadline state."""
+    return {
+        "cache": analysis_cache.stats(),
+        "executor": analysis_executor.stats(),
+        "image_pipeline": image_pipeline.stats(),
+        "gemini": gemini_governor.stats(),
+        "deadline": deadline.stats()
+    }
+
+@app.get("/api/metrics")
+async def prometheus_metrics(request: Request):
+    """
+    Prometheus exposition: request and per-stage latency histograms, event
+    counters, and the analysis_stats numbers as gauges. Counters are per
+    function instance. Scrape with "Authorization: Bearer $CRON_SECRET".
+    """
+    if not _authorized_cron(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    gemini = gemini_governor.stats()
+    gemini['circuit_open'] = gemini['circuit']['state'] != 'closed'
+    body = metrics.render({
+        "analysis_cache": analysis_cache.stats(),
+        "analysis_executor": analysis_executor.stats(),
+        "image_pipeline": image_pipeline.stats(),
+        "gemini": gemini,
+        "deadline": deadline.stats(),
+        "profiling": profiling.stats(),
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/leads")
+async def list_leads(
+    status: Optional[str] = None,
+    campaign: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    q: Optional[str] = None,
+    limit: int = lead_queries.DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    include_analysis: bool = False,
+    admin: str = Depends(require_admin)
+):
+    """
+    Paginated, filtered lead list for the Admin dashboard. Pass the returned
+    next_cursor back as cursor to get the following page.
+    """
+    filters = lead_queries.LeadFilters(
+        status=status, campaign=campaign, created_from=created_from, created_to=created_to,
+        min_score=min_score, max_score=max_score, search=q
+    )
+    try:
+        supabase = get_supabase()
+        changes_cursor = lead_queries.changes_cursor_now()
+        rows, next_cursor = await run_in_threadpool(
+            lead_queries.fetch_page, supabase, filters, min(limit, lead_queries.MAX_PAGE_SIZE), cursor,
+            lead_queries.select_columns(include_analysis)
+        )
+        # Starting point for /api/leads/changes, taken before the page was read
+        return {"leads": rows, "next_cursor": next_cursor, "changes_cursor": changes_cursor}
+    except lead_queries.InvalidCursor as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/leads/export")
+async def export_leads(
+    format: str = "csv",
+    columns: Optional[str] = None,
+    status: Optional[str] = None,
+    campaign: Optional[str] = None,
+    created_from: Optional[str] = None,
+    created_to: Optional[str] = None,
+    min_score: Optional[int] = None,
+    max_score: Optional[int] = None,
+    q: Optional[str] = None,
+    admin: str = Depends(require_admin)
+):
+    """
+    Stream every matching lead as CSV or NDJSON, paging through the table with
+    keyset cursors so memory stays flat however many rows there are. Same
+    filters as /api/leads; columns may include analysis_json.<field> paths.
+    """
+    if format not in ("csv", "ndjson"):
+        return JSONResponse(status_code=400, content={"error": "format must be csv or ndjson"})
+    try:
+        export_columns = lead_queries.parse_export_columns(columns)
+    except lead_queries.InvalidColumns as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+
+    filters = lead_queries.LeadFilters(
+        status=status, campaign=campaign, created_from=created_from, created_to=created_to,
+        min_score=min_score, max_score=max_score, search=q
+    )
+    rows = lead_queries.iter_export_rows(get_supabase(), filters, export_columns)
+    filename = f"leads-{time.strftime('%Y%m%d-%H%M%S')}.{format}"
+    if format == "csv":
+        body, media_type = lead_queries.stream_csv(rows, export_columns), "text/csv"
+    else:
+        body, media_type = lead_queries.stream_ndjson(rows), "application/x-ndjson"
+    # Sync generator: Starlette iterates it in a worker thread, one page at a time
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/leads/changes")
+async def lead_changes(
+    since: str,
+    limit: int = lead_queries.MAX_CHANGES_PAGE_SIZE,
+    admin: str = Depends(require_admin)
+):
+    """
+    Leads created or updated since a cursor (changes_cursor from /api/leads, or
+    next_cursor from the previous call), so the dashboard can patch its list
+    instead of reloading it. Keep calling while has_more is true.
+    """
+    try:
+        supabase = get_supabase()
+        rows, next_cursor, has_more = await run_in_threadpool(
+            lead_queries.fetch_changes, supabase, since, limit
+        )
+        return {"leads": rows, "next_cursor": next_cursor, "has_more": has_more}
+    except lead_queries.InvalidCursor as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except HTTPException:
+        raise
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.get("/api/stats")
+async def lead_stats(days: int = 30, admin: str = Depends(require_admin)):
+    """
+    Lead counts by webhook status, campaign, category and day (last `days`),
+    plus a score histogram, read from precomputed aggregates.
+    """
+    try:
+        supabase = get_supabase()
+        return await run_in_threadpool(lead_queries.fetch_stats, supabase, max(1, min(days, 366)))
+    except HTTPException:
+        raise
     except Exception as e:
         return JSONResponse(status_code=500, content={"error": str(e)})
 
@@ -284,6 +573,7 @@ class RetryRequest(BaseModel):
 
 class BulkRetryRequest(BaseModel):
     lead_ids: List[Any]
+    stream: bool = False
 
 def format_crm_payload(lead_record):
     """Format a Supabase lead record into the CRM-expected payload."""
@@ -293,13 +583,13 @@ def format_crm_payload(lead_record):
     gender_raw = lead_record.get('gender', '')
     
     payload = {
-        'campaign': lead_record.get('campaign', ''),
+        'campaign': lead_record.get('campaign') or '',
         'email': lead_record.get('email', ''),
         'telephone': lead_record.get('phone', ''),
         'address': address,
         'firstname': lead_record.get('first_name', ''),
         'lastname': lead_record.get('last_name', ''),
-        'image': lead_record.get('image_url', ''),
+        'image': lead_record.get('image_url') or '',
         'analyticsid': '',
         'age': str(lead_record.get('age', '')),
         'gender': 'M' if gender_raw == 'Male' else 'F',
@@ -309,35 +599,37 @@ def format_crm_payload(lead_record):
 
 @app.post("/api/retry_webhook")
 async def retry_webhook(req: RetryRequest):
-    print(f"[RETRY] Starting retry for lead_id={req.lead_id}")
+    log.info("Webhook retry started", lead_id=req.lead_id)
     try:
         supabase = get_supabase()
         webhook_url = os.getenv('CRM_WEBHOOK_URL')
-        print(f"[RETRY] Webhook URL configured: {bool(webhook_url)}")
         
         if not webhook_url:
             raise HTTPException(status_code=400, detail="CRM_WEBHOOK_URL not configured")
             
-        resp = supabase.table('leads').select('*').eq('id', req.lead_id).execute()
+        with metrics.stage('lead_lookup'):
+            resp = await run_in_threadpool(supabase.table('leads').select('*').eq('id', req.lead_id).execute)
         if not resp.data:
-            print(f"[RETRY] Lead not found: {req.lead_id}")
+            log.warning("Webhook retry: lead not found", lead_id=req.lead_id)
             raise HTTPException(status_code=404, detail="Lead not found")
              
         lead_record = resp.data[0]
         crm_payload = format_crm_payload(lead_record)
-        print(f"[RETRY] CRM payload: {json.dumps(crm_payload)}")
+        log.debug("Webhook retry payload", lead_id=req.lead_id, payload=crm_payload)
         
-        wb_resp = send_webhook(webhook_url, crm_payload)
+        wb_resp = await run_in_threadpool(send_webhook, webhook_url, crm_payload)
         
-        status = 'success' if wb_resp is not None and wb_resp.status_code < 300 else 'failed'
+        status = 'success' if is_success(wb_resp) else 'failed'
         resp_text = wb_resp.text if wb_resp is not None else "Connection failed"
-        print(f"[RETRY] Webhook result: status={status}, code={wb_resp.status_code if wb_resp is not None else 'N/A'}, response={resp_text[:200]}")
+        log.info("Webhook retry finished", lead_id=req.lead_id, webhook_status=status,
+                 code=wb_resp.status_code if wb_resp is not None else None, response=resp_text[:200])
         
-        supabase.table('leads').update({
-            'webhook_sent': True,
-            'webhook_status': status,
-            'webhook_response': resp_text[:500]
-        }).eq('id', req.lead_id).execute()
+        with metrics.stage('status_update'):
+            await run_in_threadpool(supabase.table('leads').update({
+                'webhook_sent': True,
+                'webhook_status': status,
+                'webhook_response': resp_text[:500]
+            }).eq('id', req.lead_id).execute)
         
         return {
             "status": "success", 
@@ -348,73 +640,83 @@ async def retry_webhook(req: RetryRequest):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[RETRY] ERROR: {str(e)}")
+        log.exception("Webhook retry failed", lead_id=req.lead_id, error=str(e))
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.post("/api/bulk_retry_webhook")
-async def bulk_retry_webhook(req: BulkRetryRequest):
-    print(f"[BULK_RETRY] Starting bulk retry for {len(req.lead_ids)} leads: {req.lead_ids}")
+async def bulk_retry_webhook(req: BulkRetryRequest, request: Request):
+    """
+    Retry webhooks for many leads concurrently. Streams NDJSON progress events
+    when the client asks for it (stream=true or Accept: application/x-ndjson),
+    otherwise returns the summary once all leads are done.
+    """
+    log.info("Bulk webhook retry started", leads=len(req.lead_ids))
     try:
         supabase = get_supabase()
         webhook_url = os.getenv('CRM_WEBHOOK_URL')
-        print(f"[BULK_RETRY] Webhook URL configured: {bool(webhook_url)}, URL: {webhook_url[:30] if webhook_url else 'None'}...")
         
         if not webhook_url:
             raise HTTPException(status_code=400, detail="CRM_WEBHOOK_URL not configured")
-        
-        results = []
-        success_count = 0
-        failed_count = 0
-        
-        for i, lead_id in enumerate(req.lead_ids):
-            print(f"[BULK_RETRY] Processing {i+1}/{len(req.lead_ids)}: lead_id={lead_id}")
-            try:
-                resp = supabase.table('leads').select('*').eq('id', lead_id).execute()
-                if not resp.data:
-                    print(f"[BULK_RETRY] Lead not found: {lead_id}")
-                    results.append({"id": lead_id, "status": "not_found"})
-                    failed_count += 1
-                    continue
-                
-                lead_record = resp.data[0]
-                crm_payload = format_crm_payload(lead_record)
-                print(f"[BULK_RETRY] Sending webhook for {lead_record.get('email', '?')}: {json.dumps(crm_payload)}")
-                
-                wb_resp = send_webhook(webhook_url, crm_payload)
-                
-                status = 'success' if wb_resp is not None and wb_resp.status_code < 300 else 'failed'
-                resp_text = wb_resp.text if wb_resp is not None else "Connection failed"
-                print(f"[BULK_RETRY] Result for {lead_id}: status={status}, code={wb_resp.status_code if wb_resp is not None else 'N/A'}, response={resp_text[:200]}")
-                
-                supabase.table('leads').update({
-                    'webhook_sent': True,
-                    'webhook_status': status,
-                    'webhook_response': resp_text[:500]
-                }).eq('id', lead_id).execute()
-                
-                results.append({"id": lead_id, "status": status, "response": resp_text[:100]})
-                if status == 'success':
-                    success_count += 1
-                else:
-                    failed_count += 1
-                    
-            except Exception as e:
-                print(f"[BULK_RETRY] ERROR for {lead_id}: {str(e)}")
-                results.append({"id": lead_id, "status": "error", "message": str(e)[:200]})
-                failed_count += 1
-        
-        print(f"[BULK_RETRY] Complete: {success_count} success, {failed_count} failed out of {len(req.lead_ids)}")
-        return {
-            "status": "success",
-            "total": len(req.lead_ids),
-            "success": success_count,
-            "failed": failed_count,
-            "results": results
-        }
+
+        events = webhook_dispatch.bulk_retry_events(supabase, webhook_url, req.lead_ids, format_crm_payload)
+
+        if req.stream or 'application/x-ndjson' in request.headers.get('accept', ''):
+            async def ndjson():
+                try:
+                    async for event in events:
+                        yield json.dumps(event, default=str) + "\n"
+                except Exception as e:
+                    log.exception("Bulk webhook retry failed", error=str(e))
+                    yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+            return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+        summary = None
+        async for event in events:
+            if event['type'] == 'summary':
+                summary = event
+        summary.pop('type')
+        return summary
     except HTTPException:
         raise
     except Exception as e:
-        print(f"[BULK_RETRY] FATAL ERROR: {str(e)}")
+        log.exception("Bulk webhook retry failed", error=str(e))
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+def _authorized_cron(request: Request):
+    """Vercel cron sends "Authorization: Bearer $CRON_SECRET" when CRON_SECRET is set."""
+    secret = os.getenv('CRON_SECRET')
+    return not secret or request.headers.get('authorization') == f"Bearer {secret}"
+
+@app.api_route("/api/outbox/drain", methods=["GET", "POST"])
+async def drain_outbox(request: Request, limit: int = outbox.OUTBOX_BATCH_SIZE):
+    """Deliver pending CRM webhook and email jobs. Invoked by cron (see vercel.json)."""
+    if not _authorized_cron(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        supabase = get_supabase()
+        summary = await run_in_threadpool(outbox.drain, supabase, limit=min(max(limit, 1), 200))
+        return {"status": "success", **summary}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Outbox drain failed", error=str(e))
+        return JSONResponse(status_code=500, content={"error": str(e)})
+
+@app.api_route("/api/staging/sweep", methods=["GET", "POST"])
+async def sweep_staged_images(request: Request, max_age_hours: Optional[float] = None):
+    """Delete old staged analysis images that never became a lead. Invoked by cron (see vercel.json)."""
+    if not _authorized_cron(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    try:
+        supabase = get_supabase()
+        hours = max(max_age_hours if max_age_hours is not None else image_staging.STAGED_IMAGE_RETENTION_HOURS, 1)
+        summary = await run_in_threadpool(image_staging.sweep_staged_images, supabase, hours)
+        log.info("Staged image sweep complete", **summary)
+        return {"status": "success", **summary}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("Staged image sweep failed", error=str(e))
         return JSONResponse(status_code=500, content={"error": str(e)})
 
 @app.get("/api/test_webhook")
@@ -423,9 +725,6 @@ async def test_webhook_connection():
     Test endpoint to verify CRM webhook connectivity from Vercel's serverless environment.
     Returns detailed diagnostic information about the connection attempt.
     """
-    import time
-    import requests
-    
     webhook_url = os.getenv('CRM_WEBHOOK_URL')
     
     if not webhook_url:
@@ -450,44 +749,25 @@ async def test_webhook_connection():
     }
     
     start_time = time.time()
-    error_details = None
-    response_data = None
-    status_code = None
-    
-    try:
-        headers = {
-            'Content-Type': 'application/json',
-            'User-Agent': 'ModelScanner-Test/1.0'
-        }
-        response = requests.post(webhook_url, json=test_payload, headers=headers, timeout=10)
-        elapsed_time = time.time() - start_time
-        status_code = response.status_code
-        response_data = response.text[:500]  # Limit response size
-        
+    wb_resp = await run_in_threadpool(send_webhook, webhook_url, test_payload, user_agent='ModelScanner-Test/1.0')
+    elapsed_time = time.time() - start_time
+
+    if wb_resp.status_code:
+        status_code = wb_resp.status_code
         return {
             "status": "success" if status_code < 300 else "failed",
             "webhook_url": webhook_url,
             "status_code": status_code,
             "response_time_seconds": round(elapsed_time, 2),
-            "response_preview": response_data,
+            "timing": wb_resp.timing,
+            "response_preview": wb_resp.text[:500],  # Limit response size
             "message": "Connection successful" if status_code < 300 else f"HTTP {status_code} error"
         }
-        
-    except requests.exceptions.Timeout:
-        elapsed_time = time.time() - start_time
-        error_details = f"Timeout after {round(elapsed_time, 2)} seconds"
-    except requests.exceptions.ConnectionError as e:
-        error_details = f"Connection Error: {str(e)[:300]}"
-    except requests.exceptions.SSLError as e:
-        error_details = f"SSL Error: {str(e)[:300]}"
-    except requests.exceptions.RequestException as e:
-        error_details = f"Request Error: {str(e)[:300]}"
-    except Exception as e:
-        error_details = f"Unexpected Error: {str(e)[:300]}"
     
     return {
         "status": "error",
         "webhook_url": webhook_url,
-        "error": error_details,
+        "error": wb_resp.text[:300],
+        "timing": wb_resp.timing,
         "message": "Failed to connect to CRM server from Vercel"
     }
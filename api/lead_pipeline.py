@@ -0,0 +1,169 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import metrics
+from logs import get_logger
+
+log = get_logger('pipeline')
+
+# Per-stage time limits for create_lead (seconds)
+LEAD_UPLOAD_TIMEOUT = float(os.getenv('LEAD_UPLOAD_TIMEOUT', '20'))
+LEAD_PERSIST_TIMEOUT = float(os.getenv('LEAD_PERSIST_TIMEOUT', '10'))
+
+LEAD_IMAGE_BUCKET = 'lead-images'
+
+
+class Stage:
+    """
+    One step of a pipeline. run is an async callable taking the results of the
+    stages it runs after; cleanup (optional, async) undoes its effect if another
+    stage fails and is called with this stage's result and that failure.
+    """
+    def __init__(self, name, run, after=(), timeout=None, cleanup=None):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+        self.timeout = timeout
+        self.cleanup = cleanup
+
+
+class StageFailed(Exception):
+    """Raised by run_stages with the first failing stage and what did succeed."""
+    def __init__(self, stage, error, results):
+        super().__init__(f"{stage} stage failed: {error}")
+        self.stage = stage
+        self.error = error
+        self.results = results
+
+
+class StageSkipped(Exception):
+    pass
+
+
+async def run_stages(stages, label='pipeline'):
+    """
+    Run a stage graph: every stage starts as soon as the stages it comes after
+    have finished, so independent stages overlap. If any stage fails or times
+    out, the cleanup of each stage that did succeed runs (in reverse order)
+    before StageFailed is raised. Returns {stage name: result}.
+    """
+    tasks = {}
+    timings = {}
+    started = time.perf_counter()
+
+    async def execute(stage):
+        inputs = {}
+        for dependency in stage.after:
+            try:
+                inputs[dependency] = await tasks[dependency]
+            except Exception:
+                raise StageSkipped(f"{dependency} did not complete")
+        stage_started = time.perf_counter()
+        try:
+            if stage.timeout:
+                return await asyncio.wait_for(stage.run(inputs), stage.timeout)
+            return await stage.run(inputs)
+        finally:
+            timings[stage.name] = round((time.perf_counter() - stage_started) * 1000, 2)
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(execute(stage))
+    outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+    results, failure = {}, None
+    for stage, outcome in zip(stages, outcomes):
+        if not isinstance(outcome, BaseException):
+            results[stage.name] = outcome
+        elif failure is None and not isinstance(outcome, StageSkipped):
+            error = outcome
+            if isinstance(outcome, asyncio.TimeoutError):
+                error = TimeoutError(f"timed out after {stage.timeout}s")
+            failure = (stage.name, error)
+
+    if failure:
+        for stage in reversed(stages):
+            if stage.cleanup and stage.name in results:
+                try:
+                    await stage.cleanup(results[stage.name], failure[1])
+                except Exception as e:
+                    log.error("Stage cleanup failed", pipeline=label, stage=stage.name, error=str(e))
+
+    timings['total'] = round((time.perf_counter() - started) * 1000, 2)
+    if failure:
+        log.warning("Pipeline failed", pipeline=label, stage=failure[0], error=str(failure[1]), timings_ms=timings)
+    else:
+        log.info("Pipeline complete", pipeline=label, timings_ms=timings)
+    if failure:
+        raise StageFailed(failure[0], failure[1], results)
+    return results
+
+
+class DuplicateLead(Exception):
+    pass
+
+
+def write_rejected(error):
+    """
+    True only when a failed write definitely stored nothing: a duplicate, or an
+    error answer from PostgREST itself (it rolls the request's transaction back
+    on any error it reports). Timeouts, dropped connections and gateway errors
+    may have committed: a timed-out stage's thread keeps running, since
+    wait_for can't stop run_in_threadpool work.
+    """
+    if isinstance(error, DuplicateLead):
+        return True
+    from postgrest.exceptions import APIError
+    if not isinstance(error, APIError):
+        return False
+    # supabase-py puts the HTTP status in code when the body wasn't PostgREST
+    # JSON (a proxy or gateway answered); only a 4xx there means "not processed"
+    if isinstance(error.code, int):
+        return 400 <= error.code < 500
+    return True
+
+
+def lead_image_path(email, image_bytes, mime_type):
+    """
+    Deterministic object name (email + content hash), so the image URL is known
+    before the upload finishes and the lead can be inserted in parallel.
+    """
+    clean_email = email.replace('@', '-at-').replace('.', '-')
+    extension = '.png' if mime_type == 'image/png' else '.jpeg'
+    return f"{clean_email}_{hashlib.sha256(image_bytes).hexdigest()[:16]}{extension}"
+
+
+def upload_lead_image(supabase, path, image_bytes, mime_type):
+    """Upload to the lead-images bucket. Returns False if the object already existed."""
+    try:
+        with metrics.stage('storage_upload'):
+            supabase.storage.from_(LEAD_IMAGE_BUCKET).upload(
+                path=path,
+                file=image_bytes,
+                file_options={"content-type": mime_type}
+            )
+    except Exception as e:
+        # Same person, same photo: the object is already there (and may belong
+        # to an existing lead, so it must not be cleaned up as ours)
+        if 'Duplicate' in str(e) or 'already exists' in str(e):
+            return False
+        raise
+    return True
+
+
+def remove_lead_image(supabase, path):
+    supabase.storage.from_(LEAD_IMAGE_BUCKET).remove([path])
+
+
+def mark_upload_failed(supabase, lead_id, error):
+    """Keep the lead for the admin, but stop its queued webhook/email from going out."""
+    message = f"Image Upload Error: {str(error)}"
+    supabase.table('leads').update({
+        'webhook_status': 'upload_failed',
+        'webhook_response': message
+    }).eq('id', lead_id).execute()
+    supabase.table('lead_outbox').update({
+        'status': 'dead',
+        'last_error': message[:500]
+    }).eq('lead_id', lead_id).eq('status', 'pending').execute()
@@ -0,0 +1,268 @@
+import base64
+import csv
+import io
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+
+# Everything the admin table shows; analysis_json (the large Gemini blob) is opt-in
+LIST_COLUMNS = [
+    'id', 'created_at', 'first_name', 'last_name', 'age', 'gender', 'email', 'phone',
+    'city', 'zip_code', 'campaign', 'wants_assessment', 'score', 'category', 'image_url',
+    'webhook_sent', 'webhook_status', 'webhook_response', 'updated_at',
+]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# The change feed re-sends this much recent history on every poll, so a write
+# that commits slightly after a later-stamped one is never skipped
+LEAD_CHANGES_OVERLAP_SECONDS = float(os.getenv('LEAD_CHANGES_OVERLAP_SECONDS', '5'))
+MAX_CHANGES_PAGE_SIZE = 500
+
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class LeadFilters:
+    """Server-side filters shared by the lead list and export endpoints."""
+    def __init__(self, status=None, campaign=None, created_from=None, created_to=None,
+                 min_score=None, max_score=None, search=None):
+        # status: comma-separated webhook_status values
+        self.statuses = [s.strip() for s in (status or '').split(',') if s.strip()]
+        self.campaign = campaign or None
+        self.created_from = created_from or None
+        self.created_to = created_to or None
+        self.min_score = min_score
+        self.max_score = max_score
+        self.search = (search or '').strip() or None
+
+    def apply(self, query):
+        if self.statuses:
+            query = query.in_('webhook_status', self.statuses)
+        if self.campaign:
+            query = query.eq('campaign', self.campaign)
+        if self.created_from:
+            query = query.gte('created_at', self.created_from)
+        if self.created_to:
+            query = query.lt('created_at', self.created_to)
+        if self.min_score is not None:
+            query = query.gte('score', self.min_score)
+        if self.max_score is not None:
+            query = query.lte('score', self.max_score)
+        if self.search:
+            pattern = _quoted_ilike_pattern(self.search)
+            query = query.or_(
+                f"first_name.ilike.{pattern},last_name.ilike.{pattern},email.ilike.{pattern}"
+            )
+        return query
+
+
+def _quoted_ilike_pattern(text):
+    """
+    Substring ilike pattern for a PostgREST or=() expression, double-quoted so
+    commas, dots, parentheses and quotes in the search text stay part of the
+    value. LIKE wildcards in the text are escaped so they match literally.
+    PostgREST turns every * into % before escapes apply (so \\* would mean a
+    literal %); a * in the text becomes _ instead, matching it as any one character.
+    """
+    like = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_').replace('*', '_')
+    quoted = like.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"*{quoted}*"'
+
+
+def _encode_position(timestamp, lead_id):
+    raw = json.dumps({'c': timestamp, 'i': lead_id}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def encode_cursor(row):
+    return _encode_position(row['created_at'], row['id'])
+
+
+def decode_cursor(cursor):
+    """Opaque cursor -> (timestamp, id) of the last row already returned."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw)
+        return str(position['c']), int(position['i'])
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def select_columns(include_analysis=False, columns=None):
+    selected = list(columns or LIST_COLUMNS)
+    if include_analysis and 'analysis_json' not in selected:
+        selected.append('analysis_json')
+    return ','.join(selected)
+
+
+def fetch_page(supabase, filters, limit=DEFAULT_PAGE_SIZE, cursor=None, columns=None):
+    """
+    One page of leads, newest first, using keyset pagination on
+    (created_at, id): the cursor marks the last row seen, so every page is an
+    index range scan instead of an OFFSET that re-reads all earlier rows.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, limit)
+    query = filters.apply(supabase.table('leads').select(columns or select_columns()))
+    if cursor:
+        created_at, lead_id = decode_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{lead_id})'
+        )
+    # One extra row tells us whether another page exists
+    rows = query.order('created_at', desc=True).order('id', desc=True).limit(limit + 1).execute().data or []
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def _parse_timestamp(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def changes_cursor_now():
+    """Change-feed cursor for "everything from now on" (minus the overlap window)."""
+    since = datetime.now(timezone.utc) - timedelta(seconds=LEAD_CHANGES_OVERLAP_SECONDS)
+    return _encode_position(since.isoformat(), 0)
+
+
+def fetch_changes(supabase, cursor, limit=MAX_CHANGES_PAGE_SIZE, columns=None):
+    """
+    Leads created or updated after the cursor, oldest change first, for
+    patching a client-side list. Returns (rows, next_cursor, has_more). Once
+    caught up, next_cursor trails the clock by the overlap window, so the next
+    poll may repeat a few rows - merging by id makes that harmless.
+    """
+    limit = max(1, min(limit, MAX_CHANGES_PAGE_SIZE))
+    updated_at, lead_id = decode_cursor(cursor)
+    rows = supabase.table('leads').select(columns or select_columns()).or_(
+        f'updated_at.gt."{updated_at}",and(updated_at.eq."{updated_at}",id.gt.{lead_id})'
+    ).order('updated_at').order('id').limit(limit + 1).execute().data or []
+
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        return rows, _encode_position(last['updated_at'], last['id']), True
+
+    # Caught up: restart the next poll from now minus the overlap window, but
+    # never from earlier than where this poll started
+    now_cursor = changes_cursor_now()
+    if _parse_timestamp(decode_cursor(now_cursor)[0]) > _parse_timestamp(updated_at):
+        return rows, now_cursor, False
+    return rows, cursor, False
+
+
+# Rows per keyset page while exporting (PostgREST's default max-rows)
+EXPORT_PAGE_SIZE = 1000
+EXPORTABLE_COLUMNS = LIST_COLUMNS + ['analysis_json']
+# Spreadsheet apps execute cells starting with these; phone numbers like "+1 555" are left alone
+_FORMULA_PREFIX = re.compile(r'^(?:[=@\t\r]|[+\-](?![\d\s().\-]*$))')
+
+
+class InvalidColumns(ValueError):
+    pass
+
+
+def parse_export_columns(spec):
+    """
+    Comma-separated export columns. Dotted names reach into analysis_json,
+    e.g. analysis_json.market_categorization.primary.
+    """
+    columns = [c.strip() for c in (spec or '').split(',') if c.strip()] or list(LIST_COLUMNS)
+    for column in columns:
+        if column.split('.', 1)[0] not in EXPORTABLE_COLUMNS or (
+                '.' in column and not column.startswith('analysis_json.')):
+            raise InvalidColumns(f"Unknown export column: {column}")
+    return columns
+
+
+def _export_select(columns):
+    # created_at and id are always fetched: the keyset cursor needs them
+    base = {'created_at', 'id'} | {c.split('.', 1)[0] for c in columns}
+    return ','.join(c for c in EXPORTABLE_COLUMNS if c in base)
+
+
+def _column_value(row, column):
+    value = row
+    for part in column.split('.'):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+def _flatten(row, columns):
+    return {column: _column_value(row, column) for column in columns}
+
+
+def iter_export_rows(supabase, filters, columns, page_size=EXPORT_PAGE_SIZE):
+    """Every matching lead, page by page via the keyset cursor; only one page is held in memory."""
+    select = _export_select(columns)
+    cursor = None
+    while True:
+        rows, cursor = fetch_page(supabase, filters, page_size, cursor, select)
+        for row in rows:
+            yield _flatten(row, columns)
+        if not cursor:
+            return
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    value = str(value)
+    return "'" + value if _FORMULA_PREFIX.match(value) else value
+
+
+def stream_csv(rows, columns):
+    """Yield CSV text in chunks of up to ~500 rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for i, row in enumerate(rows, 1):
+        writer.writerow([_csv_cell(row[column]) for column in columns])
+        if i % 500 == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, default=str) + "\n"
+
+
+STATS_TABLE = 'lead_stats'
+_STATS_KEYS = {
+    'webhook_status': 'by_status',
+    'campaign': 'by_campaign',
+    'category': 'by_category',
+    'day': 'by_day',
+    'score_bucket': 'score_histogram',
+}
+
+
+def fetch_stats(supabase, days=30):
+    """
+    Dashboard summary from the trigger-maintained lead_stats table: a few
+    dozen counter rows regardless of how many leads exist.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).date().isoformat()
+    rows = supabase.table(STATS_TABLE).select('dimension,bucket,lead_count').or_(
+        f"dimension.neq.day,bucket.gte.{since}"
+    ).execute().data or []
+
+    stats = {'total': 0, **{key: {} for key in _STATS_KEYS.values()}}
+    for row in rows:
+        if row['lead_count'] <= 0:
+            continue
+        if row['dimension'] == 'total':
+            stats['total'] = row['lead_count']
+        elif row['dimension'] in _STATS_KEYS:
+            stats[_STATS_KEYS[row['dimension']]][row['bucket']] = row['lead_count']
+    stats['by_day'] = dict(sorted(stats['by_day'].items()))
+    return stats
@@ -0,0 +1,83 @@
+import re
+
+import metrics
+from logs import get_logger
+from outbox import enqueue_jobs
+from supabase_client import rpc_missing
+
+log = get_logger('lead')
+
+# Must match the generated email_key/phone_key columns in
+# supabase/migrations/20261018000400_lead_dedupe_keys.sql
+PHONE_KEY_DIGITS = 10
+
+
+def normalize_email(email):
+    """Dedupe key for an email: trimmed and lower-cased, None if blank."""
+    key = (email or '').strip().lower()
+    return key or None
+
+
+def normalize_phone(phone):
+    """
+    Dedupe key for a phone number: digits only, last 10 kept so "+1 (555)
+    010-2030" and "555.010.2030" collide. None if there are no digits.
+    """
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-PHONE_KEY_DIGITS:] or None
+
+
+def insert_lead(supabase, lead_record, jobs=None):
+    """
+    Insert a lead and its outbox jobs in one round trip through the insert_lead
+    RPC. The unique email_key/phone_key indexes make the duplicate check atomic,
+    so concurrent submits of the same person can't both get in.
+    Returns (lead_id, duplicate).
+    """
+    try:
+        with metrics.stage('insert'):
+            result = supabase.rpc('insert_lead', {'lead': lead_record, 'jobs': jobs or []}).execute()
+    except Exception as e:
+        # Anything else (timeouts included) may have committed: retrying as a
+        # select + insert would report a saved lead as a duplicate
+        if not rpc_missing(e):
+            raise
+        log.warning("insert_lead RPC not deployed, falling back to select + insert", error=str(e))
+        return _insert_lead_fallback(supabase, lead_record, jobs)
+
+    data = result.data
+    if isinstance(data, list) and len(data) == 1:
+        data = data[0]
+    if isinstance(data, dict) and data.get('duplicate') is True:
+        metrics.count('lead_duplicate')
+        return None, True
+    if not isinstance(data, dict) or data.get('duplicate') is not False or data.get('id') is None:
+        # Not knowing whether the row was written is not a duplicate
+        raise Exception(f"Unexpected insert_lead response: {str(data)[:200]}")
+    return data['id'], False
+
+
+def _insert_lead_fallback(supabase, lead_record, jobs):
+    """Pre-migration path: racy select-then-insert, kept so deploys don't break."""
+    email, phone = lead_record.get('email'), lead_record.get('phone')
+    with metrics.stage('dedupe'):
+        existing = supabase.table('leads').select('id').or_(f"email.eq.{email},phone.eq.{phone}").execute()
+    if existing.data:
+        metrics.count('lead_duplicate')
+        return None, True
+
+    with metrics.stage('insert'):
+        result = supabase.table('leads').insert(lead_record).execute()
+    if not result.data:
+        raise Exception("Insert failed")
+    lead_id = result.data[0]['id']
+    if jobs:
+        try:
+            enqueue_jobs(supabase, lead_id, jobs)
+        except Exception as e:
+            log.error("Outbox enqueue failed", lead_id=lead_id, error=str(e))
+            supabase.table('leads').update({
+                'webhook_status': 'failed',
+                'webhook_response': f"Outbox enqueue failed: {str(e)[:200]}"
+            }).eq('id', lead_id).execute()
+    return lead_id, False
@@ -0,0 +1,114 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+# DEBUG, INFO, WARNING or ERROR
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+# Share of DEBUG/INFO records kept (0-1); warnings and errors are never dropped
+LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1'))
+# "json" (one object per line, for log drains) or "text" (readable local output)
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+
+_ROOT = 'model_scanner'
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+
+def set_request_id(request_id):
+    """Tag every record logged by the current request; returns a token for reset_request_id."""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class _SamplingFilter(logging.Filter):
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or LOG_SAMPLE_RATE >= 1:
+            return True
+        return random.random() < LOG_SAMPLE_RATE
+
+
+class _JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname.lower(),
+            'logger': record.name[len(_ROOT) + 1:] or record.name,
+            'msg': record.getMessage(),
+        }
+        request_id = _request_id.get()
+        if request_id:
+            entry['request_id'] = request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record):
+        fields = getattr(record, 'fields', None) or {}
+        line = f"[{record.name[len(_ROOT) + 1:].upper()}] {record.levelname} {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def _configure():
+    root = logging.getLogger(_ROOT)
+    if root.handlers:
+        return root
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(_TextFormatter() if LOG_FORMAT == 'text' else _JSONFormatter())
+    handler.addFilter(_SamplingFilter())
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    # Vercel collects stdout; don't also pass records to the root logger
+    root.propagate = False
+    return root
+
+
+class StructuredLogger:
+    """
+    logging.Logger with keyword fields: log.info("Lead stored", lead_id=12)
+    becomes {"level": "info", "logger": "lead", "msg": "Lead stored", "lead_id": 12}.
+    """
+
+    def __init__(self, name):
+        _configure()
+        self._logger = logging.getLogger(f"{_ROOT}.{name}")
+
+    def _log(self, level, msg, fields, exc_info=False):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, msg, exc_info=exc_info, extra={'fields': fields})
+
+    def debug(self, msg, **fields):
+        self._log(logging.DEBUG, msg, fields)
+
+    def info(self, msg, **fields):
+        self._log(logging.INFO, msg, fields)
+
+    def warning(self, msg, **fields):
+        self._log(logging.WARNING, msg, fields)
+
+    def error(self, msg, **fields):
+        self._log(logging.ERROR, msg, fields)
+
+    def exception(self, msg, **fields):
+        """Error with the current exception's traceback attached."""
+        self._log(logging.ERROR, msg, fields, exc_info=True)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
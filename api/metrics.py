@@ -0,0 +1,224 @@
+import contextvars
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from logs import reset_request_id, set_request_id
+
+METRICS_PREFIX = 'model_scanner'
+# Seconds; covers a 5ms cache hit up to the 60s function limit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+# Add a Server-Timing header with the stage breakdown to API responses
+SERVER_TIMING = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+
+# Stage timings of the current request: list of (stage, seconds)
+_request_stages = contextvars.ContextVar('request_stages', default=None)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # labels -> [bucket counts..., sum, count]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    labels = _format_labels(key + (('le', _format_value(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series[-2]!r}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series[-1]}")
+        return lines
+
+
+http_requests = Counter(f"{METRICS_PREFIX}_http_requests_total", "HTTP requests by route, method and status.",
+                        ('route', 'method', 'status'))
+http_duration = Histogram(f"{METRICS_PREFIX}_http_request_duration_seconds", "Time to the response headers.",
+                          ('route', 'method'))
+stage_duration = Histogram(f"{METRICS_PREFIX}_stage_duration_seconds", "Duration of instrumented stages.",
+                           ('stage', 'outcome'))
+stage_errors = Counter(f"{METRICS_PREFIX}_stage_errors_total", "Instrumented stages that raised.", ('stage',))
+events = Counter(f"{METRICS_PREFIX}_events_total", "Notable events (duplicates, fallbacks, retries...).",
+                 ('event',))
+_METRICS = [http_requests, http_duration, stage_duration, stage_errors, events]
+
+
+def record_stage(name, seconds, outcome='ok'):
+    stage_duration.observe(seconds, stage=name, outcome=outcome)
+    if outcome == 'error':
+        stage_errors.inc(stage=name)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as a named stage: feeds the stage histogram and, inside a
+    request, that response's Server-Timing header. Works in worker threads
+    that run with the request's context (run_in_threadpool, AnalysisExecutor).
+    """
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        record_stage(name, time.perf_counter() - started, outcome)
+
+
+def count(event, amount=1):
+    events.inc(amount, event=event)
+
+
+def server_timing(stages, total=None):
+    """Server-Timing value: one entry per stage name (repeats summed), plus the total."""
+    merged = {}
+    for name, seconds in stages:
+        merged[name] = merged.get(name, 0.0) + seconds
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in merged.items()]
+    if total is not None:
+        parts.append(f"total;dur={total * 1000:.1f}")
+    return ', '.join(parts)
+
+
+def _route_label(scope):
+    # Route template (e.g. /api/staged_image/{token}) keeps label cardinality bounded
+    route = scope.get('route')
+    path = getattr(route, 'path', None)
+    return path or 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: gives each request a stage list and a request id,
+    adds Server-Timing to the response headers and records request metrics.
+    Timings are taken when the headers go out, so a streamed body's time is
+    not included.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        stages = []
+        stages_token = _request_stages.set(stages)
+        request_id = dict(scope.get('headers') or []).get(b'x-request-id', b'').decode() or uuid.uuid4().hex[:16]
+        request_token = set_request_id(request_id)
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                elapsed = time.perf_counter() - started
+                http_duration.observe(elapsed, route=_route_label(scope), method=scope['method'])
+                headers = list(message.get('headers') or [])
+                headers.append((b'x-request-id', request_id.encode()))
+                if SERVER_TIMING:
+                    headers.append((b'server-timing', server_timing(stages, elapsed).encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            http_requests.inc(route=_route_label(scope), method=scope['method'], status=status)
+            _request_stages.reset(stages_token)
+            reset_request_id(request_token)
+
+
+def _gauge_lines(name, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {_format_value(value)}"]
+
+
+def render(gauges=None):
+    """
+    Prometheus text exposition of every metric in this process. gauges maps
+    component -> flat stats dict (e.g. analysis_cache.stats()); numeric values
+    are exported as model_scanner_<component>_<key>.
+    """
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for component, values in (gauges or {}).items():
+        for key, value in sorted(_flatten(values).items()):
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                lines.extend(_gauge_lines(f"{METRICS_PREFIX}_{component}_{key}", f"{component} {key}", value))
+    return '\n'.join(lines) + '\n'
+
+
+def _flatten(values, prefix=''):
+    flat = {}
+    for key, value in values.items():
+        name = f"{prefix}{key}".replace('-', '_').replace('.', '_')
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}_"))
+        else:
+            flat[name] = value
+    return flat
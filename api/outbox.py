@@ -0,0 +1,250 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, as_completed
+from datetime import datetime, timedelta, timezone
+
+from webhook_utils import send_webhook, is_success, WEBHOOK_CONNECT_TIMEOUT, WEBHOOK_READ_TIMEOUT
+import email_utils
+import metrics
+from logs import get_logger
+from supabase_client import rpc_missing
+
+log = get_logger('outbox')
+
+OUTBOX_TABLE = 'lead_outbox'
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '6'))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv('OUTBOX_BACKOFF_BASE_SECONDS', '30'))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv('OUTBOX_BACKOFF_MAX_SECONDS', '3600'))
+# A job stuck in "processing" longer than this is assumed abandoned and reclaimed
+OUTBOX_LOCK_TIMEOUT_SECONDS = float(os.getenv('OUTBOX_LOCK_TIMEOUT_SECONDS', '300'))
+# Jobs claimed per drain, and webhooks delivered in parallel within one drain
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '20'))
+OUTBOX_CONCURRENCY = int(os.getenv('OUTBOX_CONCURRENCY', '5'))
+# Wall-clock budget of one drain, well under the function's maxDuration (60s in
+# vercel.json): jobs not started in time go back to pending instead of being
+# cut off mid-send and resent after the lock timeout
+OUTBOX_DRAIN_BUDGET_SECONDS = float(os.getenv('OUTBOX_DRAIN_BUDGET_SECONDS', '40'))
+
+# Longest a single webhook attempt can take (connect + read timeouts)
+WEBHOOK_WORST_CASE_SECONDS = WEBHOOK_CONNECT_TIMEOUT + WEBHOOK_READ_TIMEOUT
+
+KIND_WEBHOOK = 'webhook'
+KIND_EMAIL = 'email'
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def backoff_delay(attempts):
+    """Exponential backoff with +/-20% jitter so failed jobs don't retry in lockstep."""
+    delay = min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def build_job(kind, payload):
+    return {'kind': kind, 'payload': payload}
+
+
+def enqueue_jobs(supabase, lead_id, jobs):
+    """Persist delivery jobs for a lead. Delivery happens later in drain()."""
+    if not jobs:
+        return []
+    now = _now().isoformat()
+    rows = [{
+        'lead_id': lead_id,
+        'kind': job['kind'],
+        'payload': job['payload'],
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+    } for job in jobs]
+    result = supabase.table(OUTBOX_TABLE).insert(rows).execute()
+    return result.data or []
+
+
+def _claim(supabase, job):
+    """
+    Pre-migration claim: an optimistic update that only matches if nobody
+    changed the job's status/attempts/locked_at since we read it. Without row
+    locks a slow drain can still lose a race it doesn't notice; the
+    claim_outbox_jobs RPC is the safe path.
+    """
+    query = supabase.table(OUTBOX_TABLE).update({
+        'status': 'processing',
+        'locked_at': _now().isoformat()
+    }).eq('id', job['id']).eq('status', job['status']).eq('attempts', job['attempts'])
+    # A stale "processing" row keeps its status and attempts when reclaimed; the
+    # lock timestamp is what tells two drains apart
+    if job.get('locked_at') is None:
+        query = query.is_('locked_at', 'null')
+    else:
+        query = query.eq('locked_at', job['locked_at'])
+    return bool(query.execute().data)
+
+
+def _claim_fallback(supabase, limit, lead_id, kinds):
+    now = _now()
+    stale = (now - timedelta(seconds=OUTBOX_LOCK_TIMEOUT_SECONDS)).isoformat()
+    query = supabase.table(OUTBOX_TABLE).select('*').or_(
+        f"and(status.eq.pending,next_attempt_at.lte.{now.isoformat()}),"
+        f"and(status.eq.processing,locked_at.lt.{stale})"
+    )
+    if lead_id is not None:
+        query = query.eq('lead_id', lead_id)
+    if kinds:
+        query = query.in_('kind', list(kinds))
+    candidates = query.order('next_attempt_at').limit(limit).execute().data or []
+    return [job for job in candidates if _claim(supabase, job)]
+
+
+def claim_due_jobs(supabase, limit=OUTBOX_BATCH_SIZE, lead_id=None, kinds=None):
+    """
+    Lock up to `limit` due jobs (pending and due, or stuck in processing past
+    the lock timeout) for this drain through the claim_outbox_jobs RPC, which
+    uses FOR UPDATE SKIP LOCKED so concurrent drains never share a job.
+    """
+    try:
+        result = supabase.rpc('claim_outbox_jobs', {
+            'max_jobs': limit,
+            'lock_timeout_seconds': OUTBOX_LOCK_TIMEOUT_SECONDS,
+            'only_lead': lead_id,
+            'only_kinds': list(kinds) if kinds else None,
+        }).execute()
+    except Exception as e:
+        if not rpc_missing(e):
+            raise
+        log.warning("claim_outbox_jobs RPC not deployed, falling back to optimistic claims", error=str(e))
+        return _claim_fallback(supabase, limit, lead_id, kinds)
+    return result.data or []
+
+
+def release_job(supabase, job):
+    """Hand a claimed job that was never attempted back to the queue, attempts unchanged."""
+    supabase.table(OUTBOX_TABLE).update({
+        'status': 'pending',
+        'locked_at': None
+    }).eq('id', job['id']).eq('status', 'processing').execute()
+
+
+def _deliver(job):
+    """Returns (ok, response_text)."""
+    if job['kind'] == KIND_WEBHOOK:
+        webhook_url = os.getenv('CRM_WEBHOOK_URL')
+        if not webhook_url:
+            return False, 'CRM_WEBHOOK_URL not set'
+        wb_resp = send_webhook(webhook_url, job['payload'])
+        ok = is_success(wb_resp)
+        return ok, (wb_resp.text if wb_resp is not None else 'Connection failed')
+    return False, f"Unknown job kind: {job['kind']}"
+
+
+def _record_result(supabase, job, ok, resp_text):
+    attempts = job['attempts'] + 1
+    update = {'attempts': attempts, 'last_error': None if ok else resp_text[:500], 'locked_at': None}
+    if ok:
+        update['status'] = 'done'
+    elif attempts >= OUTBOX_MAX_ATTEMPTS:
+        update['status'] = 'dead'
+    else:
+        update['status'] = 'pending'
+        update['next_attempt_at'] = (_now() + timedelta(seconds=backoff_delay(attempts))).isoformat()
+    supabase.table(OUTBOX_TABLE).update(update).eq('id', job['id']).execute()
+
+    if job['kind'] == KIND_WEBHOOK:
+        if ok:
+            lead_status = 'success'
+        elif update['status'] == 'dead':
+            lead_status = 'failed'
+        else:
+            lead_status = 'retrying'
+            resp_text = f"Attempt {attempts}/{OUTBOX_MAX_ATTEMPTS} failed: {resp_text}"
+        supabase.table('leads').update({
+            'webhook_sent': True,
+            'webhook_status': lead_status,
+            'webhook_response': resp_text[:500]
+        }).eq('id', job['lead_id']).execute()
+    return update['status']
+
+
+def default_kinds():
+    """
+    Job kinds to deliver right after a lead is created. In email digest mode
+    emails are left for the cron drain, which batches them into digests.
+    """
+    return [KIND_WEBHOOK] if email_utils.digest_enabled() else None
+
+
+def _record(supabase, job, ok, resp_text):
+    """_record_result for one job; returns the summary key it counts under."""
+    try:
+        with metrics.stage('status_update'):
+            status = _record_result(supabase, job, ok, resp_text)
+        return 'retrying' if status == 'pending' else status
+    except Exception as e:
+        # Job stays "processing" and is reclaimed after the lock timeout
+        log.error("Failed to record job result", job_id=job['id'], error=str(e))
+        return 'errors'
+
+
+def _release(supabase, job):
+    try:
+        release_job(supabase, job)
+        return 'released'
+    except Exception as e:
+        log.error("Failed to release job", job_id=job['id'], error=str(e))
+        return 'errors'
+
+
+def drain(supabase, limit=OUTBOX_BATCH_SIZE, lead_id=None, kinds=None, budget=OUTBOX_DRAIN_BUDGET_SECONDS):
+    """
+    Deliver due outbox jobs (optionally only those of one lead or kind). Safe
+    to run from several workers/cron invocations at once.
+
+    Webhooks go out OUTBOX_CONCURRENCY at a time and each result is written as
+    soon as its delivery finishes, so a drain killed at maxDuration loses at
+    most the jobs in flight. No delivery starts once it could overrun `budget`
+    seconds; those jobs are released for the next drain.
+    """
+    deadline = time.monotonic() + budget
+    summary = {'claimed': 0, 'done': 0, 'retrying': 0, 'dead': 0, 'released': 0, 'unconfirmed': 0, 'errors': 0}
+    jobs = claim_due_jobs(supabase, limit=limit, lead_id=lead_id, kinds=kinds)
+    summary['claimed'] = len(jobs)
+
+    # Emails go to the dispatcher queue first so they share one SMTP session
+    # (and digest) while the webhooks are being delivered
+    email_jobs = {email_utils.queue_lead_email(job['payload']): job for job in jobs if job['kind'] == KIND_EMAIL}
+    if email_jobs:
+        email_utils.flush_email_queue()
+
+    def deliver(job):
+        if time.monotonic() + WEBHOOK_WORST_CASE_SECONDS > deadline:
+            return _release(supabase, job)
+        try:
+            ok, resp_text = _deliver(job)
+        except Exception as e:
+            ok, resp_text = False, f"Unexpected Error: {str(e)[:200]}"
+        return _record(supabase, job, ok, resp_text)
+
+    webhook_jobs = [job for job in jobs if job['kind'] != KIND_EMAIL]
+    if webhook_jobs:
+        with ThreadPoolExecutor(max_workers=OUTBOX_CONCURRENCY, thread_name_prefix='outbox') as pool:
+            for outcome in pool.map(deliver, webhook_jobs):
+                summary[outcome] += 1
+
+    remaining = max(0.0, min(email_utils.EMAIL_SEND_TIMEOUT, deadline - time.monotonic()))
+    try:
+        for future in as_completed(email_jobs, timeout=remaining):
+            try:
+                ok = future.result()
+            except Exception:
+                ok = False
+            summary[_record(supabase, email_jobs.pop(future), ok, 'Email sent' if ok else 'Email delivery failed')] += 1
+    except FutureTimeout:
+        # Still with the dispatcher: may yet be sent, so the jobs stay "processing"
+        # and are only retried once their lock times out
+        summary['unconfirmed'] += len(email_jobs)
+        log.warning("Email results not confirmed within the drain budget", job_ids=[job['id'] for job in email_jobs.values()])
+    log.info("Drain complete", **summary)
+    return summary
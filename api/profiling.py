@@ -0,0 +1,306 @@
+"""
+Opt-in request profiler. A selected request gets a wall-clock stack sampler
+(every thread, so work handed to run_in_threadpool and the analysis executor
+is included) and a tracemalloc allocation snapshot; the result is written as
+one JSON document to the configured sink. Aggregate the documents with
+benchmarks/profile_report.py.
+
+A request is profiled when its path starts with one of PROFILE_PATHS and
+either it falls in the PROFILE_SAMPLE_RATE share or it carries
+"X-Profile: $PROFILE_SECRET". Only one request is profiled at a time.
+"""
+import functools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from starlette.concurrency import run_in_threadpool
+
+from logs import current_request_id, get_logger
+
+log = get_logger('profiling')
+
+# Share of matching requests profiled (0 = only on request via the header)
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+# Path prefixes eligible for profiling, comma-separated
+PROFILE_PATHS = [p.strip() for p in os.getenv('PROFILE_PATHS', '/api/').split(',') if p.strip()]
+# "X-Profile: <secret>" forces a profile; falls back to CRON_SECRET, header ignored if neither is set
+PROFILE_SECRET = os.getenv('PROFILE_SECRET') or os.getenv('CRON_SECRET')
+PROFILE_INTERVAL_MS = float(os.getenv('PROFILE_INTERVAL_MS', '5'))
+# Allocation snapshot alongside the CPU samples (tracemalloc slows the process while it runs)
+PROFILE_MEMORY = os.getenv('PROFILE_MEMORY', 'true').lower() == 'true'
+PROFILE_ALLOCATION_SITES = int(os.getenv('PROFILE_ALLOCATION_SITES', '50'))
+# Where profiles go: "dir" (PROFILE_DIR), "supabase" (PROFILE_BUCKET storage bucket) or "log"
+PROFILE_SINK = os.getenv('PROFILE_SINK', 'dir').lower()
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(tempfile.gettempdir(), 'model-scanner-profiles')
+PROFILE_BUCKET = os.getenv('PROFILE_BUCKET', 'profiles')
+
+_profile_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {'profiled': 0, 'skipped_busy': 0, 'sink_errors': 0}
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def stats():
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['sample_rate'] = PROFILE_SAMPLE_RATE
+    stats['sink'] = PROFILE_SINK
+    return stats
+
+
+def _short_path(filename):
+    # Site-packages and stdlib paths differ per machine; keep the part that names the module
+    for marker in ('site-packages/', 'dist-packages/'):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    stdlib = os.path.dirname(os.__file__) + os.sep
+    if filename.startswith(stdlib):
+        return filename[len(stdlib):]
+    return os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))
+
+
+@functools.lru_cache(maxsize=8192)
+def _frame_label(code):
+    return f"{_short_path(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _thread_label(name):
+    # "AnyIO worker thread", "ThreadPoolExecutor-0_3" -> one group per pool
+    return name.rstrip('0123456789').rstrip('-_ ') or name
+
+
+def _is_idle_worker(code, leaf):
+    # Pool threads parked in queue.get are waiting for work, not doing ours;
+    # ThreadPoolExecutor workers block in the C SimpleQueue.get, so _worker is the leaf
+    if code.co_name == 'get' and code.co_filename.endswith('queue.py'):
+        return True
+    return leaf and code.co_name == '_worker' and code.co_filename.endswith(os.path.join('futures', 'thread.py'))
+
+
+class StackSampler:
+    """
+    Samples the stack of every thread at a fixed interval from a background
+    thread. Wall-clock, so time spent waiting on the network shows up too.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self._sample(own)
+
+    def _sample(self, own):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                if _is_idle_worker(frame.f_code, not stack):
+                    stack = None
+                    break
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                key = (_thread_label(names.get(ident, 'unknown')), tuple(reversed(stack)))
+                self.counts[key] = self.counts.get(key, 0) + 1
+        self.samples += 1
+
+    def result(self):
+        stacks = [
+            {'thread': thread, 'frames': list(frames), 'count': count}
+            for (thread, frames), count in sorted(self.counts.items(), key=lambda item: -item[1])
+        ]
+        return {'interval_ms': self.interval * 1000, 'samples': self.samples, 'stacks': stacks}
+
+
+class AllocationTracker:
+    """tracemalloc for the duration of one request: peak traced memory and the sites still holding memory at the end."""
+
+    def __init__(self, sites=PROFILE_ALLOCATION_SITES):
+        self.sites = sites
+        self._owner = False
+
+    def start(self):
+        # Leave tracing alone if someone else (python -X tracemalloc) started it
+        self._owner = not tracemalloc.is_tracing()
+        if self._owner:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._owner:
+            tracemalloc.stop()
+        excluded = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diffs = snapshot.filter_traces(excluded).compare_to(self._baseline.filter_traces(excluded), 'lineno')
+        top = [
+            {
+                'site': f"{_short_path(diff.traceback[0].filename)}:{diff.traceback[0].lineno}",
+                'size_diff': diff.size_diff,
+                'count_diff': diff.count_diff,
+            }
+            for diff in diffs if diff.size_diff > 0
+        ][:self.sites]
+        return {'peak_bytes': peak, 'traced_bytes': current, 'top': top}
+
+
+class Profile:
+    def __init__(self, scope, forced):
+        self.id = uuid.uuid4().hex[:16]
+        self.scope = scope
+        self.forced = forced
+        self.status = None
+        self.concurrent_requests = 1
+        self.sampler = StackSampler()
+        self.allocations = AllocationTracker() if PROFILE_MEMORY else None
+
+    def start(self):
+        self.created_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        if self.allocations is not None:
+            self.allocations.start()
+        self.sampler.start()
+
+    def stop(self):
+        self.duration = time.perf_counter() - self.started
+        self.sampler.stop()
+        self.memory = self.allocations.stop() if self.allocations is not None else None
+
+    def to_dict(self):
+        route = getattr(self.scope.get('route'), 'path', None)
+        return {
+            'id': self.id,
+            'created_at': self.created_at.isoformat(),
+            'method': self.scope['method'],
+            'path': self.scope['path'],
+            'route': route or self.scope['path'],
+            'status': self.status,
+            'request_id': current_request_id(),
+            'forced': self.forced,
+            'duration_ms': round(self.duration * 1000, 2),
+            # Samples cover every thread, so overlapping requests blur the picture
+            'concurrent_requests': self.concurrent_requests,
+            'cpu': self.sampler.result(),
+            'memory': self.memory,
+        }
+
+
+def write_profile(document):
+    """Send a finished profile to PROFILE_SINK."""
+    name = f"{document['created_at'][:19].replace(':', '').replace('-', '')}-{document['id']}.json"
+    if PROFILE_SINK == 'log':
+        log.info("Request profile", **document)
+    elif PROFILE_SINK == 'supabase':
+        import supabase_client
+        supabase_client.get_client().storage.from_(PROFILE_BUCKET).upload(
+            path=name,
+            file=json.dumps(document).encode(),
+            file_options={"content-type": "application/json"}
+        )
+    else:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+            json.dump(document, f)
+    return name
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI middleware around the app. Profiled responses carry an
+    x-profile-id header; the profile covers the whole app call, including
+    background tasks that run after the response.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._in_flight = 0
+        self._active = None
+
+    def _wants_profile(self, scope):
+        if not any(scope['path'].startswith(prefix) for prefix in PROFILE_PATHS):
+            return None
+        if PROFILE_SECRET:
+            header = dict(scope.get('headers') or []).get(b'x-profile', b'').decode()
+            if header == PROFILE_SECRET:
+                return 'header'
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            return 'sampled'
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        self._in_flight += 1
+        if self._active is not None:
+            self._active.concurrent_requests = max(self._active.concurrent_requests, self._in_flight)
+        try:
+            reason = self._wants_profile(scope)
+            if reason is None:
+                return await self.app(scope, receive, send)
+            if not _profile_lock.acquire(blocking=False):
+                _count('skipped_busy')
+                return await self.app(scope, receive, send)
+            try:
+                await self._profiled(scope, receive, send, reason == 'header')
+            finally:
+                _profile_lock.release()
+        finally:
+            self._in_flight -= 1
+
+    async def _profiled(self, scope, receive, send, forced):
+        profile = Profile(scope, forced)
+        profile.concurrent_requests = self._in_flight
+
+        async def tagged_send(message):
+            if message['type'] == 'http.response.start':
+                profile.status = message['status']
+                headers = list(message.get('headers') or []) + [(b'x-profile-id', profile.id.encode())]
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        self._active = profile
+        profile.start()
+        try:
+            await self.app(scope, receive, tagged_send)
+        finally:
+            profile.stop()
+            self._active = None
+            _count('profiled')
+            try:
+                name = await run_in_threadpool(write_profile, profile.to_dict())
+                log.info("Request profiled", profile_id=profile.id, sink=PROFILE_SINK, name=name,
+                         duration_ms=round(profile.duration * 1000, 2))
+            except Exception as e:
+                _count('sink_errors')
+                log.error("Writing profile failed", profile_id=profile.id, error=str(e))
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from typing import TYPE_CHECKING
+
+from logs import get_logger
+
+if TYPE_CHECKING:
+    from supabase import Client
+
+log = get_logger('supabase')
+
+_client = None
+_client_lock = threading.Lock()
+
+# Pre-establish PostgREST and Storage connections when the client is first built
+SUPABASE_WARMUP = os.getenv('SUPABASE_WARMUP', 'false').lower() == 'true'
+
+
+class SupabaseConfigError(RuntimeError):
+    pass
+
+
+def supabase_url():
+    return os.getenv('SUPABASE_URL') or os.getenv('VITE_SUPABASE_URL')
+
+
+def supabase_key():
+    return (
+        os.getenv('BACKEND_SERVICE_KEY') or
+        os.getenv('SUPABASE_SERVICE_ROLE_KEY') or
+        os.getenv('VITE_SUPABASE_ANON_KEY') or
+        os.getenv('NEXT_PUBLIC_SUPABASE_ANON_KEY') or
+        os.getenv('SUPABASE_ANON_KEY') or
+        os.getenv('SUPABASE_PUBLISHABLE_KEY')
+    )
+
+
+def rpc_missing(error):
+    """
+    True if PostgREST rejected an RPC because the function isn't deployed
+    (PGRST202), as opposed to a failure of the call itself.
+    """
+    return getattr(error, 'code', None) == 'PGRST202' or 'Could not find the function' in str(error)
+
+
+def get_client() -> "Client":
+    """
+    Process-wide Supabase client. Building a client resolves credentials and
+    sets up fresh HTTP sessions, so it is done once per process and the same
+    handle (and its keep-alive connections) is shared by every request.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                url = supabase_url()
+                key = supabase_key()
+                if not url or not key:
+                    raise SupabaseConfigError("Supabase credentials missing")
+                # Imported here so requests that never touch the database skip the SDK import
+                from supabase import create_client
+                _client = create_client(url, key)
+                if SUPABASE_WARMUP:
+                    threading.Thread(target=warm_up, args=(_client,), daemon=True).start()
+    return _client
+
+
+def reset_client():
+    """Drop the cached client (credentials rotated, tests, benchmarks)."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+def warm_up(client=None):
+    """
+    Open the PostgREST and Storage connections ahead of the first real request.
+    Returns per-service timings in milliseconds; failures are reported, not raised.
+    """
+    client = client or get_client()
+    timings = {}
+    checks = {
+        'postgrest': lambda: client.table('leads').select('id').limit(1).execute(),
+        'storage': lambda: client.storage.list_buckets(),
+    }
+    for name, check in checks.items():
+        start = time.perf_counter()
+        try:
+            check()
+            timings[name] = {'ok': True, 'ms': round((time.perf_counter() - start) * 1000, 2)}
+        except Exception as e:
+            timings[name] = {'ok': False, 'ms': round((time.perf_counter() - start) * 1000, 2), 'error': str(e)[:200]}
+    log.info("Supabase warm-up", **timings)
+    return timings
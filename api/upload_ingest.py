@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+
+# Largest accepted image upload, and the request body budget around it
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+# Whole-request cap for multi-image uploads (/api/analyze_batch)
+UPLOAD_BATCH_MAX_BYTES = int(os.getenv('UPLOAD_BATCH_MAX_BYTES', str(50 * 1024 * 1024)))
+# Headroom for the other multipart form fields of /api/lead
+FORM_OVERHEAD_BYTES = 64 * 1024
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+# Magic-byte signatures -> real MIME type
+_SIGNATURES = [
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+]
+_HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImageType(Exception):
+    pass
+
+
+def sniff_image_type(head):
+    """Identify the image format from its first bytes; None if not a known image."""
+    for signature, mime_type in _SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp' and head[8:12] in _HEIF_BRANDS:
+        return 'image/heic'
+    return None
+
+
+class IngestedUpload:
+    """
+    A validated upload. The bytes stay in the spooled temp file Starlette
+    already wrote the multipart part to (memory up to 1MB, disk beyond), so
+    ingestion never holds a second full copy.
+    """
+    def __init__(self, upload, size, sha256, mime_type):
+        self.upload = upload
+        self.file = upload.file
+        self.size = size
+        self.sha256 = sha256
+        self.mime_type = mime_type
+
+    def read(self):
+        self.file.seek(0)
+        return self.file.read()
+
+
+async def ingest_upload(upload, max_bytes=UPLOAD_MAX_BYTES, allowed_types=None):
+    """
+    Stream an UploadFile in chunks: enforce the size cap as soon as it's
+    exceeded, hash the content and sniff the real image type from magic bytes
+    instead of trusting the client's content_type.
+    """
+    digest = hashlib.sha256()
+    head = b''
+    size = 0
+    await upload.seek(0)
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Image exceeds the {max_bytes // (1024 * 1024)}MB upload limit")
+        if len(head) < 32:
+            head += chunk[:32 - len(head)]
+        digest.update(chunk)
+    await upload.seek(0)
+
+    mime_type = sniff_image_type(head)
+    if mime_type is None or (allowed_types is not None and mime_type not in allowed_types):
+        raise UnsupportedImageType(
+            "Only JPEG and PNG images are allowed." if allowed_types else "File is not a supported image"
+        )
+    return IngestedUpload(upload, size, digest.hexdigest(), mime_type)
+
+
+class RequestTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects oversized upload requests with 413 before the multipart body is
+    parsed and buffered: immediately from Content-Length when present, or as
+    soon as a chunked body crosses the limit.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        # path -> max request body bytes
+        self.limits = limits
+
+    async def _reject(self, send, limit):
+        message = f"Request body exceeds {limit // (1024 * 1024)}MB limit"
+        # The scanner reads "error", the lead form reads "message"
+        body = json.dumps({"status": "error", "error": message, "message": message}).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get('path')) if scope['type'] == 'http' else None
+        if limit is None:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope.get('headers', []):
+            if name == b'content-length':
+                try:
+                    declared = int(value)
+                except ValueError:
+                    declared = 0
+                if declared > limit:
+                    return await self._reject(send, limit)
+
+        received = 0
+        too_large = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > limit:
+                    too_large = True
+                    raise RequestTooLarge()
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if message['type'] == 'http.response.start':
+                response_started = True
+                if too_large:
+                    # The framework turned the aborted body read into its own
+                    # error response (FastAPI: 400 parse error); answer 413 instead
+                    return await self._reject(send, limit)
+            elif too_large:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except RequestTooLarge:
+            if not response_started:
+                await self._reject(send, limit)
@@ -0,0 +1,291 @@
+"""
+Vision engine backends. An engine takes image bytes plus the analysis prompt
+and returns the model's raw JSON text; parsing, score rules and fallbacks stay
+with the callers (api/vision_logic.py, backend/vision_engine.py).
+
+    VISION_ENGINE=gemini   Google Gemini (default)
+    VISION_ENGINE=stub     deterministic offline results, tunable latency and errors
+    VISION_ENGINE=record   Gemini, with every answer appended to VISION_RECORD_PATH
+    VISION_ENGINE=replay   answers from VISION_RECORD_PATH, no network
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import typing_extensions as typing
+
+from logs import get_logger
+
+log = get_logger('vision')
+
+VISION_ENGINE = os.getenv('VISION_ENGINE', 'gemini').lower()
+MODEL_NAME = 'gemini-3-flash-preview'
+
+# Stub: base latency plus uniform jitter, and the share of calls that fail
+VISION_STUB_LATENCY_MS = float(os.getenv('VISION_STUB_LATENCY_MS', '200'))
+VISION_STUB_JITTER_MS = float(os.getenv('VISION_STUB_JITTER_MS', '0'))
+VISION_STUB_ERROR_RATE = float(os.getenv('VISION_STUB_ERROR_RATE', '0'))
+# Which errors the stub injects: any of 429, 500, 503, timeout
+VISION_STUB_ERRORS = [e.strip() for e in os.getenv('VISION_STUB_ERRORS', '429,503').split(',') if e.strip()]
+VISION_STUB_SEED = os.getenv('VISION_STUB_SEED')
+
+# Record/replay: JSONL of {"key", "text", "ms"} per analyzed image
+VISION_RECORD_PATH = os.getenv('VISION_RECORD_PATH', 'vision_recordings.jsonl')
+# Replay: sleep for the recorded latency, and what to do on an image never recorded
+VISION_REPLAY_LATENCY = os.getenv('VISION_REPLAY_LATENCY', 'false').lower() == 'true'
+VISION_REPLAY_MISS = os.getenv('VISION_REPLAY_MISS', 'error').lower()  # error | stub
+
+
+# Define the response schema explicitly for Gemini 1.5 strict output
+class FaceGeometry(typing.TypedDict):
+    primary_shape: str
+    jawline_definition: str
+    structural_note: str
+
+class MarketCategorization(typing.TypedDict):
+    primary: str
+    rationale: str
+
+class AestheticAudit(typing.TypedDict):
+    lighting_quality: str
+    professional_readiness: str
+    technical_flaw: str
+
+class AnalysisResult(typing.TypedDict):
+    face_geometry: FaceGeometry
+    market_categorization: MarketCategorization
+    aesthetic_audit: AestheticAudit
+    suitability_score: int
+    scout_feedback: str
+
+
+class GeminiEngine:
+    """google.generativeai, configured and built on first use rather than at import."""
+    name = 'gemini'
+
+    def __init__(self, model_name=MODEL_NAME):
+        self.model_name = model_name
+        self.cache_namespace = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+
+                    api_key = os.getenv("GOOGLE_API_KEY")
+                    if not api_key:
+                        # Allow running without key if just testing scaffolding, but warn.
+                        log.warning("GOOGLE_API_KEY not found in environment")
+                    genai.configure(api_key=api_key)
+                    self._model = genai.GenerativeModel(
+                        self.model_name,
+                        # Balanced creativity and strict JSON output
+                        generation_config={
+                            "temperature": 0.4,
+                            "response_mime_type": "application/json",
+                            "response_schema": AnalysisResult
+                        },
+                        # Allow model analysis of any portrait (BLOCK_NONE)
+                        safety_settings={
+                            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+                            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+                            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+                            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+                        }
+                    )
+        return self._model
+
+    def warm_up(self):
+        self.get_model()
+
+    def generate(self, image_bytes, mime_type, prompt, request_options=None):
+        kwargs = {'request_options': request_options} if request_options else {}
+        response = self.get_model().generate_content(
+            [{"mime_type": mime_type, "data": image_bytes}, prompt], **kwargs
+        )
+        log.debug("Candidates generated", candidates=len(response.candidates))
+        if not response.parts:
+            # If blocked despite safety settings, log it
+            log.warning("Response blocked", prompt_feedback=str(response.prompt_feedback))
+        return response.text
+
+
+class InjectedError(Exception):
+    """Stub failure shaped like an API error: retry logic matches on .code."""
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class DeadlineExceeded(InjectedError):
+    def __init__(self, timeout):
+        super().__init__(504, f"Stub call exceeded its {timeout:.2f}s timeout")
+
+
+_STUB_SHAPES = ["Oval", "Round", "Square", "Heart", "Diamond", "Oblong"]
+_STUB_JAWLINES = ["Soft", "Defined", "Sharp", "Chiseled", "Angular"]
+_STUB_MARKETS = ["High Fashion", "Commercial", "Lifestyle", "Fitness"]
+_STUB_LIGHTING = ["Natural", "Studio", "Poor", "Harsh"]
+_STUB_READINESS = ["Selfie", "Amateur", "Semi-Pro", "Portfolio"]
+
+
+class StubEngine:
+    """
+    Deterministic offline engine: the same image always gets the same
+    schema-valid AnalysisResult. Latency, jitter and an error rate can be
+    dialled in to load-test the app without quota or network.
+    """
+    name = 'stub'
+    cache_namespace = 'stub'
+
+    def __init__(self, latency_ms=VISION_STUB_LATENCY_MS, jitter_ms=VISION_STUB_JITTER_MS,
+                 error_rate=VISION_STUB_ERROR_RATE, errors=None, seed=VISION_STUB_SEED):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.error_rate = error_rate
+        self.errors = errors or VISION_STUB_ERRORS or ['503']
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        pass
+
+    @staticmethod
+    def result_for(image_bytes):
+        digest = hashlib.sha256(image_bytes).digest()
+        market = _STUB_MARKETS[digest[2] % len(_STUB_MARKETS)]
+        return {
+            "face_geometry": {
+                "primary_shape": _STUB_SHAPES[digest[0] % len(_STUB_SHAPES)],
+                "jawline_definition": _STUB_JAWLINES[digest[1] % len(_STUB_JAWLINES)],
+                "structural_note": "Stub engine: balanced proportions.",
+            },
+            "market_categorization": {"primary": market, "rationale": f"Stub engine: {market} profile."},
+            "aesthetic_audit": {
+                "lighting_quality": _STUB_LIGHTING[digest[3] % len(_STUB_LIGHTING)],
+                "professional_readiness": _STUB_READINESS[digest[4] % len(_STUB_READINESS)],
+                "technical_flaw": "None (stub engine).",
+            },
+            "suitability_score": 70 + digest[5] % 31,
+            "scout_feedback": "Stub engine result.",
+        }
+
+    def generate(self, image_bytes, mime_type, prompt, request_options=None):
+        with self._lock:
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failure = self._random.choice(self.errors) if self._random.random() < self.error_rate else None
+
+        timeout = (request_options or {}).get('timeout')
+        if failure == 'timeout' or (timeout is not None and delay > timeout):
+            time.sleep(timeout if timeout is not None else delay)
+            raise DeadlineExceeded(timeout if timeout is not None else delay)
+        time.sleep(delay)
+        if failure:
+            raise InjectedError(int(failure), "Injected by stub engine")
+        return json.dumps(self.result_for(image_bytes))
+
+
+def recording_key(image_bytes, prompt):
+    return f"{hashlib.sha256(image_bytes).hexdigest()}:{hashlib.sha256(prompt.encode()).hexdigest()[:12]}"
+
+
+class RecordingEngine:
+    """Pass calls through to another engine and append each answer to a JSONL file."""
+    name = 'record'
+
+    def __init__(self, inner, path=VISION_RECORD_PATH):
+        self.inner = inner
+        self.path = path
+        self.cache_namespace = inner.cache_namespace
+        self._lock = threading.Lock()
+
+    def warm_up(self):
+        self.inner.warm_up()
+
+    def generate(self, image_bytes, mime_type, prompt, request_options=None):
+        started = time.perf_counter()
+        text = self.inner.generate(image_bytes, mime_type, prompt, request_options=request_options)
+        entry = {'key': recording_key(image_bytes, prompt), 'text': text,
+                 'ms': round((time.perf_counter() - started) * 1000, 2)}
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        return text
+
+
+class ReplayMiss(KeyError):
+    pass
+
+
+class ReplayEngine:
+    """Serve answers recorded by RecordingEngine; the last recording of an image wins."""
+    name = 'replay'
+
+    def __init__(self, path=VISION_RECORD_PATH, replay_latency=VISION_REPLAY_LATENCY, on_miss=VISION_REPLAY_MISS):
+        self.path = path
+        self.replay_latency = replay_latency
+        self.on_miss = StubEngine(latency_ms=0, error_rate=0) if on_miss == 'stub' else None
+        self.recordings = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.recordings[entry['key']] = entry
+        log.info("Replaying recorded results", recordings=len(self.recordings), path=path)
+        self.cache_namespace = f"replay:{MODEL_NAME}"
+
+    def warm_up(self):
+        pass
+
+    def generate(self, image_bytes, mime_type, prompt, request_options=None):
+        entry = self.recordings.get(recording_key(image_bytes, prompt))
+        if entry is None:
+            if self.on_miss is not None:
+                return self.on_miss.generate(image_bytes, mime_type, prompt)
+            raise ReplayMiss("No recorded result for this image")
+        if self.replay_latency and entry.get('ms'):
+            time.sleep(entry['ms'] / 1000)
+        return entry['text']
+
+
+def create_engine(name=VISION_ENGINE):
+    if name == 'gemini':
+        return GeminiEngine()
+    if name == 'stub':
+        return StubEngine()
+    if name == 'record':
+        return RecordingEngine(GeminiEngine())
+    if name == 'replay':
+        return ReplayEngine()
+    raise ValueError(f"Unknown VISION_ENGINE: {name}")
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """The configured engine, created on first use."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine()
+                log.info("Vision engine selected", engine=_engine.name)
+    return _engine
+
+
+def set_engine(engine):
+    """Swap the engine at runtime (benchmarks, local experiments)."""
+    global _engine
+    with _engine_lock:
+        _engine = engine
@@ -1,73 +1,20 @@
-import google.generativeai as genai
-import os
+import hashlib
 import json
-import typing_extensions as typing
 from dotenv import load_dotenv
+from analysis_cache import analysis_cache, make_cache_key
+from gemini_governor import gemini_governor, CircuitOpen, RateLimited
+import deadline
+import metrics
+from logs import get_logger
+from vision_engines import get_engine
 
-load_dotenv()
-
-# Fallback or load from environment
-# In a real scenario, ensure GOOGLE_API_KEY is in .env or passed here
-API_KEY = os.getenv("GOOGLE_API_KEY")
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    # Allow running without key if just testing scaffolding, but warn.
-    print("WARNING: GOOGLE_API_KEY not found in environment.")
-
-genai.configure(api_key=API_KEY)
-
-# Define the response schema explicitly for Gemini 1.5 strict output
-class FaceGeometry(typing.TypedDict):
-    primary_shape: str
-    jawline_definition: str
-    structural_note: str
-
-class MarketCategorization(typing.TypedDict):
-    primary: str
-    rationale: str
-
-class AestheticAudit(typing.TypedDict):
-    lighting_quality: str
-    professional_readiness: str
-    technical_flaw: str
-
-class AnalysisResult(typing.TypedDict):
-    face_geometry: FaceGeometry
-    market_categorization: MarketCategorization
-    aesthetic_audit: AestheticAudit
-    suitability_score: int
-    scout_feedback: str
+log = get_logger('vision')
 
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-
-# Config for balanced creativity and JSON format
-generation_config = {
-    "temperature": 0.4,
-    "response_mime_type": "application/json",
-    "response_schema": AnalysisResult
-}
-
-# Safety settings to allow model analysis (BLOCK_NONE)
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
+load_dotenv()
 
-model = genai.GenerativeModel(
-    'gemini-3-flash-preview',
-    generation_config=generation_config,
-    safety_settings=safety_settings
-)
 
-def analyze_image(image_bytes, mime_type="image/jpeg"):
-    """
-    Analyzes an image using Gemini 1.5 Flash to extract technical industry markers.
-    """
-    try:
-        # Prompt Pivot: Professional Technical Audit
-        prompt = """
+# Prompt Pivot: Professional Technical Audit
+ANALYSIS_PROMPT = """
         Analyze this image for modeling potential. Return JSON:
         {
           "face_geometry": {
@@ -90,33 +37,54 @@ def analyze_image(image_bytes, mime_type="image/jpeg"):
         
         Score 75-85 for most people. Focus on natural features, not photo quality.
         """
+
+# Changes whenever the prompt text changes, so cached results are invalidated
+PROMPT_VERSION = hashlib.sha256(ANALYSIS_PROMPT.encode()).hexdigest()[:12]
+
+def analyze_image(image_bytes, mime_type="image/jpeg"):
+    """
+    Analyzes an image with the configured vision engine (Gemini unless
+    VISION_ENGINE says otherwise) to extract technical industry markers.
+    Results are cached by image content hash plus engine and prompt version.
+    """
+    if not image_bytes:
+        return _analyze_uncached(image_bytes, mime_type)
+
+    # Namespaced by engine so stub or replayed results never mix with live Gemini ones
+    cache_key = make_cache_key(image_bytes, get_engine().cache_namespace, PROMPT_VERSION)
+    return analysis_cache.get_or_compute(
+        cache_key,
+        lambda: _analyze_uncached(image_bytes, mime_type),
+        # Never cache the fallback result so a transient API failure can be retried
+        cacheable=lambda result: 'error' not in result
+    )
+
+def _analyze_uncached(image_bytes, mime_type="image/jpeg"):
+    try:
         
         # Validating input type
         if not image_bytes:
             raise ValueError("No image data provided")
         
-        # Ensure image_bytes is passed correctly
-        # The SDK handles bytes directly if passed as a Part with mime_type
-        response = model.generate_content(
-            [
-                {"mime_type": mime_type, "data": image_bytes}, 
-                prompt
-            ]
-        )
-        
-        # Check validation
-        print(f"Candidates generated: {len(response.candidates)}")
-        if not response.parts:
-             # If blocked despite safety settings, log it
-             print(f"Prompt FeedBack: {response.prompt_feedback}")
+        # Rate limited, retried on 429/5xx and short-circuited while the model is down;
+        # each attempt gets a timeout from the request's remaining time budget
+        with metrics.stage('gemini'):
+            text = gemini_governor.call(
+                deadline.call_model,
+                get_engine().generate,
+                image_bytes,
+                mime_type,
+                ANALYSIS_PROMPT,
+                allow_hedge=gemini_governor.bucket.try_acquire
+            )
              
-        result = json.loads(response.text)
+        result = json.loads(text)
         
         # Enforce minimum score of 70 as requested
         if 'suitability_score' in result:
             try:
                 score = int(result['suitability_score'])
-                print(f"Raw Score: {score}")
+                log.debug("Raw score", score=score)
                 result['suitability_score'] = max(score, 70)
             except:
                 result['suitability_score'] = 70
@@ -134,16 +102,25 @@ def analyze_image(image_bytes, mime_type="image/jpeg"):
         return result
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error in Gemini analysis: {e}")
-        # Return a mock response if API fails (for development safety) or re-raise
-        # For now, returning minimal error structure
-        return {
-            "error": f"{str(e)}",
-            "suitability_score": 70,
-            "market_categorization": {"primary": "Unknown", "rationale": "Analysis failed."},
-            "face_geometry": {"primary_shape": "Unknown", "jawline_definition": "Unknown", "structural_note": "N/A"},
-            "aesthetic_audit": {"lighting_quality": "Unknown", "professional_readiness": "Unknown", "technical_flaw": "Analysis Error"},
-            "scout_feedback": f"Analysis failed: {str(e)}"
-        }
+        if isinstance(e, (CircuitOpen, RateLimited, deadline.BudgetExhausted)):
+            log.warning("Gemini analysis skipped", error=str(e), reason=type(e).__name__)
+        else:
+            log.exception("Error in Gemini analysis", error=str(e))
+        # Out of time budget: the caller gets the fallback flagged as degraded
+        degraded = isinstance(e, deadline.BudgetExhausted) or deadline.exhausted()
+        metrics.count('analysis_degraded' if degraded else 'analysis_fallback')
+        return fallback_result(str(e), degraded=degraded)
+
+def fallback_result(message, degraded=False):
+    """Minimal result returned when the model call fails; never cached (it carries "error")."""
+    result = {
+        "error": message,
+        "suitability_score": 70,
+        "market_categorization": {"primary": "Unknown", "rationale": "Analysis failed."},
+        "face_geometry": {"primary_shape": "Unknown", "jawline_definition": "Unknown", "structural_note": "N/A"},
+        "aesthetic_audit": {"lighting_quality": "Unknown", "professional_readiness": "Unknown", "technical_flaw": "Analysis Error"},
+        "scout_feedback": f"Analysis failed: {message}"
+    }
+    if degraded:
+        result["degraded"] = True
+    return result
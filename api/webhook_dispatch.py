@@ -0,0 +1,145 @@
+import asyncio
+import os
+
+import metrics
+from logs import get_logger
+from webhook_utils import send_webhook, is_success
+
+log = get_logger('bulk_retry')
+
+# Max in-flight webhook requests per CRM host during bulk retries
+WEBHOOK_MAX_PER_HOST = int(os.getenv('WEBHOOK_MAX_PER_HOST', '8'))
+# How many status updates are written back to Supabase in one call
+WEBHOOK_STATUS_BATCH_SIZE = int(os.getenv('WEBHOOK_STATUS_BATCH_SIZE', '25'))
+# Max ids per in_() query, keeps the PostgREST URL well under proxy limits
+LEAD_FETCH_CHUNK_SIZE = 200
+
+
+def fetch_leads(supabase, lead_ids):
+    """Fetch many leads with one in_() query per chunk instead of one query per id."""
+    leads = {}
+    for i in range(0, len(lead_ids), LEAD_FETCH_CHUNK_SIZE):
+        chunk = lead_ids[i:i + LEAD_FETCH_CHUNK_SIZE]
+        resp = supabase.table('leads').select('*').in_('id', chunk).execute()
+        for lead in resp.data or []:
+            leads[str(lead['id'])] = lead
+    return leads
+
+
+def write_status_batch(supabase, updates):
+    """
+    Write many webhook results in one round trip through the
+    bulk_update_webhook_status RPC, falling back to per-row updates if the
+    function hasn't been deployed yet.
+    """
+    if not updates:
+        return
+    with metrics.stage('status_update'):
+        try:
+            supabase.rpc('bulk_update_webhook_status', {'updates': updates}).execute()
+        except Exception as e:
+            log.warning("Batch status RPC failed, falling back to row updates", error=str(e))
+            for update in updates:
+                supabase.table('leads').update({
+                    'webhook_sent': True,
+                    'webhook_status': update['webhook_status'],
+                    'webhook_response': update['webhook_response']
+                }).eq('id', update['id']).execute()
+
+
+async def _send(url, payload, semaphore):
+    async with semaphore:
+        return await asyncio.to_thread(send_webhook, url, payload)
+
+
+async def dispatch_webhooks(url, payloads, per_host_limit=WEBHOOK_MAX_PER_HOST):
+    """
+    Send webhooks concurrently, at most per_host_limit in flight to the CRM host.
+    payloads is a dict of key -> payload; yields (key, response) as each completes.
+    """
+    semaphore = asyncio.Semaphore(per_host_limit)
+
+    async def run(key, payload):
+        return key, await _send(url, payload, semaphore)
+
+    tasks = [asyncio.create_task(run(key, payload)) for key, payload in payloads.items()]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def bulk_retry_events(supabase, webhook_url, lead_ids, format_payload,
+                            per_host_limit=WEBHOOK_MAX_PER_HOST, batch_size=WEBHOOK_STATUS_BATCH_SIZE):
+    """
+    Retry webhooks for many leads. Yields progress events (dicts) as results
+    arrive, ending with a summary event.
+    """
+    # A repeated id is retried (and counted) once, so "done" can reach "total"
+    unique = {}
+    for lead_id in lead_ids:
+        unique.setdefault(str(lead_id), lead_id)
+    lead_ids = list(unique.values())
+    total = len(lead_ids)
+    yield {"type": "start", "total": total}
+
+    leads = await asyncio.to_thread(fetch_leads, supabase, lead_ids)
+
+    results = []
+    success_count = 0
+    failed_count = 0
+
+    def record(result):
+        nonlocal success_count, failed_count
+        results.append(result)
+        if result['status'] == 'success':
+            success_count += 1
+        else:
+            failed_count += 1
+        return {"type": "result", "done": len(results), "total": total, **result}
+
+    for lead_id in lead_ids:
+        if str(lead_id) not in leads:
+            log.warning("Lead not found", lead_id=lead_id)
+            yield record({"id": lead_id, "status": "not_found"})
+
+    payloads = {key: format_payload(lead) for key, lead in leads.items()}
+    pending_updates = []
+    try:
+        async for key, wb_resp in dispatch_webhooks(webhook_url, payloads, per_host_limit):
+            lead = leads[key]
+            status = 'success' if is_success(wb_resp) else 'failed'
+            resp_text = wb_resp.text if wb_resp is not None else "Connection failed"
+            log.debug("Webhook result", lead_id=lead['id'], webhook_status=status,
+                      code=wb_resp.status_code if wb_resp is not None else None, response=resp_text[:200])
+
+            pending_updates.append({
+                'id': lead['id'],
+                'webhook_status': status,
+                'webhook_response': resp_text[:500]
+            })
+            if len(pending_updates) >= batch_size:
+                batch, pending_updates = pending_updates, []
+                await asyncio.to_thread(write_status_batch, supabase, batch)
+
+            yield record({"id": lead['id'], "status": status, "response": resp_text[:100]})
+    finally:
+        # Webhooks already sent must get their status recorded, even if the
+        # client disconnected and the stream was cancelled mid-way
+        if pending_updates:
+            try:
+                await asyncio.to_thread(write_status_batch, supabase, pending_updates)
+            except Exception as e:
+                log.error("Writing webhook statuses failed", leads=len(pending_updates), error=str(e))
+
+    log.info("Bulk retry complete", succeeded=success_count, failed=failed_count, total=total)
+    yield {
+        "type": "summary",
+        "status": "success",
+        "total": total,
+        "success": success_count,
+        "failed": failed_count,
+        "results": results
+    }
@@ -1,40 +1,140 @@
-import requests
-import json
-import logging
+import os
+import threading
+import time
+
+import metrics
+from logs import get_logger
+
+log = get_logger('webhook')
+
+# Shared webhook HTTP client configuration
+WEBHOOK_POOL_SIZE = int(os.getenv('WEBHOOK_POOL_SIZE', '10'))
+WEBHOOK_CONNECT_TIMEOUT = float(os.getenv('WEBHOOK_CONNECT_TIMEOUT', '5'))
+WEBHOOK_READ_TIMEOUT = float(os.getenv('WEBHOOK_READ_TIMEOUT', '10'))
+WEBHOOK_KEEPALIVE_SECONDS = float(os.getenv('WEBHOOK_KEEPALIVE_SECONDS', '60'))
+WEBHOOK_HTTP2 = os.getenv('WEBHOOK_HTTP2', 'false').lower() == 'true'
+
+DEFAULT_USER_AGENT = 'ModelScanner/1.0'
+
+_client = None
+_client_lock = threading.Lock()
+
 
 class WebhookResponse:
-    """Mock response object for failed requests"""
-    def __init__(self, status_code, text):
+    """Uniform result for webhook calls; status_code is 0 when the request failed"""
+    def __init__(self, status_code, text, timing=None):
         self.status_code = status_code
         self.text = text
+        self.timing = timing or {}
 
-def send_webhook(url, payload):
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def get_http_client():
     """
-    Send a webhook to the CRM.
-    Returns the response object or a mock response with error details if failed.
+    Process-wide keep-alive client for all CRM webhook traffic, so each lead
+    reuses a warm TCP+TLS connection instead of paying a fresh handshake.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                http2 = WEBHOOK_HTTP2 and _http2_available()
+                if WEBHOOK_HTTP2 and not http2:
+                    log.warning("WEBHOOK_HTTP2 requested but the h2 package is not installed, using HTTP/1.1")
+                _client = httpx.Client(
+                    http2=http2,
+                    limits=httpx.Limits(
+                        max_connections=WEBHOOK_POOL_SIZE,
+                        max_keepalive_connections=WEBHOOK_POOL_SIZE,
+                        keepalive_expiry=WEBHOOK_KEEPALIVE_SECONDS
+                    ),
+                    timeout=httpx.Timeout(WEBHOOK_READ_TIMEOUT, connect=WEBHOOK_CONNECT_TIMEOUT),
+                    headers={'User-Agent': DEFAULT_USER_AGENT}
+                )
+    return _client
+
+class RequestTimer:
+    """Collects connect / TLS / TTFB timings from httpx trace events (milliseconds)."""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def __call__(self, event_name, info):
+        self.marks[event_name] = time.perf_counter()
+
+    def _span(self, started, completed):
+        for name in self.marks:
+            if name.endswith(started):
+                begin = self.marks[name]
+                end = self.marks.get(name[:-len(started)] + completed)
+                if end is not None:
+                    return round((end - begin) * 1000, 2)
+        return None
+
+    def _first(self, suffix):
+        for name, mark in self.marks.items():
+            if name.endswith(suffix):
+                return mark
+        return None
+
+    def result(self):
+        sent = self._first('send_request_headers.started')
+        headers_received = self._first('receive_response_headers.complete')
+        return {
+            'reused_connection': 'connection.connect_tcp.started' not in self.marks,
+            'connect_ms': self._span('connect_tcp.started', 'connect_tcp.complete'),
+            'tls_ms': self._span('start_tls.started', 'start_tls.complete'),
+            'ttfb_ms': round((headers_received - sent) * 1000, 2) if sent and headers_received else None,
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 2),
+        }
+
+def is_success(response):
+    """2xx from the CRM. Failed requests come back as WebhookResponse with status 0."""
+    return response is not None and 0 < response.status_code < 300
+
+def send_webhook(url, payload, user_agent=DEFAULT_USER_AGENT):
+    """
+    Send a webhook to the CRM over the shared pooled client.
+    Returns a WebhookResponse carrying status, body and per-request timing;
+    failures are reported with status_code 0 and the error details.
     """
     if not url:
         return WebhookResponse(0, "No webhook URL configured")
-    
+
+    started = time.perf_counter()
+    response = _post(url, payload, user_agent)
+    metrics.record_stage('webhook', time.perf_counter() - started, 'ok' if is_success(response) else 'error')
+    return response
+
+def _post(url, payload, user_agent):
+    import httpx
+
+    timer = RequestTimer()
     try:
         headers = {
             'Content-Type': 'application/json',
-            'User-Agent': 'ModelScanner/1.0'
+            'User-Agent': user_agent
         }
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        return response
-    except requests.exceptions.Timeout:
-        print(f"Webhook timeout after 10 seconds")
-        return WebhookResponse(0, "Timeout: Request took longer than 10 seconds")
-    except requests.exceptions.ConnectionError as e:
-        print(f"Webhook connection error: {str(e)}")
-        return WebhookResponse(0, f"Connection Error: {str(e)[:200]}")
-    except requests.exceptions.SSLError as e:
-        print(f"Webhook SSL error: {str(e)}")
-        return WebhookResponse(0, f"SSL Error: {str(e)[:200]}")
-    except requests.exceptions.RequestException as e:
-        print(f"Webhook request error: {str(e)}")
-        return WebhookResponse(0, f"Request Error: {str(e)[:200]}")
+        response = get_http_client().post(url, json=payload, headers=headers, extensions={'trace': timer})
+        return WebhookResponse(response.status_code, response.text, timer.result())
+    except httpx.TimeoutException:
+        log.warning("Webhook timeout", timeout_seconds=WEBHOOK_READ_TIMEOUT)
+        return WebhookResponse(0, f"Timeout: Request took longer than {WEBHOOK_READ_TIMEOUT:g} seconds", timer.result())
+    except httpx.ConnectError as e:
+        if 'SSL' in str(e) or 'CERTIFICATE' in str(e):
+            log.warning("Webhook SSL error", error=str(e))
+            return WebhookResponse(0, f"SSL Error: {str(e)[:200]}", timer.result())
+        log.warning("Webhook connection error", error=str(e))
+        return WebhookResponse(0, f"Connection Error: {str(e)[:200]}", timer.result())
+    except httpx.RequestError as e:
+        log.warning("Webhook request error", error=str(e))
+        return WebhookResponse(0, f"Request Error: {str(e)[:200]}", timer.result())
     except Exception as e:
-        print(f"Webhook unexpected error: {str(e)}")
-        return WebhookResponse(0, f"Unexpected Error: {str(e)[:200]}")
+        log.exception("Webhook unexpected error", error=str(e))
+        return WebhookResponse(0, f"Unexpected Error: {str(e)[:200]}", timer.result())
@@ -1,9 +1,28 @@
 import sqlite3
 import json
 import datetime
+import os
+import re
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from logs import get_logger
+
+log = get_logger('database')
 
 DB_NAME = "leads_v2.db"
 
+# Same normalization as api/lead_store.py and the Supabase generated columns
+PHONE_KEY_DIGITS = 10
+
+def normalize_email(email):
+    key = (email or '').strip().lower()
+    return key or None
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-PHONE_KEY_DIGITS:] or None
+
 def init_db():
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
@@ -22,13 +41,52 @@ def init_db():
             score INTEGER,
             category TEXT,
             analysis_json TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            email_key TEXT,
+            phone_key TEXT
         )
     ''')
+    _migrate_dedupe_keys(c)
     conn.commit()
     conn.close()
 
+def _migrate_dedupe_keys(c):
+    """Add and backfill email_key/phone_key on databases created before dedupe."""
+    columns = {row[1] for row in c.execute("PRAGMA table_info(leads)")}
+    added = [column for column in ('email_key', 'phone_key') if column not in columns]
+    for column in added:
+        c.execute(f"ALTER TABLE leads ADD COLUMN {column} TEXT")
+    # Only backfill on the migration itself: afterwards a NULL key may be one
+    # _release_duplicate_keys cleared on purpose
+    if added:
+        rows = c.execute("SELECT id, email, phone FROM leads").fetchall()
+        c.executemany("UPDATE leads SET email_key = ?, phone_key = ? WHERE id = ?",
+                      [(normalize_email(email), normalize_phone(phone), lead_id) for lead_id, email, phone in rows])
+    for column in ('email_key', 'phone_key'):
+        _release_duplicate_keys(c, column)
+        c.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS leads_{column}_idx ON leads ({column}) WHERE {column} IS NOT NULL")
+
+def _release_duplicate_keys(c, column):
+    """
+    Leads that got in twice before dedupe existed would block the unique index.
+    The oldest lead keeps the key (so new submits still collide with it); the
+    later copies are kept but lose the key.
+    """
+    groups = c.execute(f"""
+        SELECT {column}, GROUP_CONCAT(id) FROM leads
+        WHERE {column} IS NOT NULL GROUP BY {column} HAVING COUNT(*) > 1
+    """).fetchall()
+    for key, ids in groups:
+        ids = sorted(int(i) for i in ids.split(','))
+        c.executemany(f"UPDATE leads SET {column} = NULL WHERE id = ?", [(i,) for i in ids[1:]])
+        log.warning("Duplicate leads found while adding the unique index, keeping the key on the oldest",
+                    column=column, kept_id=ids[0], cleared_ids=ids[1:])
+
 def save_lead(lead):
+    """
+    Insert a lead in one statement. Returns the new id, or None if the email or
+    phone (normalized) was already submitted.
+    """
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
     
@@ -43,8 +101,8 @@ def save_lead(lead):
 
     
     c.execute('''
-        INSERT INTO leads (first_name, last_name, age, gender, email, phone, city, zip_code, wants_assessment, score, category, analysis_json)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT OR IGNORE INTO leads (first_name, last_name, age, gender, email, phone, city, zip_code, wants_assessment, score, category, analysis_json, email_key, phone_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         lead.first_name, 
         lead.last_name,
@@ -57,10 +115,13 @@ def save_lead(lead):
         lead.wants_assessment, 
         score, 
         category, 
-        json.dumps(lead.analysis_data)
+        json.dumps(lead.analysis_data),
+        normalize_email(lead.email),
+        normalize_phone(lead.phone)
     ))
     
-    lead_id = c.lastrowid
+    # OR IGNORE: a unique key conflict inserts nothing instead of raising
+    lead_id = c.lastrowid if c.rowcount else None
     conn.commit()
     conn.close()
     return lead_id
@@ -54,9 +54,13 @@ async def analyze_endpoint(file: UploadFile = File(...)):
 def submit_lead(lead: Lead):
     try:
         lead_id = database.save_lead(lead)
+        if lead_id is None:
+            raise HTTPException(status_code=400, detail="This email or phone number has already been submitted.")
         # Mock Email Sending
         print(f"Sending email to {lead.email} with report...")
         return {"status": "success", "lead_id": lead_id, "message": "Lead saved and report sent (mocked)."}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -0,0 +1,269 @@
+"""
+Offline bulk scoring: run the vision engine over a folder (or manifest) of
+images and write one JSON line per image.
+
+Images are read, hashed and downscaled in a process pool; engine calls run on
+a bounded thread pool. Every result is appended to the output file as soon as
+it arrives, so a crashed or interrupted run picks up where it stopped when
+started again with the same --output.
+
+    python score_images.py ./headshots --output scores.jsonl
+    python score_images.py manifest.txt --engine stub --stub-latency-ms 300 --concurrency 8
+    python score_images.py photo.png                      # single image, prints the result
+
+A manifest is a .txt (one path per line), .csv (a "path" column) or .jsonl
+({"path": ...} per line) file; relative paths are resolved against its folder.
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.heif'}
+
+
+def list_images(source):
+    """Image paths from a directory (recursive), a manifest file or a single image."""
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS:
+                    paths.append(os.path.join(root, name))
+        return sorted(paths)
+
+    extension = os.path.splitext(source)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return [source]
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, newline='') as f:
+        if extension == '.csv':
+            entries = [row['path'] for row in csv.DictReader(f)]
+        elif extension == '.jsonl':
+            entries = [json.loads(line)['path'] for line in f if line.strip()]
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    return [entry if os.path.isabs(entry) else os.path.join(base, entry) for entry in entries]
+
+
+def preprocess(path, max_edge):
+    """
+    Runs in a worker process: read, hash and downscale one image. Returns a
+    plain dict (picklable) with the bytes to send to the engine.
+    """
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+        item = {'path': path, 'sha256': hashlib.sha256(content).hexdigest(), 'original_bytes': len(content)}
+        mime_type = 'image/png' if content.startswith(b'\x89PNG') else 'image/jpeg'
+        try:
+            from PIL import Image, ImageOps
+            image = Image.open(io.BytesIO(content))
+            image.draft('RGB', (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            image.thumbnail((max_edge, max_edge))
+            buffer = io.BytesIO()
+            image.save(buffer, format='JPEG', quality=85)
+            content, mime_type = buffer.getvalue(), 'image/jpeg'
+        except Exception:
+            # No Pillow, or a format it can't decode: send the original bytes
+            pass
+        item.update({'data': content, 'mime_type': mime_type})
+    except OSError as e:
+        item = {'path': path, 'error': f"Read failed: {e}"}
+    item['preprocess_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return item
+
+
+def load_engine(name, stub_latency_ms):
+    # vision_engines reads VISION_ENGINE when it is first imported, so set it before
+    os.environ['VISION_ENGINE'] = name
+    os.environ['VISION_STUB_LATENCY_MS'] = str(stub_latency_ms)
+    from vision_engine import analyze_image
+    return analyze_image
+
+
+def score(engine, item):
+    """Runs on the engine thread pool; returns the JSONL record for one image."""
+    started = time.perf_counter()
+    try:
+        result = engine(item['data'], mime_type=item['mime_type'])
+        error = result.get('error') if isinstance(result, dict) else None
+    except Exception as e:
+        result, error = None, str(e)
+    return {
+        'path': item['path'],
+        'sha256': item['sha256'],
+        'status': 'error' if error else 'ok',
+        'error': error,
+        'result': None if error else result,
+        'preprocess_ms': item['preprocess_ms'],
+        'engine_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def load_checkpoint(output, retry_errors=True):
+    """Paths already scored in a previous run (a torn last line is ignored)."""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') == 'ok' or not retry_errors:
+                done.add(record['path'])
+    return done
+
+
+class ResultWriter:
+    """Appends one record per line and flushes it, so progress survives a crash."""
+    def __init__(self, path):
+        self._file = open(path, 'a') if path else None
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(json.dumps(record, default=str) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(paths, engine, writer, workers, concurrency, max_edge, on_record=None):
+    """
+    Stream paths through preprocess (process pool) and the engine (thread
+    pool). Only a bounded window of images is in flight, so memory doesn't grow
+    with the size of the folder.
+    """
+    window = concurrency * 2 + workers
+    pending = iter(paths)
+    records = []
+    with ProcessPoolExecutor(max_workers=workers) as processes, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='engine') as threads:
+        preparing, scoring = set(), set()
+
+        def top_up():
+            while len(preparing) + len(scoring) < window:
+                path = next(pending, None)
+                if path is None:
+                    return
+                preparing.add(processes.submit(preprocess, path, max_edge))
+
+        def finish(record):
+            writer.write(record)
+            records.append(record)
+            if on_record:
+                on_record(record, len(records))
+
+        top_up()
+        while preparing or scoring:
+            done, _ = wait(preparing | scoring, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future in preparing:
+                    preparing.discard(future)
+                    item = future.result()
+                    if 'error' in item:
+                        finish({'path': item['path'], 'status': 'error', 'error': item['error'],
+                                'result': None, 'preprocess_ms': item['preprocess_ms'], 'engine_ms': None})
+                    else:
+                        scoring.add(threads.submit(score, engine, item))
+                else:
+                    scoring.discard(future)
+                    finish(future.result())
+            top_up()
+    return records
+
+
+def report(records, elapsed, skipped):
+    ok = [r for r in records if r['status'] == 'ok']
+    engine_ms = [r['engine_ms'] for r in records if r.get('engine_ms') is not None]
+    preprocess_ms = [r['preprocess_ms'] for r in records if r.get('preprocess_ms') is not None]
+    return {
+        'scored': len(records),
+        'ok': len(ok),
+        'errors': len(records) - len(ok),
+        'skipped_from_checkpoint': skipped,
+        'elapsed_s': round(elapsed, 2),
+        'images_per_s': round(len(records) / elapsed, 2) if elapsed else None,
+        'engine_ms': {'p50': percentile(engine_ms, 0.5), 'p95': percentile(engine_ms, 0.95),
+                      'mean': round(statistics.mean(engine_ms), 2) if engine_ms else None},
+        'preprocess_ms': {'p50': percentile(preprocess_ms, 0.5), 'p95': percentile(preprocess_ms, 0.95)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help='image folder, manifest (.txt/.csv/.jsonl) or a single image')
+    parser.add_argument('--output', help='JSONL results file, also the resume checkpoint')
+    parser.add_argument('--engine', choices=['gemini', 'stub', 'record', 'replay'],
+                        default=os.getenv('VISION_ENGINE', 'gemini'))
+    parser.add_argument('--stub-latency-ms', type=float, default=float(os.getenv('VISION_STUB_LATENCY_MS', '200')))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='preprocessing processes')
+    parser.add_argument('--concurrency', type=int, default=4, help='engine calls in flight')
+    parser.add_argument('--max-edge', type=int, default=1024, help='longest edge sent to the engine')
+    parser.add_argument('--limit', type=int, help='score at most this many images')
+    parser.add_argument('--no-retry-errors', action='store_true', help='on resume, skip images that failed before')
+    parser.add_argument('--report', help='also write the throughput report to this JSON file')
+    args = parser.parse_args()
+
+    paths = list_images(args.source)
+    if not paths:
+        sys.exit(f"No images found in {args.source}")
+    done = load_checkpoint(args.output, retry_errors=not args.no_retry_errors) if args.output else set()
+    todo = [p for p in paths if p not in done]
+    if args.limit:
+        todo = todo[:args.limit]
+    print(f"{len(paths)} images, {len(done)} already scored, {len(todo)} to go "
+          f"({args.engine} engine, {args.workers} workers, {args.concurrency} concurrent)")
+
+    engine = load_engine(args.engine, args.stub_latency_ms)
+    writer = ResultWriter(args.output)
+
+    def progress(record, count):
+        if len(todo) == 1:
+            print("Result:", json.dumps(record.get('result') or record.get('error'), indent=2))
+        elif count % 25 == 0 or count == len(todo):
+            print(f"  {count}/{len(todo)} scored")
+
+    started = time.perf_counter()
+    try:
+        records = run(todo, engine, writer, args.workers, args.concurrency, args.max_edge, on_record=progress)
+    finally:
+        writer.close()
+    summary = report(records, time.perf_counter() - started, len(done))
+
+    print(f"\n{summary['ok']} ok, {summary['errors']} errors in {summary['elapsed_s']}s "
+          f"({summary['images_per_s']} images/s)")
+    print(f"engine latency p50={summary['engine_ms']['p50']}ms p95={summary['engine_ms']['p95']}ms; "
+          f"preprocess p50={summary['preprocess_ms']['p50']}ms p95={summary['preprocess_ms']['p95']}ms")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
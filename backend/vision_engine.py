@@ -1,69 +1,20 @@
-import google.generativeai as genai
-import os
 import json
-import typing_extensions as typing
+import os
+import sys
 from dotenv import load_dotenv
 
 load_dotenv()
 
-# Fallback or load from environment
-# In a real scenario, ensure GOOGLE_API_KEY is in .env or passed here
-API_KEY = os.getenv("GOOGLE_API_KEY")
-API_KEY = os.getenv("GOOGLE_API_KEY")
-if not API_KEY:
-    # Allow running without key if just testing scaffolding, but warn.
-    print("WARNING: GOOGLE_API_KEY not found in environment.")
-
-genai.configure(api_key=API_KEY)
-
-# Define the response schema explicitly for Gemini 1.5 strict output
-class FaceGeometry(typing.TypedDict):
-    primary_shape: str
-    jawline_definition: str
-    structural_note: str
-
-class MarketCategorization(typing.TypedDict):
-    primary: str
-    rationale: str
-
-class AestheticAudit(typing.TypedDict):
-    lighting_quality: str
-    professional_readiness: str
-    technical_flaw: str
+# The engine backends (Gemini, stub, record/replay) are shared with the Vercel app
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+from vision_engines import get_engine
+from logs import get_logger
 
-class AnalysisResult(typing.TypedDict):
-    face_geometry: FaceGeometry
-    market_categorization: MarketCategorization
-    aesthetic_audit: AestheticAudit
-    suitability_score: int
-    scout_feedback: str
-
-from google.generativeai.types import HarmCategory, HarmBlockThreshold
-
-# Config for balanced creativity and JSON format
-generation_config = {
-    "temperature": 0.4,
-    "response_mime_type": "application/json",
-    "response_schema": AnalysisResult
-}
-
-# Safety settings to allow model analysis (BLOCK_NONE)
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
-
-model = genai.GenerativeModel(
-    'gemini-3-flash-preview',
-    generation_config=generation_config,
-    safety_settings=safety_settings
-)
+log = get_logger('vision_engine')
 
 def analyze_image(image_bytes, mime_type="image/jpeg"):
     """
-    Analyzes an image using Gemini 1.5 Flash to extract technical industry markers.
+    Analyzes an image with the configured vision engine to extract technical industry markers.
     """
     try:
         # Prompt Pivot: Professional Technical Audit
@@ -109,28 +60,16 @@ def analyze_image(image_bytes, mime_type="image/jpeg"):
         if not image_bytes:
             raise ValueError("No image data provided")
         
-        # Ensure image_bytes is passed correctly
-        # The SDK handles bytes directly if passed as a Part with mime_type
-        response = model.generate_content(
-            [
-                {"mime_type": mime_type, "data": image_bytes}, 
-                prompt
-            ]
-        )
-        
-        # Check validation
-        print(f"Candidates generated: {len(response.candidates)}")
-        if not response.parts:
-             # If blocked despite safety settings, log it
-             print(f"Prompt FeedBack: {response.prompt_feedback}")
+        # VISION_ENGINE picks the backend: gemini (default), stub, record or replay
+        text = get_engine().generate(image_bytes, mime_type, prompt)
              
-        result = json.loads(response.text)
+        result = json.loads(text)
         
         # Enforce minimum score of 70 as requested
         if 'suitability_score' in result:
             try:
                 score = int(result['suitability_score'])
-                print(f"Raw Score: {score}")
+                log.debug("Raw score", score=score)
                 result['suitability_score'] = max(score, 70)
             except:
                 result['suitability_score'] = 70
@@ -148,9 +87,7 @@ def analyze_image(image_bytes, mime_type="image/jpeg"):
         return result
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
-        print(f"Error in Gemini analysis: {e}")
+        log.exception("Vision analysis failed", error=str(e))
         # Return a mock response if API fails (for development safety) or re-raise
         # For now, returning minimal error structure
         return {
@@ -0,0 +1,148 @@
+"""
+Lead persistence: the old select-then-insert-then-update flow versus the single
+INSERT OR IGNORE on normalized dedupe keys (backend/database.py).
+
+Each statement pays a simulated network round trip (--rtt-ms) so the numbers
+resemble a remote database rather than a local SQLite file. The race test fires
+concurrent submits of the same person and counts how many rows get in.
+
+    python benchmarks/lead_persistence.py
+    python benchmarks/lead_persistence.py --leads 500 --rtt-ms 20 --racers 16
+"""
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+
+import database  # noqa: E402
+
+
+class FakeLead:
+    def __init__(self, i, email=None, phone=None):
+        self.first_name = 'Bench'
+        self.last_name = f'Lead{i}'
+        self.age = 25
+        self.gender = 'F'
+        self.email = email or f'bench{i}@example.com'
+        self.phone = phone or f'+1 (555) {i:07d}'
+        self.city = 'Dallas'
+        self.zip_code = '75201'
+        self.wants_assessment = True
+        self.analysis_data = {'suitability_score': 80, 'market_categorization': {'primary': 'Editorial'}}
+
+
+def round_trip(rtt_ms):
+    if rtt_ms:
+        time.sleep(rtt_ms / 1000)
+
+
+def legacy_save_lead(lead, rtt_ms):
+    """The previous flow: duplicate select, insert, then a status update."""
+    conn = sqlite3.connect(database.DB_NAME, timeout=30)
+    c = conn.cursor()
+    round_trip(rtt_ms)
+    c.execute("SELECT id FROM leads WHERE email = ? OR phone = ?", (lead.email, lead.phone))
+    if c.fetchone():
+        conn.close()
+        return None
+    # Window in which a concurrent submit passes the same check
+    round_trip(rtt_ms)
+    c.execute(
+        "INSERT INTO leads (first_name, last_name, email, phone, analysis_json) VALUES (?, ?, ?, ?, ?)",
+        (lead.first_name, lead.last_name, lead.email, lead.phone, json.dumps(lead.analysis_data))
+    )
+    lead_id = c.lastrowid
+    conn.commit()
+    round_trip(rtt_ms)
+    c.execute("UPDATE leads SET category = ? WHERE id = ?", ('Editorial', lead_id))
+    conn.commit()
+    conn.close()
+    return lead_id
+
+
+def single_save_lead(lead, rtt_ms):
+    round_trip(rtt_ms)
+    return database.save_lead(lead)
+
+
+def fresh_db(unique_keys):
+    handle, path = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+    database.DB_NAME = path
+    database.init_db()
+    if not unique_keys:
+        # Legacy schema had no unique constraint at all
+        conn = sqlite3.connect(path)
+        conn.execute("DROP INDEX leads_email_key_idx")
+        conn.execute("DROP INDEX leads_phone_key_idx")
+        conn.close()
+    return path
+
+
+def latency(label, save, leads, rtt_ms, unique_keys):
+    path = fresh_db(unique_keys)
+    samples = []
+    for i in range(leads):
+        start = time.perf_counter()
+        save(FakeLead(i), rtt_ms)
+        samples.append((time.perf_counter() - start) * 1000)
+    os.remove(path)
+    samples.sort()
+    print(
+        f"{label:<10} mean={statistics.mean(samples):8.2f}ms  "
+        f"p50={samples[len(samples) // 2]:8.2f}ms  "
+        f"p95={samples[int(len(samples) * 0.95) - 1]:8.2f}ms"
+    )
+    return statistics.mean(samples)
+
+
+def race(label, save, racers, rtt_ms, unique_keys):
+    path = fresh_db(unique_keys)
+    barrier = threading.Barrier(racers)
+    ids = []
+
+    def submit(i):
+        # Same person, differently formatted contact details
+        lead = FakeLead(i, email=' Racer@Example.com ' if i % 2 else 'racer@example.com',
+                        phone='555-000-1234' if i % 2 else '+1 555 000 1234')
+        barrier.wait()
+        ids.append(save(lead, rtt_ms))
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(racers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT COUNT(*) FROM leads").fetchone()[0]
+    conn.close()
+    os.remove(path)
+    print(f"{label:<10} {racers} concurrent submits of one person -> {rows} row(s) stored")
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--leads', type=int, default=200)
+    parser.add_argument('--rtt-ms', type=float, default=5.0, help='simulated latency per database round trip')
+    parser.add_argument('--racers', type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{args.leads} sequential leads, {args.rtt_ms}ms per round trip")
+    legacy = latency('legacy', legacy_save_lead, args.leads, args.rtt_ms, unique_keys=False)
+    single = latency('single', single_save_lead, args.leads, args.rtt_ms, unique_keys=True)
+    print(f"saved per lead: {legacy - single:.2f}ms\n")
+
+    race('legacy', legacy_save_lead, args.racers, args.rtt_ms, unique_keys=False)
+    race('single', single_save_lead, args.racers, args.rtt_ms, unique_keys=True)
+
+
+if __name__ == '__main__':
+    main()
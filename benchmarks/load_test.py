@@ -0,0 +1,454 @@
+"""
+End-to-end load test for both FastAPI apps (api/index.py and backend/main.py)
+against local stand-ins: Supabase, the CRM webhook and SMTP come from
+benchmarks/local_services.py, Gemini is the stub vision engine. Every service
+has tunable latency, so runs are repeatable and spend no quota.
+
+Both apps are served by uvicorn on 127.0.0.1 in background threads and driven
+over real HTTP by --concurrency virtual users, each picking requests from the
+--mix weights. Uploads are drawn from a seeded pool of JPEG/PNG images of
+several sizes; leads have fresh contact details, with --duplicate-rate of them
+reusing an earlier one (the expected 400 is not counted as an error).
+
+Reports throughput, p50/p95/p99 latency and error rate per endpoint, and saves
+everything as JSON (default benchmarks/results/load_test-<commit>.json) so runs
+on different commits can be compared with --baseline.
+
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --duration 60 --concurrency 32 --gemini-ms 1500 --gemini-jitter-ms 1000
+    python benchmarks/load_test.py --mix api.analyze=1 --gemini-error-rate 0.05
+    python benchmarks/load_test.py --baseline benchmarks/results/load_test-abc1234.json
+
+Driver and servers share one interpreter (and its GIL), so absolute numbers
+are pessimistic; compare runs made with the same settings on the same machine.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+ENDPOINTS = {
+    'api.analyze': ('api', 'POST', '/api/analyze'),
+    'api.lead': ('api', 'POST', '/api/lead'),
+    'backend.analyze': ('backend', 'POST', '/analyze'),
+    'backend.lead': ('backend', 'POST', '/lead'),
+}
+DEFAULT_MIX = 'api.analyze=4,api.lead=3,backend.analyze=2,backend.lead=1'
+# (label, longest edge, weight): thumbnails through full-size phone photos
+IMAGE_SIZES = [('small', 480, 3), ('medium', 1280, 4), ('large', 3024, 2)]
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint in --mix: {name} (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def git_commit():
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return sha, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def configure_environment(args, crm_url, smtp_port):
+    """Everything the apps read at import time; must run before they are imported."""
+    os.environ.update({
+        'VISION_ENGINE': 'stub',
+        'VISION_STUB_LATENCY_MS': str(args.gemini_ms),
+        'VISION_STUB_JITTER_MS': str(args.gemini_jitter_ms),
+        'VISION_STUB_ERROR_RATE': str(args.gemini_error_rate),
+        'VISION_STUB_SEED': str(args.seed),
+        # The stub stands in for the quota-limited API; the limiter shouldn't cap the test
+        'GEMINI_RPM': str(args.gemini_rpm),
+        'GEMINI_BURST': str(max(args.concurrency, 10)),
+        'SUPABASE_URL': 'http://127.0.0.1:54321',
+        'SUPABASE_SERVICE_ROLE_KEY': 'bench',
+        'IMAGE_STAGING_BACKEND': 'supabase',
+        'CRM_WEBHOOK_URL': crm_url,
+        'SMTP_SERVER': '127.0.0.1',
+        'SMTP_PORT': str(smtp_port),
+        'SMTP_STARTTLS': 'false',
+        'SMTP_USERNAME': '',
+        'SMTP_PASSWORD': '',
+    })
+    os.environ.pop('ANALYSIS_CACHE_BACKEND', None)
+    if args.no_cache:
+        os.environ['ANALYSIS_CACHE_MAX_ENTRIES'] = '0'
+
+
+def load_apps(fake_supabase, db_path):
+    # api/ first: both folders have a webhook_utils module and index.py needs its own
+    sys.path.insert(0, os.path.join(ROOT, 'backend'))
+    sys.path.insert(0, os.path.join(ROOT, 'api'))
+    import supabase_client
+    supabase_client._client = fake_supabase
+    import index
+
+    import database
+    database.DB_NAME = db_path
+    import main as backend_main
+    return {'api': index.app, 'backend': backend_main.app}
+
+
+class ServerThread:
+    """uvicorn on an ephemeral 127.0.0.1 port, in a daemon thread."""
+    def __init__(self, app):
+        import uvicorn
+        self.socket = socket.socket()
+        self.socket.bind(('127.0.0.1', 0))
+        self.url = f"http://127.0.0.1:{self.socket.getsockname()[1]}"
+        config = uvicorn.Config(app, log_level='error', access_log=False, lifespan='off')
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, kwargs={'sockets': [self.socket]}, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def build_images(pool_size, seed):
+    """Seeded noise photos (JPEG and PNG) so compression and decode cost is realistic."""
+    from PIL import Image
+    rng = random.Random(seed)
+    images = []
+    weights = []
+    for i in range(pool_size):
+        label, edge, weight = IMAGE_SIZES[i % len(IMAGE_SIZES)]
+        width, height = edge, int(edge * 0.75)
+        # Low-res noise scaled up: photo-like file sizes, cheap to generate
+        small = Image.frombytes('RGB', (width // 16, height // 16), rng.randbytes((width // 16) * (height // 16) * 3))
+        image = small.resize((width, height), Image.BILINEAR)
+        buffer = io.BytesIO()
+        if i % 5 == 4:
+            image.save(buffer, format='PNG')
+            mime, name = 'image/png', f"{label}_{i}.png"
+        else:
+            image.save(buffer, format='JPEG', quality=88)
+            mime, name = 'image/jpeg', f"{label}_{i}.jpg"
+        images.append({'name': name, 'mime': mime, 'size': label, 'data': buffer.getvalue()})
+        weights.append(weight)
+    return images, weights
+
+
+class Workload:
+    """Picks the next request: endpoint by mix weight, image by size weight, lead identity."""
+    def __init__(self, mix, images, image_weights, duplicate_rate, upload_rate, seed):
+        self.endpoints = list(mix)
+        self.endpoint_weights = list(mix.values())
+        self.images = images
+        self.image_weights = image_weights
+        self.duplicate_rate = duplicate_rate
+        self.upload_rate = upload_rate
+        self.random = random.Random(seed)
+        self.sequence = 0
+        # Per app: each keeps its own leads (Supabase vs SQLite)
+        self.submitted = {}
+        self.image_tokens = []
+
+    def next_endpoint(self):
+        return self.random.choices(self.endpoints, self.endpoint_weights)[0]
+
+    def image(self):
+        return self.random.choices(self.images, self.image_weights)[0]
+
+    def person(self, app):
+        """(identity, expected_duplicate); call accepted() once the lead is stored."""
+        submitted = self.submitted.get(app)
+        if submitted and self.random.random() < self.duplicate_rate:
+            return self.random.choice(submitted), True
+        self.sequence += 1
+        n = self.sequence
+        person = {
+            'first_name': 'Load', 'last_name': f'Test{n}', 'age': str(18 + n % 40),
+            'gender': 'F' if n % 2 else 'M', 'email': f"load{n}.{self.random.getrandbits(32):x}@example.com",
+            'phone': f"+1 555 {self.random.randrange(10**7):07d}", 'city': 'Dallas', 'zip_code': '75201',
+        }
+        return person, False
+
+    def accepted(self, app, person):
+        # Only stored leads can be resubmitted as duplicates, so the 400 is certain
+        self.submitted.setdefault(app, []).append(person)
+
+
+ANALYSIS = {'suitability_score': 82, 'market_categorization': {'primary': 'Commercial', 'rationale': 'Load test'}}
+
+
+def _detail(response):
+    try:
+        body = response.json()
+    except ValueError:
+        return response.text[:200]
+    if isinstance(body, dict):
+        return str(body.get('error') or body.get('message') or body.get('detail') or body)[:200]
+    return str(body)[:200]
+
+
+async def send(client, urls, workload, endpoint):
+    """Issue one request; returns (status, ok, expected_duplicate, image size label, error detail)."""
+    app, method, path = ENDPOINTS[endpoint]
+    url = urls[app] + path
+    size = None
+    duplicate = False
+
+    if endpoint.endswith('.analyze'):
+        image = workload.image()
+        size = image['size']
+        response = await client.post(url, files={'file': (image['name'], image['data'], image['mime'])})
+        body = response.json() if response.status_code == 200 else {}
+        if endpoint == 'api.analyze' and body.get('image_token'):
+            workload.image_tokens.append(body['image_token'])
+            del workload.image_tokens[:-200]
+        # The fallback result (score 70, "error") is a failed analysis even though it is a 200
+        ok = response.status_code == 200 and 'error' not in body
+        return response.status_code, ok, duplicate, size, None if ok else _detail(response)
+
+    person, duplicate = workload.person(app)
+    if endpoint == 'backend.lead':
+        payload = {**person, 'age': int(person['age']), 'wants_assessment': True, 'analysis_data': ANALYSIS}
+        response = await client.post(url, json=payload)
+    else:
+        form = {**person, 'campaign': 'load-test', 'wants_assessment': 'true', 'analysis_data': json.dumps(ANALYSIS)}
+        files = None
+        if workload.image_tokens and workload.random.random() >= workload.upload_rate:
+            form['image_token'] = workload.random.choice(workload.image_tokens)
+        else:
+            image = workload.image()
+            size = image['size']
+            files = {'file': (image['name'], image['data'], image['mime'])}
+        response = await client.post(url, data=form, files=files)
+
+    if duplicate:
+        ok = response.status_code == 400
+    else:
+        body = response.json() if response.headers.get('content-type', '').startswith('application/json') else {}
+        ok = response.status_code == 200 and body.get('status') != 'error'
+        if ok:
+            workload.accepted(app, person)
+    return response.status_code, ok, duplicate, size, None if ok else _detail(response)
+
+
+async def drive(urls, workload, concurrency, duration, total_requests, timeout):
+    import httpx
+    samples = []
+    issued = 0
+    deadline = time.perf_counter() + duration
+
+    async def user(client):
+        nonlocal issued
+        while True:
+            if total_requests and issued >= total_requests:
+                return
+            if not total_requests and time.perf_counter() >= deadline:
+                return
+            issued += 1
+            endpoint = workload.next_endpoint()
+            started = time.perf_counter()
+            try:
+                status, ok, duplicate, size, error = await send(client, urls, workload, endpoint)
+            except Exception as e:
+                status, ok, duplicate, size, error = 0, False, False, None, f"{type(e).__name__}: {e}"[:200]
+            samples.append({'endpoint': endpoint, 'ms': (time.perf_counter() - started) * 1000, 'status': status,
+                            'ok': ok, 'duplicate': duplicate, 'size': size, 'error': error})
+
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+
+def summarize(samples, elapsed):
+    def stats(group):
+        latencies = [s['ms'] for s in group]
+        statuses = {}
+        for s in group:
+            statuses[str(s['status'])] = statuses.get(str(s['status']), 0) + 1
+        errors = [s for s in group if not s['ok']]
+        return {
+            'requests': len(group),
+            'throughput_rps': round(len(group) / elapsed, 2) if elapsed else None,
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'max_ms': round(max(latencies), 2) if latencies else None,
+            'error_rate': round(len(errors) / len(group), 4) if group else None,
+            'status_codes': dict(sorted(statuses.items())),
+            'expected_duplicates': sum(1 for s in group if s['duplicate']),
+            'sample_errors': sorted({s['error'] for s in errors if s['error']})[:5],
+        }
+
+    endpoints = {}
+    for name in ENDPOINTS:
+        group = [s for s in samples if s['endpoint'] == name]
+        if not group:
+            continue
+        endpoints[name] = stats(group)
+        by_size = {}
+        for size, _, _ in IMAGE_SIZES:
+            sized = [s for s in group if s['size'] == size]
+            if sized:
+                by_size[size] = {k: v for k, v in stats(sized).items()
+                                 if k in ('requests', 'p50_ms', 'p95_ms', 'p99_ms', 'error_rate')}
+        if by_size:
+            endpoints[name]['by_image_size'] = by_size
+    return {'overall': stats(samples), 'endpoints': endpoints}
+
+
+def print_report(report, baseline=None):
+    print(f"\n{'endpoint':<18}{'reqs':>7}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'errors':>9}")
+    rows = list(report['results']['endpoints'].items()) + [('overall', report['results']['overall'])]
+    for name, s in rows:
+        print(f"{name:<18}{s['requests']:>7}{s['throughput_rps']:>9}{s['p50_ms']:>9}ms{s['p95_ms']:>8}ms"
+              f"{s['p99_ms']:>8}ms{s['error_rate'] * 100:>8.1f}%")
+
+    if baseline:
+        print(f"\nvs {baseline['commit']} ({baseline['timestamp']}):")
+        base = {**baseline['results']['endpoints'], 'overall': baseline['results']['overall']}
+        for name, s in rows:
+            if name not in base:
+                continue
+            b = base[name]
+
+            def delta(key):
+                if not b.get(key) or s.get(key) is None:
+                    return '   n/a'
+                return f"{(s[key] - b[key]) / b[key] * 100:+6.1f}%"
+            print(f"{name:<18} rps {delta('throughput_rps')}  p50 {delta('p50_ms')}  p95 {delta('p95_ms')}  "
+                  f"p99 {delta('p99_ms')}  errors {b['error_rate'] * 100:.1f}% -> {s['error_rate'] * 100:.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run (ignored with --requests)')
+    parser.add_argument('--requests', type=int, default=0, help='stop after this many requests instead')
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual users')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'endpoint weights (default {DEFAULT_MIX})')
+    parser.add_argument('--image-pool', type=int, default=36, help='distinct images; repeats hit the analysis cache')
+    parser.add_argument('--no-cache', action='store_true', help='disable the in-memory analysis cache')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='share of leads reusing an earlier email/phone')
+    parser.add_argument('--upload-rate', type=float, default=0.3,
+                        help='share of api.lead requests uploading a file instead of sending an image_token')
+    parser.add_argument('--gemini-ms', type=float, default=800)
+    parser.add_argument('--gemini-jitter-ms', type=float, default=400)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-rpm', type=float, default=1_000_000, help='governor quota during the test')
+    parser.add_argument('--db-ms', type=float, default=25, help='Supabase PostgREST round trip')
+    parser.add_argument('--db-jitter-ms', type=float, default=15)
+    parser.add_argument('--storage-ms', type=float, default=120, help='Supabase storage upload')
+    parser.add_argument('--storage-jitter-ms', type=float, default=80)
+    parser.add_argument('--crm-ms', type=float, default=250)
+    parser.add_argument('--crm-jitter-ms', type=float, default=150)
+    parser.add_argument('--crm-error-rate', type=float, default=0.0)
+    parser.add_argument('--smtp-ms', type=float, default=300)
+    parser.add_argument('--smtp-jitter-ms', type=float, default=100)
+    parser.add_argument('--timeout', type=float, default=70, help='client timeout per request (s)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='results JSON (default benchmarks/results/load_test-<commit>.json)')
+    parser.add_argument('--baseline', help='earlier results JSON to compare against')
+    parser.add_argument('--verbose', action='store_true', help="show the apps' own log output")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from local_services import FakeCRM, FakeSMTP, FakeSupabase, Latency
+
+    supabase = FakeSupabase(Latency(args.db_ms, args.db_jitter_ms, args.seed),
+                            Latency(args.storage_ms, args.storage_jitter_ms, args.seed + 1))
+    crm = FakeCRM(Latency(args.crm_ms, args.crm_jitter_ms, args.seed + 2), args.crm_error_rate, args.seed).start()
+    smtp = FakeSMTP(Latency(args.smtp_ms, args.smtp_jitter_ms, args.seed + 3)).start()
+    configure_environment(args, crm.url, smtp.port)
+
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with quiet:
+        apps = load_apps(supabase, os.path.join(workdir, 'leads.db'))
+    servers = {name: ServerThread(app).start() for name, app in apps.items()
+               if any(ENDPOINTS[e][0] == name for e in mix)}
+    urls = {name: server.url for name, server in servers.items()}
+
+    images, image_weights = build_images(args.image_pool, args.seed)
+    workload = Workload(mix, images, image_weights, args.duplicate_rate, args.upload_rate, args.seed)
+    print(f"{'%d requests' % args.requests if args.requests else '%gs' % args.duration}, {args.concurrency} users, "
+          f"mix {args.mix}, {len(images)} images "
+          f"({sum(len(i['data']) for i in images) / len(images) / 1024:.0f}KB avg)", file=sys.stderr)
+
+    with quiet:
+        samples, elapsed = asyncio.run(drive(urls, workload, args.concurrency, args.duration,
+                                             args.requests, args.timeout))
+        # Let background outbox deliveries finish so service counters are complete
+        time.sleep(min(5.0, (args.crm_ms + args.crm_jitter_ms + args.smtp_ms + args.smtp_jitter_ms) / 1000 + 1))
+        server_stats = {}
+        if 'api' in apps:
+            from index import analysis_stats
+            server_stats = asyncio.run(analysis_stats())
+    for server in servers.values():
+        server.stop()
+    crm.stop()
+    smtp.stop()
+
+    commit, dirty = git_commit()
+    report = {
+        'commit': commit + ('-dirty' if dirty else ''),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': vars(args),
+        'elapsed_s': round(elapsed, 2),
+        'results': summarize(samples, elapsed),
+        'services': {'supabase': supabase.stats(), 'crm': crm.stats(), 'smtp': smtp.stats()},
+        'server_stats': server_stats,
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_test-{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,544 @@
+"""
+Local stand-ins for the services the apps talk to, for benchmarks/load_test.py.
+
+Each one adds a configurable latency (base + uniform jitter, milliseconds) per
+call, so the numbers resemble remote services rather than in-memory shortcuts:
+
+    FakeSupabase   PostgREST subset (filters, or_/and_, order, limit), the
+                   insert_lead and claim_outbox_jobs RPCs and the storage
+                   buckets, as a drop-in for the supabase-py client
+    FakeCRM        HTTP server accepting webhook POSTs (real sockets, so the
+                   pooled httpx client is exercised)
+    FakeSMTP       minimal SMTP server (EHLO/MAIL/RCPT/DATA/NOOP/RSET/QUIT)
+
+Gemini is replaced with VISION_ENGINE=stub (api/vision_engines.py).
+"""
+import copy
+import itertools
+import json
+import os
+import random
+import re
+import socketserver
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+
+class Latency:
+    """Sleep for base_ms plus up to jitter_ms on every call."""
+    def __init__(self, base_ms=0.0, jitter_ms=0.0, seed=None):
+        self.base = base_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            delay = self.base + self._random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def describe(self):
+        return {'base_ms': self.base * 1000, 'jitter_ms': self.jitter * 1000}
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+# --- Supabase ---------------------------------------------------------------
+
+class _Response:
+    def __init__(self, data):
+        self.data = data
+
+
+def _coerce(current, value):
+    if isinstance(current, bool):
+        return str(value).lower() == 'true'
+    if isinstance(current, (int, float)) and not isinstance(value, (int, float)):
+        try:
+            return type(current)(value)
+        except ValueError:
+            return value
+    if isinstance(current, str):
+        return str(value)
+    return value
+
+
+def _compare(op, current, value):
+    if op == 'is':
+        return current is None if str(value) == 'null' else current == _coerce(current, value)
+    if current is None:
+        return False
+    value = _coerce(current, value)
+    try:
+        return {
+            'eq': current == value, 'neq': current != value,
+            'lt': current < value, 'lte': current <= value,
+            'gt': current > value, 'gte': current >= value,
+        }[op]
+    except (KeyError, TypeError):
+        return False
+
+
+def _split_top_level(expression):
+    parts, depth, current = [], 0, ''
+    quoted = escaped = False
+    for ch in expression:
+        if escaped:
+            escaped = False
+        elif quoted:
+            escaped = ch == '\\'
+            quoted = ch != '"'
+        else:
+            quoted = ch == '"'
+            depth += ch == '('
+            depth -= ch == ')'
+        if ch == ',' and depth == 0 and not quoted:
+            parts.append(current)
+            current = ''
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _like_regex(pattern):
+    # PostgREST's * and LIKE's %/_ are wildcards; backslash makes the next character literal
+    regex, chars = '', iter(pattern)
+    for ch in chars:
+        if ch == '\\':
+            regex += re.escape(next(chars, ''))
+        elif ch in '*%':
+            regex += '.*'
+        elif ch == '_':
+            regex += '.'
+        else:
+            regex += re.escape(ch)
+    return regex
+
+
+def _condition(expression):
+    """PostgREST logic-tree expression -> predicate (enough for the app's or_() filters)."""
+    for prefix, combine in (('and(', all), ('or(', any)):
+        if expression.startswith(prefix):
+            parts = [_condition(p) for p in _split_top_level(expression[len(prefix):-1])]
+            return lambda row: combine(p(row) for p in parts)
+    column, op, value = expression.split('.', 2)
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        # Double-quoted value: backslash escapes the next character
+        value = re.sub(r'\\(.)', r'\1', value[1:-1])
+    if op == 'ilike':
+        pattern = re.compile('^' + _like_regex(value) + '$', re.I | re.S)
+        return lambda row: bool(pattern.match(str(row.get(column) or '')))
+    if op == 'in':
+        values = value.strip('()').split(',')
+        return lambda row: str(row.get(column)) in values
+    return lambda row: _compare(op, row.get(column), value)
+
+
+class _Query:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.operation = 'select'
+        self.columns = '*'
+        self.payload = None
+        self.filters = []
+        self.ordering = []
+        self.row_limit = None
+
+    def select(self, columns='*', count=None):
+        self.operation, self.columns = 'select', columns
+        return self
+
+    def insert(self, rows, **kwargs):
+        self.operation, self.payload = 'insert', rows
+        return self
+
+    def upsert(self, rows, on_conflict='id', **kwargs):
+        self.operation, self.payload, self.on_conflict = 'upsert', rows, on_conflict
+        return self
+
+    def update(self, values):
+        self.operation, self.payload = 'update', values
+        return self
+
+    def delete(self):
+        self.operation = 'delete'
+        return self
+
+    def _filter(self, column, op, value):
+        self.filters.append(lambda row: _compare(op, row.get(column), value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column, value):
+        return self._filter(column, 'neq', value)
+
+    def lt(self, column, value):
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column, value):
+        return self._filter(column, 'lte', value)
+
+    def gt(self, column, value):
+        return self._filter(column, 'gt', value)
+
+    def gte(self, column, value):
+        return self._filter(column, 'gte', value)
+
+    def is_(self, column, value):
+        return self._filter(column, 'is', value)
+
+    def in_(self, column, values):
+        values = [str(v) for v in values]
+        self.filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def or_(self, expression):
+        parts = [_condition(p) for p in _split_top_level(expression)]
+        self.filters.append(lambda row: any(p(row) for p in parts))
+        return self
+
+    def order(self, column, desc=False):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        self.db.latency.wait()
+        with self.db.lock:
+            self.db.count(f"{self.table}.{self.operation}")
+            return _Response(self.db.run(self))
+
+
+class _MissingFunction(Exception):
+    """Shaped like PostgREST's answer for an undeployed function, so callers' fallbacks kick in."""
+    code = 'PGRST202'
+
+    def __init__(self, name):
+        super().__init__(f"Could not find the function public.{name} in the schema cache")
+
+
+class _RPC:
+    def __init__(self, db, name, params):
+        self.db, self.name, self.params = db, name, params
+
+    def execute(self):
+        self.db.latency.wait()
+        with self.db.lock:
+            self.db.count(f"rpc.{self.name}")
+            if self.name == 'insert_lead':
+                return _Response(self.db.insert_lead(self.params['lead'], self.params.get('jobs') or []))
+            if self.name == 'claim_outbox_jobs':
+                return _Response(self.db.claim_outbox_jobs(**self.params))
+            raise _MissingFunction(self.name)
+
+
+class _Bucket:
+    def __init__(self, storage, name):
+        self.storage, self.name = storage, name
+
+    def upload(self, path, file, file_options=None):
+        self.storage.latency.wait()
+        key = (self.name, path)
+        with self.storage.lock:
+            self.storage.counters['upload'] += 1
+            if key in self.storage.objects:
+                raise Exception("The resource already exists (Duplicate)")
+            self.storage.objects[key] = {'size': len(file), 'content': bytes(file), 'created_at': _now()}
+        return {'Key': f"{self.name}/{path}"}
+
+    def download(self, path):
+        self.storage.latency.wait()
+        with self.storage.lock:
+            self.storage.counters['download'] += 1
+            stored = self.storage.objects.get((self.name, path))
+        if stored is None:
+            raise Exception("{'statusCode': 404, 'error': not_found, 'message': Object not found}")
+        return stored['content']
+
+    def remove(self, paths):
+        self.storage.latency.wait()
+        with self.storage.lock:
+            self.storage.counters['remove'] += 1
+            for path in paths:
+                self.storage.objects.pop((self.name, path), None)
+        return []
+
+    def list(self, path='', options=None):
+        """Objects directly under the folder path; honours search, sortBy, offset and limit."""
+        options = options or {}
+        prefix = f"{path.strip('/')}/" if path else ''
+        self.storage.latency.wait()
+        with self.storage.lock:
+            entries = [
+                {'name': p[len(prefix):], 'created_at': meta['created_at'], 'metadata': {'size': meta['size']}}
+                for (bucket, p), meta in self.storage.objects.items()
+                if bucket == self.name and p.startswith(prefix) and '/' not in p[len(prefix):]
+            ]
+        entries = [e for e in entries if e['name'].startswith(options.get('search', ''))]
+        sort = options.get('sortBy') or {'column': 'name', 'order': 'asc'}
+        entries.sort(key=lambda e: e.get(sort['column']) or '', reverse=sort.get('order') == 'desc')
+        offset = options.get('offset', 0)
+        return entries[offset:offset + options.get('limit', 100)]
+
+
+class _Storage:
+    def __init__(self, latency):
+        self.latency = latency
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.counters = {'upload': 0, 'download': 0, 'remove': 0}
+
+    def from_(self, bucket):
+        return _Bucket(self, bucket)
+
+
+class _Auth:
+    """Accepts any bearer token as the admin user."""
+    class _User:
+        email = 'bench@example.com'
+
+    class _UserResponse:
+        def __init__(self):
+            self.user = _Auth._User()
+
+    def get_user(self, token):
+        return self._UserResponse()
+
+
+class FakeSupabase:
+    """
+    In-memory supabase-py stand-in. Holds rows per table; every execute() pays
+    the database latency, every storage call the storage latency.
+    """
+    def __init__(self, db_latency=None, storage_latency=None):
+        self.latency = db_latency or Latency()
+        self.storage = _Storage(storage_latency or Latency())
+        self.auth = _Auth()
+        self.tables = {}
+        self.lock = threading.Lock()
+        self.counters = {}
+        self._ids = {}
+
+    def table(self, name):
+        return _Query(self, name)
+
+    def rpc(self, name, params):
+        return _RPC(self, name, params)
+
+    def count(self, key):
+        self.counters[key] = self.counters.get(key, 0) + 1
+
+    def _next_id(self, table):
+        if table not in self._ids:
+            self._ids[table] = itertools.count(1)
+        return next(self._ids[table])
+
+    def _store(self, table, row):
+        row = dict(row)
+        row.setdefault('id', self._next_id(table))
+        row.setdefault('created_at', _now())
+        row['updated_at'] = _now()
+        self.tables.setdefault(table, []).append(row)
+        return row
+
+    def insert_lead(self, lead, jobs):
+        """Same contract as the insert_lead SQL function: atomic dedupe + outbox jobs."""
+        # Imported on use: lead_store pulls in outbox/email_utils, which read their
+        # configuration at import and the load test sets it after starting the fakes
+        from lead_store import normalize_email, normalize_phone
+        email_key, phone_key = normalize_email(lead.get('email')), normalize_phone(lead.get('phone'))
+        for row in self.tables.get('leads', []):
+            if (email_key and row.get('email_key') == email_key) or (phone_key and row.get('phone_key') == phone_key):
+                return {'id': None, 'duplicate': True}
+        row = self._store('leads', {**lead, 'email_key': email_key, 'phone_key': phone_key})
+        for job in jobs:
+            self._store('lead_outbox', {
+                'lead_id': row['id'], 'kind': job['kind'], 'payload': job['payload'],
+                'status': 'pending', 'attempts': 0, 'next_attempt_at': _now(),
+                'locked_at': None, 'last_error': None,
+            })
+        return {'id': row['id'], 'duplicate': False}
+
+    def claim_outbox_jobs(self, max_jobs, lock_timeout_seconds, only_lead=None, only_kinds=None):
+        """Same contract as the claim_outbox_jobs SQL function (callers hold self.lock)."""
+        now = datetime.now(timezone.utc)
+        stale = (now - timedelta(seconds=lock_timeout_seconds)).isoformat()
+        due = [
+            row for row in self.tables.get('lead_outbox', [])
+            if ((row['status'] == 'pending' and row['next_attempt_at'] <= now.isoformat()) or
+                (row['status'] == 'processing' and row['locked_at'] and row['locked_at'] < stale))
+            and (only_lead is None or row['lead_id'] == only_lead)
+            and (only_kinds is None or row['kind'] in only_kinds)
+        ]
+        due.sort(key=lambda row: row['next_attempt_at'])
+        for row in due[:max_jobs]:
+            row.update({'status': 'processing', 'locked_at': now.isoformat(), 'updated_at': now.isoformat()})
+        return copy.deepcopy(due[:max_jobs])
+
+    def run(self, query):
+        rows = self.tables.setdefault(query.table, [])
+        matches = [row for row in rows if all(f(row) for f in query.filters)]
+
+        if query.operation == 'select':
+            for column, desc in reversed(query.ordering):
+                matches.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+            if query.row_limit is not None:
+                matches = matches[:query.row_limit]
+            if query.columns != '*':
+                columns = [c.strip() for c in query.columns.split(',')]
+                matches = [{c: row.get(c) for c in columns} for row in matches]
+            return copy.deepcopy(matches)
+
+        if query.operation in ('insert', 'upsert'):
+            payload = query.payload if isinstance(query.payload, list) else [query.payload]
+            stored = []
+            for item in payload:
+                if query.operation == 'upsert':
+                    key = query.on_conflict
+                    existing = next((row for row in rows if row.get(key) == item.get(key)), None)
+                    if existing is not None:
+                        existing.update(item)
+                        stored.append(existing)
+                        continue
+                stored.append(self._store(query.table, json.loads(json.dumps(item, default=str))))
+            return copy.deepcopy(stored)
+
+        if query.operation == 'update':
+            for row in matches:
+                row.update(query.payload)
+                row['updated_at'] = _now()
+            return copy.deepcopy(matches)
+
+        if query.operation == 'delete':
+            self.tables[query.table] = [row for row in rows if row not in matches]
+            return copy.deepcopy(matches)
+        raise ValueError(query.operation)
+
+    def stats(self):
+        return {
+            'calls': dict(sorted(self.counters.items())),
+            'storage': dict(self.storage.counters),
+            'rows': {table: len(rows) for table, rows in self.tables.items()},
+            'latency': {'db': self.latency.describe(), 'storage': self.storage.latency.describe()},
+        }
+
+
+# --- CRM webhook --------------------------------------------------------------
+
+class FakeCRM:
+    """Webhook receiver on 127.0.0.1; answers 200 (or 500 at error_rate) after the latency."""
+    def __init__(self, latency=None, error_rate=0.0, seed=None):
+        self.latency = latency or Latency()
+        self.error_rate = error_rate
+        self.received = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        crm = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                crm.latency.wait()
+                with crm._lock:
+                    fail = crm._random.random() < crm.error_rate
+                    crm.received += 1
+                    crm.failed += fail
+                body = b'{"error":"injected"}' if fail else b'{"ok":true}'
+                self.send_response(500 if fail else 200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/webhook"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-crm', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def stats(self):
+        return {'received': self.received, 'failed': self.failed, 'latency': self.latency.describe(),
+                'error_rate': self.error_rate}
+
+
+# --- SMTP ---------------------------------------------------------------------
+
+class FakeSMTP:
+    """Just enough SMTP for smtplib.send_message; the latency is paid per message."""
+    def __init__(self, latency=None):
+        self.latency = latency or Latency()
+        self.messages = 0
+        self.sessions = 0
+        self._lock = threading.Lock()
+        smtp = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode() + b"\r\n")
+
+            def handle(self):
+                with smtp._lock:
+                    smtp.sessions += 1
+                self.reply("220 fake-smtp ready")
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode(errors='replace').strip().upper()
+                    if command.startswith(('EHLO', 'HELO')):
+                        self.reply("250 fake-smtp")
+                    elif command == 'DATA':
+                        self.reply("354 End data with <CR><LF>.<CR><LF>")
+                        while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                            pass
+                        smtp.latency.wait()
+                        with smtp._lock:
+                            smtp.messages += 1
+                        self.reply("250 OK queued")
+                    elif command == 'QUIT':
+                        self.reply("221 Bye")
+                        return
+                    else:
+                        # MAIL FROM, RCPT TO, NOOP, RSET
+                        self.reply("250 OK")
+
+        self.server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-smtp', daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def stats(self):
+        return {'messages': self.messages, 'sessions': self.sessions, 'latency': self.latency.describe()}
@@ -0,0 +1,131 @@
+"""
+Aggregate request profiles written by api/profiling.py into the hottest
+functions and allocation sites.
+
+    python benchmarks/profile_report.py                          # PROFILE_DIR
+    python benchmarks/profile_report.py /tmp/profiles --route /api/lead --top 30
+    python benchmarks/profile_report.py --bucket profiles --limit 200   # Supabase storage sink
+    python benchmarks/profile_report.py --folded lead.folded     # input for flamegraph.pl / speedscope
+
+Functions are ranked by self samples (the function was on top of the stack)
+and cumulative samples (anywhere on the stack), as a share of all samples of
+the selected profiles. Samples are wall-clock, so time blocked on the network
+counts: a high selectors.py or ssl.py share means the request waits on I/O.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+from collections import Counter, defaultdict
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+
+def load_dir(paths):
+    documents = []
+    for path in paths:
+        files = sorted(glob.glob(os.path.join(path, '*.json'))) if os.path.isdir(path) else [path]
+        for name in files:
+            with open(name) as f:
+                documents.append(json.load(f))
+    return documents
+
+
+def load_bucket(bucket, limit):
+    import supabase_client
+    storage = supabase_client.get_client().storage.from_(bucket)
+    # Object names start with the UTC timestamp, so name order is newest first
+    entries = storage.list('', {'limit': limit, 'sortBy': {'column': 'name', 'order': 'desc'}})
+    return [json.loads(storage.download(entry['name'])) for entry in entries if entry['name'].endswith('.json')]
+
+
+def aggregate(documents, include_threads=None):
+    self_samples, cumulative, folded = Counter(), Counter(), Counter()
+    allocations = defaultdict(lambda: {'size': 0, 'count': 0, 'profiles': 0})
+    total = 0
+    for document in documents:
+        for stack in document['cpu']['stacks']:
+            if include_threads and stack['thread'] not in include_threads:
+                continue
+            count = stack['count']
+            total += count
+            self_samples[stack['frames'][-1]] += count
+            for frame in set(stack['frames']):
+                cumulative[frame] += count
+            folded[';'.join([stack['thread']] + stack['frames'])] += count
+        for site in (document.get('memory') or {}).get('top', []):
+            entry = allocations[site['site']]
+            entry['size'] += site['size_diff']
+            entry['count'] += site['count_diff']
+            entry['profiles'] += 1
+    return {'total': total, 'self': self_samples, 'cumulative': cumulative,
+            'folded': folded, 'allocations': allocations}
+
+
+def print_report(documents, report, top):
+    durations = sorted(d['duration_ms'] for d in documents)
+    peaks = [d['memory']['peak_bytes'] for d in documents if d.get('memory')]
+    routes = Counter(f"{d['method']} {d['route']}" for d in documents)
+    print(f"{len(documents)} profiles: " + ', '.join(f"{route} x{n}" for route, n in routes.most_common()))
+    print(f"duration p50={statistics.median(durations):.1f}ms max={durations[-1]:.1f}ms, "
+          f"{report['total']} samples")
+    if peaks:
+        print(f"traced memory peak p50={statistics.median(peaks) / 1024:.0f}KB max={max(peaks) / 1024:.0f}KB")
+    crowded = sum(1 for d in documents if d.get('concurrent_requests', 1) > 1)
+    if crowded:
+        print(f"note: {crowded} profiles overlapped other requests; their samples include that work")
+
+    total = report['total'] or 1
+    print(f"\nTop {top} functions by self time")
+    print(f"{'self':>7} {'cum':>7}  function")
+    for frame, count in report['self'].most_common(top):
+        print(f"{count / total:7.1%} {report['cumulative'][frame] / total:7.1%}  {frame}")
+
+    print(f"\nTop {top} functions by cumulative time")
+    print(f"{'cum':>7} {'self':>7}  function")
+    for frame, count in report['cumulative'].most_common(top):
+        print(f"{count / total:7.1%} {report['self'][frame] / total:7.1%}  {frame}")
+
+    if report['allocations']:
+        print(f"\nTop {top} allocation sites (memory still held when the request finished)")
+        print(f"{'KB':>10} {'blocks':>8} {'profiles':>8}  site")
+        ranked = sorted(report['allocations'].items(), key=lambda item: -item[1]['size'])[:top]
+        for site, entry in ranked:
+            print(f"{entry['size'] / 1024:10.1f} {entry['count']:8d} {entry['profiles']:8d}  {site}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='profile files or directories (default: PROFILE_DIR)')
+    parser.add_argument('--bucket', help='read from this Supabase storage bucket instead (needs SUPABASE_* env)')
+    parser.add_argument('--limit', type=int, default=100, help='newest profiles to fetch from --bucket')
+    parser.add_argument('--route', help='only profiles of this route, e.g. /api/lead')
+    parser.add_argument('--thread', action='append', help='only samples of this thread group (repeatable)')
+    parser.add_argument('--top', type=int, default=20, help='rows per table')
+    parser.add_argument('--folded', help='also write collapsed stacks (thread;frame;...;frame count) here')
+    args = parser.parse_args()
+
+    if args.bucket:
+        documents = load_bucket(args.bucket, args.limit)
+    else:
+        from profiling import PROFILE_DIR
+        documents = load_dir(args.paths or [PROFILE_DIR])
+    if args.route:
+        documents = [d for d in documents if d['route'] == args.route or d['path'] == args.route]
+    if not documents:
+        sys.exit("No profiles found")
+
+    report = aggregate(documents, set(args.thread) if args.thread else None)
+    print_report(documents, report, args.top)
+
+    if args.folded:
+        with open(args.folded, 'w') as f:
+            for stack, count in report['folded'].most_common():
+                f.write(f"{stack} {count}\n")
+        print(f"\nCollapsed stacks written to {args.folded}")
+
+
+if __name__ == '__main__':
+    main()
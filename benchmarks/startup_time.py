@@ -0,0 +1,97 @@
+"""
+Cold-start import benchmark for the serverless API.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter (what a
+Vercel cold start pays) and reports the slowest modules by cumulative import
+time, plus the time to load each lazily imported dependency on first use.
+
+    python benchmarks/startup_time.py
+    python benchmarks/startup_time.py --top 25 --runs 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+API_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+# Dependencies index.py defers until first use
+LAZY_MODULES = ['vision_logic', 'supabase', 'smtplib', 'httpx', 'dotenv']
+
+
+def import_times(module):
+    """Return {module: (self_us, cumulative_us)} for a fresh `import module`."""
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=API_DIR, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        # Keep the first (outermost) record of each module
+        times.setdefault(name, (int(self_us), int(cumulative_us)))
+    return times
+
+
+def median_times(module, runs):
+    samples = [import_times(module) for _ in range(runs)]
+    modules = set().union(*samples)
+    return {
+        name: (
+            statistics.median(s[name][0] for s in samples if name in s),
+            statistics.median(s[name][1] for s in samples if name in s),
+        )
+        for name in modules
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='index', help='entry module to import (default: index)')
+    parser.add_argument('--top', type=int, default=15, help='number of modules to list')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters per measurement (median)')
+    parser.add_argument('--json', help='write the full report to this file')
+    args = parser.parse_args()
+
+    times = median_times(args.module, args.runs)
+    total_ms = times[args.module][1] / 1000
+    print(f"import {args.module}: {total_ms:.1f}ms (median of {args.runs})\n")
+
+    print(f"{'module':<50} {'cumulative':>12} {'self':>10}")
+    ranked = sorted(times.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in ranked[:args.top]:
+        print(f"{name:<50} {cumulative_us / 1000:>10.1f}ms {self_us / 1000:>8.1f}ms")
+
+    print("\nLazy dependencies (cost paid on first use, not at startup):")
+    lazy = {}
+    for name in LAZY_MODULES:
+        loaded_at_startup = name in times
+        try:
+            cost_ms = median_times(name, args.runs)[name][1] / 1000
+        except RuntimeError:
+            cost_ms = None
+        lazy[name] = {'loaded_at_startup': loaded_at_startup, 'import_ms': cost_ms}
+        status = 'EAGER' if loaded_at_startup else 'lazy'
+        cost = f"{cost_ms:.1f}ms" if cost_ms is not None else 'not installed'
+        print(f"  {name:<20} {status:<6} {cost:>12}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'module': args.module,
+                'total_ms': total_ms,
+                'modules': {name: {'self_ms': s / 1000, 'cumulative_ms': c / 1000} for name, (s, c) in ranked},
+                'lazy': lazy,
+            }, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == '__main__':
+    main()
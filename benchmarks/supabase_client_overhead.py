@@ -0,0 +1,63 @@
+"""
+Per-request Supabase client overhead: building a fresh client on every request
+(the old get_supabase) versus reusing the cached process-wide client.
+
+    python benchmarks/supabase_client_overhead.py            # client construction only
+    python benchmarks/supabase_client_overhead.py --query    # also run a 1-row select (needs real credentials)
+
+Without credentials in the environment a dummy local URL/key is used, which is
+enough to measure construction cost.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'api'))
+
+from supabase import create_client  # noqa: E402
+import supabase_client  # noqa: E402
+
+
+def measure(label, acquire, iterations, query):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        client = acquire()
+        client.table('leads')
+        if query:
+            client.table('leads').select('id').limit(1).execute()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    print(
+        f"{label:<12} mean={statistics.mean(samples):8.2f}ms  "
+        f"p50={samples[len(samples) // 2]:8.2f}ms  "
+        f"p95={samples[int(len(samples) * 0.95) - 1]:8.2f}ms"
+    )
+    return statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--query', action='store_true', help='issue a real select per iteration')
+    args = parser.parse_args()
+
+    if not supabase_client.supabase_url() or not supabase_client.supabase_key():
+        if args.query:
+            sys.exit("--query needs SUPABASE_URL and a Supabase key in the environment")
+        os.environ['SUPABASE_URL'] = 'http://127.0.0.1:54321'
+        os.environ['SUPABASE_ANON_KEY'] = 'benchmark-dummy-key'
+
+    url, key = supabase_client.supabase_url(), supabase_client.supabase_key()
+    supabase_client.reset_client()
+
+    print(f"{args.iterations} iterations{' with a 1-row select' if args.query else ''}")
+    fresh = measure('fresh', lambda: create_client(url, key), args.iterations, args.query)
+    cached = measure('cached', supabase_client.get_client, args.iterations, args.query)
+    print(f"per-request overhead removed: {fresh - cached:.2f}ms")
+
+
+if __name__ == '__main__':
+    main()
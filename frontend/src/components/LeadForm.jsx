@@ -160,8 +160,10 @@ const LeadForm = ({ analysisData, imageBlob, onSubmitSuccess, onCancel }) => {
             // Append Analysis Data as JSON string
             payload.append('analysis_data', JSON.stringify(analysisData));
 
-            // Append Image File
-            if (imageBlob) {
+            // Reference the image staged by /analyze; only re-upload if staging failed
+            if (analysisData?.image_token) {
+                payload.append('image_token', analysisData.image_token);
+            } else if (imageBlob) {
                 payload.append('file', imageBlob);
             }
 
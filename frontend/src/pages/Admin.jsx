@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import { supabase } from '../lib/supabaseClient';
 import { useNavigate } from 'react-router-dom';
 import {
@@ -15,6 +15,13 @@ const Admin = () => {
     const [statusFilter, setStatusFilter] = useState('all');
     const [selectedIds, setSelectedIds] = useState(new Set());
     const [bulkSending, setBulkSending] = useState(false);
+    const [bulkProgress, setBulkProgress] = useState(null);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
+    const [stats, setStats] = useState(null);
+    const [exporting, setExporting] = useState(false);
+    // Change-feed position; a ref so the auto-refresh interval always sees the latest
+    const syncCursorRef = useRef(null);
     const navigate = useNavigate();
 
     const API_URL = import.meta.env.MODE === 'production' ? '/api' : 'http://localhost:8000';
@@ -24,13 +31,22 @@ const Admin = () => {
             const { data: { session } } = await supabase.auth.getSession();
             if (!session) {
                 navigate('/login');
-            } else {
-                fetchLeads();
             }
         };
         init();
     }, []);
 
+    // Filters are applied server-side; debounce so typing doesn't fire a request per key
+    useEffect(() => {
+        const timer = setTimeout(() => fetchLeads(), 300);
+        return () => clearTimeout(timer);
+    }, [statusFilter, searchTerm]);
+
+    useEffect(() => {
+        const interval = setInterval(() => syncChanges(), 5 * 60 * 1000);
+        return () => clearInterval(interval);
+    }, [statusFilter, searchTerm]);
+
     const checkAuth = async () => {
         const { data: { session } } = await supabase.auth.getSession();
         if (!session) {
@@ -38,20 +54,131 @@ const Admin = () => {
         }
     };
 
-    const fetchLeads = async () => {
-        setLoading(true);
+    const authHeaders = async () => {
+        const { data: { session } } = await supabase.auth.getSession();
+        if (!session) {
+            navigate('/login');
+            throw new Error('Not signed in');
+        }
+        return { Authorization: `Bearer ${session.access_token}` };
+    };
+
+    // Loads the first page (or the next one with loadMore) from the paginated /leads API
+    const fetchLeads = async (loadMore = false) => {
+        if (loadMore) {
+            setLoadingMore(true);
+        } else {
+            setLoading(true);
+        }
         try {
-            const { data, error } = await supabase
-                .from('leads')
-                .select('*')
-                .order('created_at', { ascending: false });
+            const params = { limit: 50 };
+            if (statusFilter !== 'all') params.status = statusFilter;
+            if (searchTerm.trim()) params.q = searchTerm.trim();
+            if (loadMore && nextCursor) params.cursor = nextCursor;
 
-            if (error) throw error;
-            setLeads(data || []);
+            const { data } = await axios.get(`${API_URL}/leads`, {
+                params,
+                headers: await authHeaders()
+            });
+            setLeads(prev => loadMore ? [...prev, ...data.leads] : data.leads);
+            setNextCursor(data.next_cursor);
+            if (!loadMore) {
+                syncCursorRef.current = data.changes_cursor;
+                fetchStats();
+            }
         } catch (error) {
             console.error('Error fetching leads:', error.message);
         } finally {
             setLoading(false);
+            setLoadingMore(false);
+        }
+    };
+
+    // Precomputed counters, cheap enough to reload after every change
+    const fetchStats = async () => {
+        try {
+            const { data } = await axios.get(`${API_URL}/stats`, { headers: await authHeaders() });
+            setStats(data);
+        } catch (error) {
+            console.error('Error fetching stats:', error.message);
+        }
+    };
+
+    const matchesFilters = (lead) => {
+        const term = searchTerm.trim().toLowerCase();
+        const matchesSearch = !term ||
+            (lead.first_name || '').toLowerCase().includes(term) ||
+            (lead.last_name || '').toLowerCase().includes(term) ||
+            (lead.email || '').toLowerCase().includes(term);
+        const matchesStatus = statusFilter === 'all' || lead.webhook_status === statusFilter;
+        return matchesSearch && matchesStatus;
+    };
+
+    // Patch the loaded list with changed rows: replace by id, add new leads, drop rows that no longer match
+    const mergeChanges = (current, changed) => {
+        const byId = new Map(current.map(lead => [lead.id, lead]));
+        const oldest = current.length ? current[current.length - 1].created_at : null;
+        for (const lead of changed) {
+            if (!matchesFilters(lead)) {
+                byId.delete(lead.id);
+            } else if (byId.has(lead.id) || !oldest || lead.created_at >= oldest) {
+                // Unknown rows older than the last loaded page show up via "Load more" instead
+                byId.set(lead.id, lead);
+            }
+        }
+        return Array.from(byId.values()).sort((a, b) =>
+            a.created_at === b.created_at ? b.id - a.id : (a.created_at < b.created_at ? 1 : -1)
+        );
+    };
+
+    // Pulls only leads created or updated since the last load/sync
+    const syncChanges = async () => {
+        if (!syncCursorRef.current) return fetchLeads();
+        try {
+            const headers = await authHeaders();
+            const changed = [];
+            let hasMore = true;
+            while (hasMore) {
+                const { data } = await axios.get(`${API_URL}/leads/changes`, {
+                    params: { since: syncCursorRef.current },
+                    headers
+                });
+                changed.push(...data.leads);
+                syncCursorRef.current = data.next_cursor;
+                hasMore = data.has_more;
+            }
+            if (changed.length > 0) {
+                setLeads(prev => mergeChanges(prev, changed));
+                fetchStats();
+            }
+        } catch (error) {
+            console.error('Error syncing leads:', error.message);
+        }
+    };
+
+    // Server streams the CSV with the current filters applied
+    const handleExport = async () => {
+        setExporting(true);
+        try {
+            const params = new URLSearchParams({ format: 'csv' });
+            if (statusFilter !== 'all') params.set('status', statusFilter);
+            if (searchTerm.trim()) params.set('q', searchTerm.trim());
+            const res = await fetch(`${API_URL}/leads/export?${params}`, { headers: await authHeaders() });
+            if (!res.ok) {
+                const body = await res.json().catch(() => ({}));
+                throw new Error(body.error || body.detail || `HTTP ${res.status}`);
+            }
+            const url = URL.createObjectURL(await res.blob());
+            const link = document.createElement('a');
+            link.href = url;
+            link.download = `leads-${new Date().toISOString().slice(0, 10)}.csv`;
+            link.click();
+            URL.revokeObjectURL(url);
+        } catch (error) {
+            console.error('Export failed:', error);
+            alert(`Export failed: ${error.message}`);
+        } finally {
+            setExporting(false);
         }
     };
 
@@ -64,8 +191,8 @@ const Admin = () => {
         setResendingId(leadId);
         try {
             await axios.post(`${API_URL}/retry_webhook`, { lead_id: leadId });
-            // Refresh specific row or whole table
-            fetchLeads();
+            // Patch just the changed rows
+            syncChanges();
         } catch (error) {
             console.error('Retry failed:', error);
             alert('Failed to resend webhook. Check console for details.');
@@ -88,22 +215,60 @@ const Admin = () => {
     };
 
     const toggleSelectAll = () => {
-        if (selectedIds.size === filteredLeads.length) {
+        if (selectedIds.size === leads.length) {
             setSelectedIds(new Set());
         } else {
-            setSelectedIds(new Set(filteredLeads.map(l => l.id)));
+            setSelectedIds(new Set(leads.map(l => l.id)));
         }
     };
 
+    // Streams NDJSON progress events from the backend as each lead completes
+    const streamBulkRetry = async (leadIds) => {
+        const res = await fetch(`${API_URL}/bulk_retry_webhook`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json', 'Accept': 'application/x-ndjson' },
+            body: JSON.stringify({ lead_ids: leadIds, stream: true })
+        });
+        if (!res.ok) {
+            const body = await res.json().catch(() => ({}));
+            throw new Error(body.error || body.detail || `HTTP ${res.status}`);
+        }
+
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let summary = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                if (event.type === 'start') {
+                    setBulkProgress({ done: 0, total: event.total });
+                } else if (event.type === 'result') {
+                    setBulkProgress({ done: event.done, total: event.total });
+                } else if (event.type === 'summary') {
+                    summary = event;
+                } else if (event.type === 'error') {
+                    throw new Error(event.error);
+                }
+            }
+        }
+        if (!summary) throw new Error('Bulk resend ended without a summary');
+        return summary;
+    };
+
     const handleBulkRetry = async () => {
         if (selectedIds.size === 0) return;
         setBulkSending(true);
         try {
-            const res = await axios.post(`${API_URL}/bulk_retry_webhook`, {
-                lead_ids: Array.from(selectedIds)
-            });
-            const { success, failed, total, results } = res.data;
-            console.log('[BULK_RETRY] Full response:', JSON.stringify(res.data, null, 2));
+            const summary = await streamBulkRetry(Array.from(selectedIds));
+            const { success, failed, total, results } = summary;
+            console.log('[BULK_RETRY] Full response:', JSON.stringify(summary, null, 2));
 
             // Build detailed message
             let msg = `Bulk resend complete: ${success}/${total} succeeded, ${failed} failed.`;
@@ -115,24 +280,16 @@ const Admin = () => {
             }
             alert(msg);
             setSelectedIds(new Set());
-            fetchLeads();
+            syncChanges();
         } catch (error) {
             console.error('Bulk retry failed:', error);
-            const detail = error.response?.data?.error || error.response?.data?.detail || error.message;
-            alert(`Bulk resend failed: ${detail}`);
+            alert(`Bulk resend failed: ${error.message}`);
         } finally {
             setBulkSending(false);
+            setBulkProgress(null);
         }
     };
 
-    const filteredLeads = leads.filter(lead => {
-        const matchesSearch = lead.first_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            lead.last_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-            lead.email.toLowerCase().includes(searchTerm.toLowerCase());
-        const matchesStatus = statusFilter === 'all' || lead.webhook_status === statusFilter;
-        return matchesSearch && matchesStatus;
-    });
-
     const getStatusIcon = (status) => {
         switch (status) {
             case 'success': return <CheckCircle size={16} className="text-green-400" />;
@@ -161,6 +318,23 @@ const Admin = () => {
                     </button>
                 </div>
 
+                {/* Summary */}
+                {stats && (
+                    <div className="grid grid-cols-2 sm:grid-cols-4 gap-4 mb-6">
+                        {[
+                            { label: 'Total Leads', value: stats.total, className: 'text-white' },
+                            { label: 'Webhook Success', value: stats.by_status.success || 0, className: 'text-green-400' },
+                            { label: 'Webhook Failed', value: (stats.by_status.failed || 0) + (stats.by_status.upload_failed || 0), className: 'text-red-400' },
+                            { label: 'Pending / Retrying', value: (stats.by_status.pending || 0) + (stats.by_status.retrying || 0), className: 'text-yellow-400' },
+                        ].map(card => (
+                            <div key={card.label} className="bg-white/5 border border-white/10 rounded-xl p-4">
+                                <div className="text-xs uppercase text-gray-400">{card.label}</div>
+                                <div className={`text-2xl font-bold mt-1 ${card.className}`}>{card.value}</div>
+                            </div>
+                        ))}
+                    </div>
+                )}
+
                 {/* Filters */}
                 <div className="flex flex-col sm:flex-row gap-4 mb-6">
                     <div className="relative flex-1">
@@ -182,12 +356,17 @@ const Admin = () => {
                         <option value="success" className="bg-gray-900">✓ Success</option>
                         <option value="failed" className="bg-gray-900">✗ Failed</option>
                         <option value="pending" className="bg-gray-900">⏳ Pending</option>
+                        <option value="retrying" className="bg-gray-900">↻ Retrying</option>
                     </select>
-                    <button onClick={fetchLeads} className="flex items-center gap-2 px-4 py-2 rounded-lg bg-white/5 hover:bg-white/10 transition-colors">
+                    <button onClick={() => fetchLeads()} className="flex items-center gap-2 px-4 py-2 rounded-lg bg-white/5 hover:bg-white/10 transition-colors">
                         <RefreshCw size={18} className={loading ? "animate-spin" : ""} /> Refresh
                     </button>
-                    <button className="flex items-center gap-2 px-4 py-2 rounded-lg bg-studio-gold text-black font-semibold hover:bg-yellow-600 transition-colors">
-                        <Download size={18} /> Export CSV
+                    <button
+                        onClick={handleExport}
+                        disabled={exporting}
+                        className="flex items-center gap-2 px-4 py-2 rounded-lg bg-studio-gold text-black font-semibold hover:bg-yellow-600 transition-colors disabled:opacity-50"
+                    >
+                        <Download size={18} /> {exporting ? 'Exporting...' : 'Export CSV'}
                     </button>
                 </div>
 
@@ -203,7 +382,9 @@ const Admin = () => {
                             className="flex items-center gap-2 px-4 py-1.5 rounded-lg bg-studio-gold text-black text-sm font-bold hover:bg-yellow-600 transition-colors disabled:opacity-50 disabled:cursor-not-allowed"
                         >
                             <Send size={14} />
-                            {bulkSending ? 'Sending...' : 'Resend Selected'}
+                            {bulkSending
+                                ? (bulkProgress ? `Sending ${bulkProgress.done}/${bulkProgress.total}...` : 'Sending...')
+                                : 'Resend Selected'}
                         </button>
                         <button
                             onClick={() => setSelectedIds(new Set())}
@@ -223,7 +404,7 @@ const Admin = () => {
                                     <th className="p-4 font-semibold w-10">
                                         <input
                                             type="checkbox"
-                                            checked={filteredLeads.length > 0 && selectedIds.size === filteredLeads.length}
+                                            checked={leads.length > 0 && selectedIds.size === leads.length}
                                             onChange={toggleSelectAll}
                                             className="w-4 h-4 rounded border-white/20 bg-white/5 accent-yellow-500 cursor-pointer"
                                         />
@@ -242,10 +423,10 @@ const Admin = () => {
                             <tbody className="divide-y divide-white/10 text-sm">
                                 {loading ? (
                                     <tr><td colSpan="10" className="p-8 text-center text-gray-500">Loading leads...</td></tr>
-                                ) : filteredLeads.length === 0 ? (
+                                ) : leads.length === 0 ? (
                                     <tr><td colSpan="10" className="p-8 text-center text-gray-500">No leads found matching your search.</td></tr>
                                 ) : (
-                                    filteredLeads.map(lead => (
+                                    leads.map(lead => (
                                         <tr key={lead.id} className={`hover:bg-white/5 transition-colors ${selectedIds.has(lead.id) ? 'bg-studio-gold/5' : ''}`}>
                                             <td className="p-4">
                                                 <input
@@ -322,8 +503,18 @@ const Admin = () => {
                         </table>
                     </div>
                     <div className="p-4 border-t border-white/10 text-xs text-gray-500 flex justify-between">
-                        <span>Showing {filteredLeads.length} leads</span>
-                        <span>Auto-refreshing every 5 mins</span>
+                        <span>Showing {leads.length} leads</span>
+                        {nextCursor ? (
+                            <button
+                                onClick={() => fetchLeads(true)}
+                                disabled={loadingMore}
+                                className="text-studio-gold hover:text-white transition-colors disabled:opacity-50"
+                            >
+                                {loadingMore ? 'Loading...' : 'Load more'}
+                            </button>
+                        ) : (
+                            <span>Auto-refreshing every 5 mins</span>
+                        )}
                     </div>
                 </div>
             </div>
@@ -0,0 +1,8 @@
+-- Persistent tier for the analysis result cache (ANALYSIS_CACHE_BACKEND=supabase)
+create table if not exists public.analysis_cache (
+    cache_key text primary key,
+    result jsonb not null,
+    created_at double precision not null
+);
+
+create index if not exists analysis_cache_created_at_idx on public.analysis_cache (created_at);
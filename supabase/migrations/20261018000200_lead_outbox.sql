@@ -0,0 +1,20 @@
+-- Durable outbox for CRM webhook and email delivery (drained by /api/outbox/drain)
+create table if not exists public.lead_outbox (
+    id bigint generated by default as identity primary key,
+    lead_id bigint not null references public.leads (id) on delete cascade,
+    kind text not null check (kind in ('webhook', 'email')),
+    payload jsonb not null,
+    status text not null default 'pending' check (status in ('pending', 'processing', 'done', 'dead')),
+    attempts integer not null default 0,
+    next_attempt_at timestamptz not null default now(),
+    locked_at timestamptz,
+    last_error text,
+    created_at timestamptz not null default now()
+);
+
+-- Drain scans only jobs that still need work
+create index if not exists lead_outbox_due_idx
+    on public.lead_outbox (next_attempt_at)
+    where status in ('pending', 'processing');
+
+create index if not exists lead_outbox_lead_id_idx on public.lead_outbox (lead_id);
@@ -0,0 +1,17 @@
+-- Batched write-back of webhook results used by /api/bulk_retry_webhook.
+-- updates: [{"id": 1, "webhook_status": "success", "webhook_response": "..."}, ...]
+create or replace function public.bulk_update_webhook_status(updates jsonb)
+returns integer
+language sql
+as $$
+    with changed as (
+        update public.leads as l
+        set webhook_sent = true,
+            webhook_status = u.webhook_status,
+            webhook_response = u.webhook_response
+        from jsonb_to_recordset(updates) as u(id bigint, webhook_status text, webhook_response text)
+        where l.id = u.id
+        returning 1
+    )
+    select count(*)::integer from changed;
+$$;
@@ -0,0 +1,48 @@
+-- Normalized dedupe keys for leads. Must match normalize_email/normalize_phone in api/lead_store.py.
+alter table public.leads
+    add column if not exists email_key text
+        generated always as (nullif(lower(btrim(email)), '')) stored,
+    add column if not exists phone_key text
+        generated always as (nullif(right(regexp_replace(coalesce(phone, ''), '\D', '', 'g'), 10), '')) stored;
+
+-- Leads that slipped in through the old select-then-insert race must be merged
+-- or removed before these indexes can be built. Find them with:
+--   select email_key, array_agg(id) from public.leads group by email_key having count(*) > 1;
+--   select phone_key, array_agg(id) from public.leads group by phone_key having count(*) > 1;
+create unique index if not exists leads_email_key_idx on public.leads (email_key) where email_key is not null;
+create unique index if not exists leads_phone_key_idx on public.leads (phone_key) where phone_key is not null;
+
+-- Insert a lead and its outbox jobs in one round trip.
+-- Returns {"id": <new id>, "duplicate": false}, or {"id": null, "duplicate": true}
+-- when the email or phone key already exists (nothing is written).
+create or replace function public.insert_lead(lead jsonb, jobs jsonb default '[]'::jsonb)
+returns jsonb
+language plpgsql
+as $$
+declare
+    new_id bigint;
+begin
+    insert into public.leads (
+        first_name, last_name, age, gender, email, phone, city, zip_code, campaign,
+        wants_assessment, score, category, analysis_json, image_url,
+        webhook_sent, webhook_status, webhook_response
+    )
+    select
+        r.first_name, r.last_name, r.age, r.gender, r.email, r.phone, r.city, r.zip_code, r.campaign,
+        r.wants_assessment, r.score, r.category, r.analysis_json, r.image_url,
+        coalesce(r.webhook_sent, false), r.webhook_status, r.webhook_response
+    from jsonb_populate_record(null::public.leads, lead) as r
+    on conflict do nothing
+    returning id into new_id;
+
+    if new_id is null then
+        return jsonb_build_object('id', null, 'duplicate', true);
+    end if;
+
+    insert into public.lead_outbox (lead_id, kind, payload)
+    select new_id, j ->> 'kind', j -> 'payload'
+    from jsonb_array_elements(coalesce(jobs, '[]'::jsonb)) as j;
+
+    return jsonb_build_object('id', new_id, 'duplicate', false);
+end;
+$$;
@@ -0,0 +1,14 @@
+-- Indexes behind /api/leads keyset pagination (newest first on created_at, id).
+-- Each page is a range scan starting at the cursor instead of a full sort of leads.
+create index if not exists leads_created_at_id_idx
+    on public.leads (created_at desc, id desc);
+
+-- Filtered views (status tabs, per-campaign lists) keep the same ordering
+create index if not exists leads_webhook_status_created_at_idx
+    on public.leads (webhook_status, created_at desc, id desc);
+
+create index if not exists leads_campaign_created_at_idx
+    on public.leads (campaign, created_at desc, id desc);
+
+-- Score filters are usually combined with a date range; the created_at index
+-- narrows those first, so score gets no index of its own.
@@ -0,0 +1,24 @@
+-- Change tracking for /api/leads/changes: updated_at moves on every write to a lead
+alter table public.leads
+    add column if not exists updated_at timestamptz not null default now();
+
+-- Existing rows: last known change is their creation
+update public.leads set updated_at = created_at where created_at is not null;
+
+create or replace function public.set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at = now();
+    return new;
+end;
+$$;
+
+drop trigger if exists leads_set_updated_at on public.leads;
+create trigger leads_set_updated_at
+    before update on public.leads
+    for each row execute function public.set_updated_at();
+
+-- The change feed is a keyset scan in (updated_at, id) order
+create index if not exists leads_updated_at_id_idx on public.leads (updated_at, id);
@@ -0,0 +1,72 @@
+-- Incrementally maintained lead counts behind /api/stats.
+-- One row per (dimension, bucket); triggers on leads keep them current, so
+-- reading the summary never scans leads.
+create table if not exists public.lead_stats (
+    dimension text not null check (dimension in ('total', 'webhook_status', 'campaign', 'category', 'day', 'score_bucket')),
+    bucket text not null,
+    lead_count bigint not null default 0,
+    primary key (dimension, bucket)
+);
+
+-- Score histogram buckets of 10 points: '0-9' ... '90-99', '100'
+create or replace function public.lead_score_bucket(score numeric)
+returns text
+language sql
+immutable
+as $$
+    select case
+        when score is null then 'unknown'
+        when score >= 100 then '100'
+        when score < 0 then '0-9'
+        else (floor(score / 10) * 10)::int || '-' || (floor(score / 10) * 10 + 9)::int
+    end;
+$$;
+
+create or replace function public.lead_stats_add(lead public.leads, delta integer)
+returns void
+language sql
+as $$
+    insert into public.lead_stats as s (dimension, bucket, lead_count)
+    values
+        ('total', 'all', delta),
+        ('webhook_status', coalesce(lead.webhook_status, 'unknown'), delta),
+        ('campaign', coalesce(nullif(lead.campaign, ''), 'none'), delta),
+        ('category', coalesce(nullif(lead.category, ''), 'Unknown'), delta),
+        ('day', coalesce((lead.created_at at time zone 'utc')::date::text, 'unknown'), delta),
+        ('score_bucket', public.lead_score_bucket(lead.score::numeric), delta)
+    on conflict (dimension, bucket) do update set lead_count = s.lead_count + excluded.lead_count;
+$$;
+
+create or replace function public.lead_stats_trigger()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        -- Most updates (e.g. webhook_response, updated_at) don't move any counter
+        if tg_op = 'UPDATE'
+            and new.webhook_status is not distinct from old.webhook_status
+            and new.campaign is not distinct from old.campaign
+            and new.category is not distinct from old.category
+            and new.score is not distinct from old.score
+            and new.created_at is not distinct from old.created_at then
+            return new;
+        end if;
+        perform public.lead_stats_add(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.lead_stats_add(new, 1);
+        return new;
+    end if;
+    return old;
+end;
+$$;
+
+drop trigger if exists leads_maintain_stats on public.leads;
+create trigger leads_maintain_stats
+    after insert or update or delete on public.leads
+    for each row execute function public.lead_stats_trigger();
+
+-- Backfill from existing leads (one scan, at migration time only)
+truncate public.lead_stats;
+select public.lead_stats_add(l, 1) from public.leads as l;
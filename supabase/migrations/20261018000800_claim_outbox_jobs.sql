@@ -0,0 +1,28 @@
+-- Atomic claim for outbox.drain(): candidate rows are locked with SKIP LOCKED
+-- and flipped to "processing" in the same statement, so two concurrent drains
+-- never pick up the same job (stale "processing" rows included).
+create or replace function public.claim_outbox_jobs(
+    max_jobs integer,
+    lock_timeout_seconds double precision,
+    only_lead bigint default null,
+    only_kinds text[] default null
+)
+returns setof public.lead_outbox
+language sql
+as $$
+    update public.lead_outbox
+    set status = 'processing',
+        locked_at = now()
+    where id in (
+        select id
+        from public.lead_outbox
+        where ((status = 'pending' and next_attempt_at <= now())
+               or (status = 'processing' and locked_at < now() - make_interval(secs => lock_timeout_seconds)))
+          and (only_lead is null or lead_id = only_lead)
+          and (only_kinds is null or kind = any(only_kinds))
+        order by next_attempt_at
+        limit max_jobs
+        for update skip locked
+    )
+    returning *;
+$$;
@@ -0,0 +1,7 @@
+-- Private bucket for images staged by /api/analyze. /api/lead copies an image
+-- into the public lead-images bucket only once it accepts the lead, so photos
+-- of visitors who never submit are never publicly reachable. No storage
+-- policies: only the backend's service role key can read or write it.
+insert into storage.buckets (id, name, public)
+values ('lead-staging', 'lead-staging', false)
+on conflict (id) do update set public = false;
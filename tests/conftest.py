@@ -0,0 +1,7 @@
+import os
+import sys
+
+# api/ modules import each other as top-level modules (see api/index.py)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'api'))
+# FakeSupabase (benchmarks/local_services.py) stands in for the database
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
@@ -0,0 +1,114 @@
+import email
+import socket
+import time
+
+import pytest
+from aiosmtpd.controller import Controller
+
+import email_utils
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(email.message_from_bytes(envelope.content))
+        return '250 OK'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(autouse=True)
+def no_smtp_auth(monkeypatch):
+    # The local stand-in doesn't offer AUTH
+    monkeypatch.setenv('SMTP_USERNAME', '')
+    monkeypatch.setenv('SMTP_PASSWORD', '')
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname='127.0.0.1', port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+
+def make_mailer(controller):
+    return email_utils.SMTPMailer(server=controller.hostname, port=controller.port, starttls=False, timeout=5)
+
+
+def lead(n):
+    return {'first_name': f'Lead{n}', 'last_name': 'Test', 'email': f'lead{n}@example.com', 'campaign': '#DALFB33F'}
+
+
+def test_one_email_per_lead_over_one_session(smtp_server):
+    controller, handler = smtp_server
+    mailer = make_mailer(controller)
+    dispatcher = email_utils.EmailDispatcher(mailer, digest_size=1, max_wait=5)
+
+    futures = [dispatcher.submit(lead(n)) for n in range(3)]
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert len(handler.messages) == 3
+    assert handler.messages[0]['Subject'] == 'Lead0 Test - #DALFB3'
+    assert mailer.counters['connects'] == 1
+    mailer.close()
+
+
+def test_digest_batches_up_to_digest_size(smtp_server):
+    controller, handler = smtp_server
+    mailer = make_mailer(controller)
+    dispatcher = email_utils.EmailDispatcher(mailer, digest_size=3, max_wait=30)
+
+    futures = [dispatcher.submit(lead(n)) for n in range(3)]
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert len(handler.messages) == 1
+    assert handler.messages[0]['Subject'].startswith('3 New Leads - Lead0 Test')
+    mailer.close()
+
+
+def test_partial_digest_is_sent_after_max_wait(smtp_server):
+    controller, handler = smtp_server
+    mailer = make_mailer(controller)
+    dispatcher = email_utils.EmailDispatcher(mailer, digest_size=5, max_wait=0.3)
+
+    started = time.monotonic()
+    futures = [dispatcher.submit(lead(n)) for n in range(2)]
+
+    assert all(future.result(timeout=5) for future in futures)
+    assert time.monotonic() - started >= 0.3
+    assert len(handler.messages) == 1
+    assert handler.messages[0]['Subject'].startswith('2 New Leads')
+    mailer.close()
+
+
+def test_reconnects_after_server_restart():
+    handler = RecordingHandler()
+    port = free_port()
+    controller = Controller(handler, hostname='127.0.0.1', port=port)
+    controller.start()
+    mailer = make_mailer(controller)
+    try:
+        assert mailer.send(email_utils.build_lead_message(lead(1)))
+    finally:
+        controller.stop()
+
+    restarted = Controller(handler, hostname='127.0.0.1', port=port)
+    restarted.start()
+    try:
+        # The pooled session died with the old server; send must reconnect once and deliver
+        assert mailer.send(email_utils.build_lead_message(lead(2)))
+    finally:
+        mailer.close()
+        restarted.stop()
+
+    assert len(handler.messages) == 2
+    assert mailer.counters['connects'] == 2
+    assert mailer.counters['reconnects'] == 1
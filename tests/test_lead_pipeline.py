@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+import pytest
+
+import lead_pipeline
+from lead_pipeline import DuplicateLead, Stage, StageFailed, run_stages
+
+
+class Cleanups:
+    def __init__(self):
+        self.calls = []
+
+    def for_stage(self, name):
+        async def cleanup(result, error):
+            self.calls.append((name, result, error))
+        return cleanup
+
+
+def lead_stages(cleanups, persist):
+    async def upload(_):
+        return True
+
+    return [
+        Stage('persist', persist, timeout=0.05, cleanup=cleanups.for_stage('persist')),
+        Stage('upload', upload, timeout=0.05, cleanup=cleanups.for_stage('upload')),
+    ]
+
+
+def test_success_runs_no_cleanup():
+    cleanups = Cleanups()
+
+    async def persist(_):
+        return 42
+
+    results = asyncio.run(run_stages(lead_stages(cleanups, persist)))
+
+    assert results == {'persist': 42, 'upload': True}
+    assert cleanups.calls == []
+
+
+def test_duplicate_cleans_up_the_upload():
+    cleanups = Cleanups()
+
+    async def persist(_):
+        raise DuplicateLead("email or phone already submitted")
+
+    with pytest.raises(StageFailed) as failed:
+        asyncio.run(run_stages(lead_stages(cleanups, persist)))
+
+    assert failed.value.stage == 'persist'
+    [(stage, result, error)] = cleanups.calls
+    assert (stage, result) == ('upload', True)
+    assert isinstance(error, DuplicateLead)
+    assert lead_pipeline.write_rejected(error)
+
+
+def test_timeout_is_not_a_rejected_write():
+    cleanups = Cleanups()
+
+    async def persist(_):
+        await asyncio.sleep(1)
+
+    with pytest.raises(StageFailed) as failed:
+        asyncio.run(run_stages(lead_stages(cleanups, persist)))
+
+    assert isinstance(failed.value.error, TimeoutError)
+    [(stage, _, error)] = cleanups.calls
+    assert stage == 'upload'
+    assert not lead_pipeline.write_rejected(error)
+
+
+def test_dependent_stage_is_skipped_and_not_reported():
+    cleanups = Cleanups()
+    ran = []
+
+    async def persist(_):
+        raise DuplicateLead("email or phone already submitted")
+
+    async def notify(inputs):
+        ran.append(inputs)
+
+    stages = lead_stages(cleanups, persist) + [Stage('notify', notify, after=['persist'])]
+    with pytest.raises(StageFailed) as failed:
+        asyncio.run(run_stages(stages))
+
+    assert failed.value.stage == 'persist'
+    assert ran == []
+
+
+def test_write_rejected_only_for_definite_non_writes():
+    from postgrest.exceptions import APIError
+
+    assert lead_pipeline.write_rejected(APIError({'code': '23514', 'message': 'check violation'}))
+    assert lead_pipeline.write_rejected(APIError({'code': 413, 'message': 'JSON could not be generated'}))
+    assert not lead_pipeline.write_rejected(APIError({'code': 504, 'message': 'JSON could not be generated'}))
+    assert not lead_pipeline.write_rejected(httpx.ReadTimeout('timed out'))
+    assert not lead_pipeline.write_rejected(httpx.ConnectError('reset'))
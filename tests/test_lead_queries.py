@@ -0,0 +1,102 @@
+import pytest
+
+import lead_queries
+from lead_queries import LeadFilters
+from local_services import FakeSupabase
+
+
+@pytest.fixture
+def db():
+    return FakeSupabase()
+
+
+def add_lead(db, created_at, **fields):
+    return db._store('leads', {'created_at': created_at, 'first_name': 'Ada', 'last_name': 'Lovelace',
+                               'email': 'ada@example.com', 'webhook_status': 'success', **fields})
+
+
+def all_pages(db, filters, limit):
+    seen, cursor = [], None
+    while True:
+        rows, cursor = lead_queries.fetch_page(db, filters, limit=limit, cursor=cursor, columns='id,created_at')
+        seen.extend(row['id'] for row in rows)
+        if cursor is None:
+            return seen
+
+
+def test_fetch_page_walks_every_lead_newest_first(db):
+    # Ties on created_at are broken by id, so no row is skipped or repeated at page edges
+    stamps = ['2026-01-01T00:00:00+00:00'] * 3 + ['2026-01-02T00:00:00+00:00'] * 2 + ['2026-01-03T00:00:00+00:00']
+    ids = [add_lead(db, stamp)['id'] for stamp in stamps]
+
+    assert all_pages(db, LeadFilters(), limit=2) == [6, 5, 4, 3, 2, 1]
+    assert all_pages(db, LeadFilters(), limit=len(ids)) == [6, 5, 4, 3, 2, 1]
+
+
+def test_fetch_page_cursor_respects_filters(db):
+    for day in range(1, 6):
+        add_lead(db, f'2026-01-0{day}T00:00:00+00:00', webhook_status='failed' if day % 2 else 'success')
+
+    assert all_pages(db, LeadFilters(status='failed'), limit=1) == [5, 3, 1]
+
+
+def test_fetch_page_rejects_a_bad_cursor(db):
+    with pytest.raises(lead_queries.InvalidCursor):
+        lead_queries.fetch_page(db, LeadFilters(), cursor='not-a-cursor')
+
+
+def touch(db, lead_id, updated_at):
+    # FakeSupabase stamps updated_at itself; pin it to make the order deterministic
+    next(row for row in db.tables['leads'] if row['id'] == lead_id)['updated_at'] = updated_at
+
+
+def test_fetch_changes_pages_in_change_order(db):
+    for lead_id, stamp in enumerate(['2026-01-02T00:00:00+00:00', '2026-01-01T00:00:00+00:00',
+                                     '2026-01-01T00:00:00+00:00'], 1):
+        add_lead(db, stamp)
+        touch(db, lead_id, stamp)
+    cursor = lead_queries._encode_position('2000-01-01T00:00:00+00:00', 0)
+
+    rows, cursor, has_more = lead_queries.fetch_changes(db, cursor, limit=2, columns='id,updated_at')
+    assert ([row['id'] for row in rows], has_more) == ([2, 3], True)
+
+    rows, cursor, has_more = lead_queries.fetch_changes(db, cursor, limit=2, columns='id,updated_at')
+    assert ([row['id'] for row in rows], has_more) == ([1], False)
+
+
+def test_fetch_changes_picks_up_later_updates(db):
+    lead = add_lead(db, '2026-01-01T00:00:00+00:00')
+    touch(db, lead['id'], '2026-01-01T00:00:00+00:00')
+    rows, cursor, _ = lead_queries.fetch_changes(db, lead_queries._encode_position('2000-01-01T00:00:00+00:00', 0))
+    assert [row['id'] for row in rows] == [lead['id']]
+
+    # Caught up: the next poll starts from now minus the overlap window
+    rows, cursor, _ = lead_queries.fetch_changes(db, cursor)
+    assert rows == []
+
+    db.table('leads').update({'webhook_status': 'failed'}).eq('id', lead['id']).execute()
+    rows, _, _ = lead_queries.fetch_changes(db, cursor)
+    assert [(row['id'], row['webhook_status']) for row in rows] == [(lead['id'], 'failed')]
+
+
+@pytest.mark.parametrize('value, cell', [
+    (None, ''),
+    (42, '42'),
+    ({'primary': 'Editorial'}, '{"primary": "Editorial"}'),
+    ('=HYPERLINK("http://x")', '\'=HYPERLINK("http://x")'),
+    ('@SUM(A1)', "'@SUM(A1)"),
+    ('-2+3', "'-2+3"),
+    ('+1 (555) 010-2030', '+1 (555) 010-2030'),
+    ('-5', '-5'),
+    ('Ada', 'Ada'),
+])
+def test_csv_cell(value, cell):
+    assert lead_queries._csv_cell(value) == cell
+
+
+def test_stream_csv_neutralises_formulas_in_every_row():
+    rows = [{'first_name': '=1+1', 'phone': '+1 555 0100'}, {'first_name': 'Ada', 'phone': None}]
+
+    text = ''.join(lead_queries.stream_csv(rows, ['first_name', 'phone']))
+
+    assert text.splitlines() == ['first_name,phone', "'=1+1,+1 555 0100", 'Ada,']
@@ -0,0 +1,115 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import outbox
+from local_services import FakeSupabase
+
+PAST = '2000-01-01T00:00:00+00:00'
+FUTURE = '2999-01-01T00:00:00+00:00'
+
+
+@pytest.fixture
+def db():
+    return FakeSupabase()
+
+
+def add_job(db, status='pending', attempts=0, next_attempt_at=PAST, locked_at=None):
+    lead = db._store('leads', {'webhook_status': 'pending'})
+    return db._store('lead_outbox', {
+        'lead_id': lead['id'], 'kind': outbox.KIND_WEBHOOK, 'payload': {'lead': lead['id']},
+        'status': status, 'attempts': attempts, 'next_attempt_at': next_attempt_at,
+        'locked_at': locked_at, 'last_error': None,
+    })
+
+
+def row(db, table, row_id):
+    return next(r for r in db.tables[table] if r['id'] == row_id)
+
+
+def without_claim_rpc(db, monkeypatch):
+    # Undeployed migration: the fake answers PGRST202 and claims fall back to optimistic updates
+    monkeypatch.setattr(db, 'rpc', lambda name, params: FakeSupabase.rpc(db, f'undeployed_{name}', params))
+
+
+def test_claim_takes_each_due_job_once(db):
+    due = [add_job(db)['id'] for _ in range(3)]
+    add_job(db, next_attempt_at=FUTURE)
+
+    claimed = outbox.claim_due_jobs(db, limit=10)
+
+    assert sorted(job['id'] for job in claimed) == due
+    assert all(row(db, 'lead_outbox', job_id)['status'] == 'processing' for job_id in due)
+    assert outbox.claim_due_jobs(db, limit=10) == []
+
+
+def test_claim_reclaims_only_stale_processing_jobs(db):
+    stale = add_job(db, status='processing', locked_at=PAST)
+    add_job(db, status='processing', locked_at=datetime.now(timezone.utc).isoformat())
+
+    assert [job['id'] for job in outbox.claim_due_jobs(db)] == [stale['id']]
+
+
+def test_fallback_claim_loses_the_race_for_a_stale_job(db, monkeypatch):
+    without_claim_rpc(db, monkeypatch)
+    stale = add_job(db, status='processing', locked_at=PAST)
+    # Two drains read the same stale row before either claims it
+    first_view, second_view = dict(stale), dict(stale)
+
+    assert outbox._claim(db, first_view)
+    assert not outbox._claim(db, second_view)
+
+
+def test_fallback_claim_filters_by_lead(db, monkeypatch):
+    without_claim_rpc(db, monkeypatch)
+    add_job(db)
+    wanted = add_job(db)
+
+    assert [job['id'] for job in outbox.claim_due_jobs(db, lead_id=wanted['lead_id'])] == [wanted['id']]
+
+
+def test_record_result_success(db):
+    job = add_job(db, status='processing', locked_at=PAST)
+
+    assert outbox._record_result(db, job, True, 'ok') == 'done'
+    assert row(db, 'lead_outbox', job['id'])['attempts'] == 1
+    assert row(db, 'leads', job['lead_id'])['webhook_status'] == 'success'
+
+
+def test_record_result_failure_backs_off(db):
+    job = add_job(db, status='processing', locked_at=PAST)
+
+    assert outbox._record_result(db, job, False, 'HTTP 500') == 'pending'
+    stored = row(db, 'lead_outbox', job['id'])
+    assert stored['locked_at'] is None
+    assert stored['next_attempt_at'] > datetime.now(timezone.utc).isoformat()
+    assert row(db, 'leads', job['lead_id'])['webhook_status'] == 'retrying'
+
+
+def test_record_result_last_attempt_is_dead(db):
+    job = add_job(db, status='processing', attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1, locked_at=PAST)
+
+    assert outbox._record_result(db, job, False, 'HTTP 500') == 'dead'
+    assert row(db, 'leads', job['lead_id'])['webhook_status'] == 'failed'
+
+
+def test_drain_records_every_delivery(db, monkeypatch):
+    monkeypatch.setattr(outbox, '_deliver', lambda job: (job['lead_id'] % 2 == 1, 'response'))
+    jobs = [add_job(db) for _ in range(4)]
+
+    summary = outbox.drain(db)
+
+    assert summary['claimed'] == 4
+    assert (summary['done'], summary['retrying']) == (2, 2)
+    assert [row(db, 'lead_outbox', job['id'])['status'] for job in jobs] == ['done', 'pending', 'done', 'pending']
+
+
+def test_drain_releases_jobs_it_has_no_time_for(db, monkeypatch):
+    monkeypatch.setattr(outbox, '_deliver', lambda job: pytest.fail("delivered past the budget"))
+    job = add_job(db)
+
+    summary = outbox.drain(db, budget=0)
+
+    assert summary['released'] == 1
+    stored = row(db, 'lead_outbox', job['id'])
+    assert (stored['status'], stored['attempts'], stored['locked_at']) == ('pending', 0, None)